@@ -15,16 +15,155 @@
 from oslo.config import cfg
 
 pluribus_plugin_opts = [
-    cfg.StrOpt(
+    cfg.ListOpt(
         'pn_switch',
-        default='',
-        help='Pluribus Switch to connect to'),
+        default=[],
+        help='Pluribus Switch to connect to, or the list of the switches '
+             'of a fabric given as host or host:port'),
     cfg.IntOpt(
         'pn_port',
         default=25000,
         help='Pluribus Port to connect to'),
     cfg.StrOpt(
         'pn_api',
-        help='The wrapper class to send RPC requests')]
+        help='The wrapper class to send RPC requests'),
+    cfg.StrOpt(
+        'pn_placement',
+        default='hash',
+        help='How requests are spread over a fabric of several switches: '
+             '"hash" sends the requests of a network or a router to one '
+             'switch picked by consistent hashing, "broadcast" sends '
+             'every request to every switch'),
+    cfg.IntOpt(
+        'pn_pool_size',
+        default=4,
+        help='Maximum number of connections to the Pluribus switch shared '
+             'by the ML2, L3 and LBaaS plugins of a neutron-server process'),
+    cfg.IntOpt(
+        'pn_idle_timeout',
+        default=300,
+        help='Number of seconds after which an unused connection to the '
+             'Pluribus switch is closed'),
+    cfg.IntOpt(
+        'pn_keepalive_interval',
+        default=30,
+        help='Number of seconds between health checks of idle connections '
+             'to the Pluribus switch. 0 disables them'),
+    cfg.BoolOpt(
+        'async_dispatch',
+        default=False,
+        help='Send switch operations from a background worker pool '
+             'instead of blocking the API request'),
+    cfg.IntOpt(
+        'dispatch_workers',
+        default=8,
+        help='Maximum number of concurrent switch operations when '
+             'async_dispatch or async_routers is enabled'),
+    cfg.BoolOpt(
+        'async_routers',
+        default=False,
+        help='Create, update and delete routers on the switch from a '
+             'background worker pool, routers stay in a PENDING status '
+             'until the switch has answered'),
+    cfg.FloatOpt(
+        'port_update_window',
+        default=0,
+        help='Number of seconds during which updates to the same port are '
+             'collapsed into a single switch request. 0 disables it'),
+    cfg.BoolOpt(
+        'sync_on_startup',
+        default=False,
+        help='Reconcile the switch with the Neutron database when '
+             'neutron-server starts'),
+    cfg.IntOpt(
+        'sync_batch_size',
+        default=100,
+        help='Number of switch requests sent per batch while reconciling'),
+    cfg.IntOpt(
+        'sync_rate',
+        default=500,
+        help='Maximum number of switch requests per second while '
+             'reconciling. 0 disables the limit'),
+    cfg.BoolOpt(
+        'enable_journal',
+        default=False,
+        help='Journal switch requests that cannot be delivered and '
+             'replay them once the switch is reachable again'),
+    cfg.StrOpt(
+        'journal_path',
+        default='$state_path/pluribus_journal.db',
+        help='SQLite file holding the journal of pending switch requests'),
+    cfg.IntOpt(
+        'journal_batch_size',
+        default=500,
+        help='Number of journaled requests compacted and replayed at a '
+             'time'),
+    cfg.IntOpt(
+        'journal_replay_interval',
+        default=10,
+        help='Number of seconds between attempts to replay the journal'),
+    cfg.IntOpt(
+        'journal_max_attempts',
+        default=10,
+        help='Number of failed replays after which a journaled request is '
+             'dropped'),
+    cfg.IntOpt(
+        'breaker_failure_threshold',
+        default=3,
+        help='Number of consecutive failed switch requests after which '
+             'requests stop being sent to the switch'),
+    cfg.IntOpt(
+        'breaker_reset_timeout',
+        default=30,
+        help='Number of seconds to wait before probing the switch again '
+             'once requests were stopped'),
+    cfg.IntOpt(
+        'topology_cache_size',
+        default=10000,
+        help='Maximum number of ports, subnets and router gateways the L3 '
+             'plugin keeps in memory. 0 disables the cache'),
+    cfg.IntOpt(
+        'topology_cache_ttl',
+        default=5,
+        help='Number of seconds after which the L3 plugin reads a cached '
+             'port, subnet or router gateway from the database again. 0 '
+             'keeps them until they are changed by this process'),
+    cfg.IntOpt(
+        'port_update_report_interval',
+        default=600,
+        help='Number of seconds between log reports of the port updates '
+             'the L3 plugin sent to the switch and skipped as redundant. '
+             '0 disables the reports'),
+    cfg.IntOpt(
+        'stats_poll_interval',
+        default=10,
+        help='Number of seconds between polls of the statistics of all '
+             'load balancer pools. 0 only polls when statistics are asked '
+             'for'),
+    cfg.IntOpt(
+        'stats_ttl',
+        default=30,
+        help='Number of seconds the statistics of a load balancer pool '
+             'are served from memory before they are polled again'),
+    cfg.FloatOpt(
+        'lb_graph_window',
+        default=0,
+        help='Number of seconds during which changes to a load balancer '
+             'pool, its VIP, members and health monitors are collected '
+             'and applied on the switch as one transaction. 0 sends every '
+             'change on its own'),
+    cfg.IntOpt(
+        'member_health_interval',
+        default=10,
+        help='Number of seconds between polls of the health of all load '
+             'balancer members when the switch does not send health '
+             'events, or else between checks of the health event '
+             'subscription. 0 leaves member statuses as the driver sets '
+             'them'),
+    cfg.FloatOpt(
+        'member_health_window',
+        default=2,
+        help='Number of seconds during which member health changes are '
+             'collected before they are written to the database')]
 
 cfg.CONF.register_opts(pluribus_plugin_opts, "PLURIBUS_PLUGINS")
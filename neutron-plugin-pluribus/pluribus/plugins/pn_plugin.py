@@ -13,8 +13,122 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+from neutron import manager
+from neutron.common import constants as const
+from neutron.i18n import _LE
+from neutron.openstack.common import log as logging
+from neutron.plugins.common import constants
 from neutron.plugins.ml2 import plugin
+
+LOG = logging.getLogger(__name__)
+
+
 class PluribusGenericPlugin(plugin.Ml2Plugin):
 
     def __init__(self):
         super(PluribusGenericPlugin, self).__init__()
+
+    def _pluribus_driver(self):
+        for driver in self.mechanism_manager.ordered_mech_drivers:
+            if hasattr(driver.obj, 'port_batch'):
+                return driver.obj
+        return None
+
+    def create_port_bulk(self, context, ports):
+        """Create the ports in the database and then on the switch with a
+        single request. Ports the switch fails to create are deleted again,
+        the others are kept and returned.
+        """
+        driver = self._pluribus_driver()
+        if driver is None:
+            return super(PluribusGenericPlugin, self).create_port_bulk(
+                context, ports)
+
+        with driver.port_batch() as batch:
+            created = super(PluribusGenericPlugin, self).create_port_bulk(
+                context, ports)
+
+        failed = driver.create_ports(batch.created)
+        if failed:
+            # the switch never had these ports, keep their deletion local
+            with driver.port_batch():
+                for port_id, error in failed.items():
+                    LOG.error(_LE("Pluribus failed to create port %(id)s: "
+                                  "%(error)s, rolling back"),
+                              {'id': port_id, 'error': error})
+                    self.delete_port(context, port_id)
+
+        return [port for port in created if port['id'] not in failed]
+
+    def delete_port_bulk(self, context, port_ids):
+        """Delete the ports from the database and then from the switch with
+        a single request.
+
+        Returns a dict mapping the id of every port the switch failed to
+        delete to the error it reported.
+        """
+        driver = self._pluribus_driver()
+        if driver is None:
+            for port_id in port_ids:
+                self.delete_port(context, port_id)
+            return {}
+
+        with driver.port_batch() as batch:
+            for port_id in port_ids:
+                self.delete_port(context, port_id)
+
+        failed = driver.delete_ports(batch.deleted)
+        for port_id, error in failed.items():
+            LOG.error(_LE("Pluribus failed to delete port %(id)s: %(error)s"),
+                      {'id': port_id, 'error': error})
+        return failed
+
+    def delete_network(self, context, id):
+        """Delete the network and whatever ml2 deletes along with it with
+        a single cascaded request to the switch.
+        """
+        driver = self._pluribus_driver()
+        if driver is None:
+            return super(PluribusGenericPlugin, self).delete_network(context,
+                                                                     id)
+
+        with driver.cascade(network_id=id):
+            super(PluribusGenericPlugin, self).delete_network(context, id)
+
+    def purge_tenant(self, context, tenant_id):
+        """Delete every port, subnet and network of a tenant.
+
+        The router interfaces of the tenant are removed through the L3
+        plugin, the switch gets a single cascaded request for the rest.
+        """
+        driver = self._pluribus_driver()
+        if driver is None:
+            self._purge_tenant(context, tenant_id)
+            return
+
+        with driver.cascade(tenant_id=tenant_id):
+            self._purge_tenant(context, tenant_id)
+
+    def _purge_tenant(self, context, tenant_id):
+        filters = {'tenant_id': [tenant_id]}
+        l3_plugin = manager.NeutronManager.get_service_plugins().get(
+            constants.L3_ROUTER_NAT)
+        for port in self.get_ports(context, filters=filters,
+                                   fields=['id', 'device_id',
+                                           'device_owner']):
+            if (l3_plugin is not None and
+                    port['device_owner'] == const.DEVICE_OWNER_ROUTER_INTF):
+                # delete_port refuses to delete a router's port, detach it
+                # from the router, which deletes it
+                l3_plugin.remove_router_interface(
+                    context, port['device_id'], {'port_id': port['id']})
+            else:
+                self.delete_port(context, port['id'])
+        for subnet in self.get_subnets(context, filters=filters,
+                                       fields=['id']):
+            self.delete_subnet(context, subnet['id'])
+        # not self.delete_network, the tenant cascade covers the networks
+        for network in self.get_networks(context, filters=filters,
+                                         fields=['id']):
+            super(PluribusGenericPlugin, self).delete_network(context,
+                                                              network['id'])
@@ -24,7 +24,9 @@ setuptools.setup(
     long_description=open("README.rst").read(),
     name='neutron-plugin-pluribus',
     entry_points={
-        'console_scripts': []},
+        'console_scripts': [
+            'neutron-pluribus-sync = '
+            'neutron.plugins.ml2.drivers.pluribus.sync:main']},
     packages=setuptools.find_packages(
         exclude=['*.tests','*.tests.*','tests.*','tests']),
     url='http://www.pluribusnetworks.com',
@@ -0,0 +1,206 @@
+# COPYRIGHT 2015 Pluribus Networks Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import inspect
+import time
+
+from eventlet import semaphore
+from oslo.config import cfg
+from oslo.utils import importutils
+
+from neutron.i18n import _LW
+from neutron.openstack.common import log as logging
+from neutron.openstack.common import loopingcall
+from neutron.plugins.ml2.drivers.pluribus import config  # noqa
+from neutron.plugins.ml2.drivers.pluribus import fabric
+
+LOG = logging.getLogger(__name__)
+
+_clients = {}
+
+
+def get_client():
+    """Return the client shared by every Pluribus plugin in this process.
+
+    With more than one switch in pn_switch this is a FabricClient over
+    one pooled client per switch.
+    """
+    conf = cfg.CONF.PLURIBUS_PLUGINS
+    key = (conf.pn_api, tuple(conf.pn_switch), conf.pn_port,
+           conf.pn_placement)
+    if key not in _clients:
+        if len(conf.pn_switch) > 1:
+            nodes = {}
+            for node in conf.pn_switch:
+                nodes[node] = _new_client(conf, _address(node, conf.pn_port))
+            _clients[key] = fabric.FabricClient(nodes, conf.pn_placement)
+        else:
+            _clients[key] = _new_client(conf)
+    return _clients[key]
+
+
+def _address(node, default_port):
+    # fabric nodes are given as host or host:port
+    host, sep, port = node.partition(':')
+    if not sep or ':' in port:
+        return {'pn_switch': node, 'pn_port': default_port}
+    return {'pn_switch': host, 'pn_port': int(port)}
+
+
+def _new_client(conf, api_kwargs=None):
+    return PluribusClient(conf.pn_api,
+                          conf.pn_pool_size,
+                          conf.pn_idle_timeout,
+                          conf.pn_keepalive_interval,
+                          api_kwargs)
+
+
+class _Connection(object):
+
+    def __init__(self, api):
+        self.api = api
+        self.last_used = time.time()
+
+
+class PluribusClient(object):
+
+    """Stand-in for the pn_api class backed by a pool of its instances.
+
+    Each pn_api object holds its own connection to the switch; calling
+    client.create_network(**network) borrows one from the pool for the
+    duration of the call, so at most pool_size requests are in flight at
+    any time. Idle connections are pinged every keepalive_interval
+    seconds when the pn_api class supports it and closed after
+    idle_timeout seconds. A connection whose call raised is dropped
+    rather than reused. api_kwargs are passed to the pn_api class when
+    it is instantiated.
+    """
+
+    def __init__(self, api_class, pool_size, idle_timeout,
+                 keepalive_interval, api_kwargs=None):
+        self._api_class = api_class
+        self._api_kwargs = api_kwargs or {}
+        self._idle_timeout = idle_timeout
+        self._keepalive_interval = keepalive_interval
+        self._pool_size = pool_size
+        self._slots = semaphore.Semaphore(pool_size)
+        self._idle = collections.deque()
+        self._keepalive_task = None
+
+    def supports(self, method):
+        """Tell whether the pn_api class implements method."""
+        api_class = importutils.import_class(self._api_class)
+        return callable(getattr(api_class, method, None))
+
+    def accepts(self, method):
+        """Return the keyword arguments method of the pn_api class takes
+        and those it requires, or None when it takes any.
+        """
+        api_class = importutils.import_class(self._api_class)
+        try:
+            args, _, keywords, defaults = inspect.getargspec(
+                getattr(api_class, method))
+        except TypeError:
+            # not a python function, nothing to go by
+            return None
+        if keywords is not None:
+            return None
+        args = args[1:]
+        return args, args[:len(args) - len(defaults or ())]
+
+    def connect(self):
+        """Return a pn_api object of its own, outside of the pool, for
+        long lived uses like event subscriptions. The caller closes it.
+        """
+        LOG.debug("Opening a dedicated connection to the Pluribus switch")
+        return importutils.import_object(self._api_class, **self._api_kwargs)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        def call(*args, **kwargs):
+            return self._call(name, args, kwargs)
+        call.__name__ = name
+        return call
+
+    def _call(self, name, args, kwargs):
+        with self._slots:
+            conn = self._checkout()
+            try:
+                result = getattr(conn.api, name)(*args, **kwargs)
+            except Exception:
+                self._close(conn)
+                raise
+            conn.last_used = time.time()
+            self._idle.append(conn)
+            self._trim()
+            return result
+
+    def _checkout(self):
+        self._expire(time.time())
+        if self._idle:
+            # most recently used first, the others can time out
+            return self._idle.pop()
+
+        LOG.debug("Opening a new connection to the Pluribus switch")
+        conn = _Connection(importutils.import_object(self._api_class,
+                                                     **self._api_kwargs))
+        if (self._keepalive_task is None and self._keepalive_interval > 0 and
+                hasattr(conn.api, 'ping')):
+            self._keepalive_task = loopingcall.FixedIntervalLoopingCall(
+                self._keepalive)
+            self._keepalive_task.start(self._keepalive_interval,
+                                       initial_delay=self._keepalive_interval)
+        return conn
+
+    def _expire(self, now):
+        while (self._idle and
+               now - self._idle[0].last_used > self._idle_timeout):
+            self._close(self._idle.popleft())
+
+    def _keepalive(self):
+        self._expire(time.time())
+        # take the connections out of the pool while they are checked so
+        # that they are not handed out at the same time
+        checked = []
+        while self._idle:
+            conn = self._idle.popleft()
+            try:
+                conn.api.ping()
+            except Exception:
+                LOG.warn(_LW("Pluribus switch connection failed its health "
+                             "check, closing it"))
+                self._close(conn)
+                continue
+            checked.append(conn)
+        self._idle.extendleft(reversed(checked))
+        self._trim()
+
+    def _trim(self):
+        # connections opened while the keepalive had the idle ones checked
+        # out can leave more than pool_size idle, the oldest are closed
+        while len(self._idle) > self._pool_size:
+            self._close(self._idle.popleft())
+
+    def _close(self, conn):
+        close = getattr(conn.api, 'close', None)
+        if close is None:
+            return
+        try:
+            close()
+        except Exception:
+            LOG.debug("Error closing Pluribus switch connection",
+                      exc_info=True)
@@ -0,0 +1,138 @@
+# COPYRIGHT 2015 Pluribus Networks Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import event
+
+from neutron import context as n_context
+from neutron.common import constants as const
+from neutron.db import l3_db
+from neutron.db import models_v2
+
+
+def after_commit(session, func):
+    """Call func() once the transaction session is in has committed, or
+    never if it is rolled back.
+    """
+    state = {'rolled_back': False}
+
+    def on_commit(session):
+        if not state['rolled_back']:
+            func()
+
+    def on_rollback(session):
+        state['rolled_back'] = True
+
+    event.listen(session, 'after_commit', on_commit, once=True)
+    event.listen(session, 'after_rollback', on_rollback, once=True)
+
+
+def update_status(model, resource_id, status, context=None):
+    """Set the status column of a single row without going through the
+    plugin, so no mechanism driver hooks are run again.
+    """
+    if context is None:
+        context = n_context.get_admin_context()
+
+    with context.session.begin(subtransactions=True):
+        (context.session.query(model).
+         filter_by(id=resource_id).
+         update({'status': status}, synchronize_session=False))
+
+
+def update_status_bulk(model, resource_ids, status, context=None,
+                       from_statuses=None):
+    """Set the status column of several rows with a single statement.
+
+    With from_statuses only the rows currently in one of them change.
+    Returns the ids given, with from_statuses only those that changed.
+    """
+    if not resource_ids:
+        return []
+    if context is None:
+        context = n_context.get_admin_context()
+
+    with context.session.begin(subtransactions=True):
+        if from_statuses is not None:
+            resource_ids = [row.id for row in
+                            context.session.query(model.id).
+                            filter(model.id.in_(resource_ids),
+                                   model.status.in_(from_statuses)).
+                            with_lockmode('update')]
+            if not resource_ids:
+                return []
+        (context.session.query(model).
+         filter(model.id.in_(resource_ids)).
+         update({'status': status}, synchronize_session=False))
+    return resource_ids
+
+
+def set_network_status(network_id, status, context=None):
+    update_status(models_v2.Network, network_id, status, context)
+
+
+def set_ports_status(port_ids, status, context=None, from_statuses=None):
+    return update_status_bulk(models_v2.Port, port_ids, status, context,
+                              from_statuses)
+
+
+def end_build(resource, resource_id, status, context=None):
+    """Set the status of a network, of a port or of the DHCP ports of a
+    subnet left in BUILD while their switch request was pending. Rows in
+    any other status are left alone.
+    """
+    if resource == 'network':
+        return update_status_bulk(models_v2.Network, [resource_id], status,
+                                  context, (const.PORT_STATUS_BUILD,))
+    if resource == 'subnet':
+        port_ids = get_dhcp_port_ids(resource_id, context)
+    elif resource == 'port':
+        port_ids = [resource_id]
+    else:
+        return []
+    return set_ports_status(port_ids, status, context,
+                            (const.PORT_STATUS_BUILD,))
+
+
+def get_dhcp_port_ids(subnet_id, context=None):
+    if context is None:
+        context = n_context.get_admin_context()
+
+    query = (context.session.query(models_v2.IPAllocation.port_id).
+             join(models_v2.Port,
+                  models_v2.Port.id == models_v2.IPAllocation.port_id).
+             filter(models_v2.IPAllocation.subnet_id == subnet_id,
+                    models_v2.Port.device_owner == const.DEVICE_OWNER_DHCP))
+    return [row.port_id for row in query]
+
+
+def set_router_status(router_id, status, context=None):
+    update_status(l3_db.Router, router_id, status, context)
+
+
+def set_router_ports_status(router_id, subnet_ids, status, context=None):
+    """Set the status of the ports router_id has on any of subnet_ids
+    with a single statement.
+    """
+    if context is None:
+        context = n_context.get_admin_context()
+
+    with context.session.begin(subtransactions=True):
+        on_subnet = (context.session.query(models_v2.IPAllocation.port_id).
+                     filter(models_v2.IPAllocation.subnet_id.in_(
+                         subnet_ids)).
+                     subquery())
+        (context.session.query(models_v2.Port).
+         filter(models_v2.Port.device_id == router_id,
+                models_v2.Port.id.in_(on_subnet)).
+         update({'status': status}, synchronize_session=False))
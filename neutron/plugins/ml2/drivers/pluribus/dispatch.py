@@ -0,0 +1,176 @@
+# COPYRIGHT 2015 Pluribus Networks Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+
+import eventlet
+from eventlet import event
+from eventlet import semaphore
+
+from neutron.i18n import _LE
+from neutron.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+PENDING = 'PENDING'
+ACTIVE = 'ACTIVE'
+ERROR = 'ERROR'
+
+
+class OrderedDispatcher(object):
+
+    """Runs switch operations in the background.
+
+    Operations queued under the same key are sent to the switch strictly
+    in the order they were queued, operations on different keys run
+    concurrently, at most pool_size at a time. The driver queues subnet
+    and port operations under their network id so that they can never
+    overtake the creation of the network they belong to.
+
+    The state of every resource with queued work is PENDING until the
+    switch has answered its last operation, then ACTIVE or ERROR. An
+    operation returning PENDING was handed on, e.g. to the journal, and
+    leaves its resource PENDING until record() is given the outcome.
+    """
+
+    def __init__(self, pool_size):
+        self._workers = semaphore.Semaphore(pool_size)
+        self._queues = {}
+        self._pending = collections.defaultdict(int)
+        self._status = {}
+
+    def dispatch(self, key, func, kwargs, callback=None, resource_id=None):
+        """Queue func(**kwargs) behind any pending operation on key.
+
+        resource_id (key by default) names the resource whose state the
+        operation changes. callback, if given, is called with ACTIVE or
+        ERROR once the switch has answered.
+        """
+        resource_id = resource_id or key
+        self._pending[resource_id] += 1
+        self._status[resource_id] = PENDING
+
+        op = (func, kwargs, callback, resource_id)
+        queue = self._queues.get(key)
+        if queue is not None:
+            queue.append(op)
+            return
+
+        self._queues[key] = collections.deque([op])
+        eventlet.spawn_n(self._drain, key)
+
+    def wait(self, key):
+        """Block until every operation queued on key so far has been sent
+        to the switch, for requests made outside of the dispatcher that
+        must not overtake them.
+        """
+        queue = self._queues.get(key)
+        if queue is None:
+            return
+        drained = event.Event()
+        queue.append((drained.send, {}, None, None))
+        drained.wait()
+
+    def get_status(self, resource_id):
+        return self._status.get(resource_id)
+
+    def record(self, resource_id, status):
+        """Record the outcome of an operation that returned PENDING."""
+        if not self._pending.get(resource_id):
+            self._status[resource_id] = status
+
+    def forget(self, resource_id):
+        if not self._pending.get(resource_id):
+            self._status.pop(resource_id, None)
+
+    def _drain(self, key):
+        queue = self._queues[key]
+        while queue:
+            func, kwargs, callback, resource_id = queue.popleft()
+            try:
+                with self._workers:
+                    status = func(**kwargs)
+                if status != PENDING:
+                    status = ACTIVE
+            except Exception:
+                LOG.exception(_LE("Pluribus switch operation %(op)s failed "
+                                  "for %(id)s"),
+                              {'op': getattr(func, '__name__', func),
+                               'id': resource_id})
+                status = ERROR
+
+            if resource_id is None:
+                # a wait() marker, no resource state to record
+                continue
+            self._pending[resource_id] -= 1
+            if not self._pending[resource_id]:
+                # nothing else is queued for this resource, the last answer
+                # from the switch is its state
+                del self._pending[resource_id]
+                self._status[resource_id] = status
+
+            if callback is not None and status != PENDING:
+                try:
+                    callback(status)
+                except Exception:
+                    LOG.exception(_LE("Failed to record status %(status)s "
+                                      "for %(id)s"),
+                                  {'status': status, 'id': resource_id})
+
+        del self._queues[key]
+
+
+class UpdateCoalescer(object):
+
+    """Collapses bursts of updates to the same resource.
+
+    The first update submitted for a key starts a timer of window
+    seconds; updates submitted for that key before it fires are merged
+    into the pending state. When the timer fires send(key, state) is
+    called once with the merged state. Nobody waits for that call, if it
+    fails on_error(key), when given, records the failure instead.
+    """
+
+    def __init__(self, window, send, on_error=None):
+        self._window = window
+        self._send = send
+        self._on_error = on_error
+        self._pending = {}
+
+    def submit(self, key, state):
+        scheduled = key in self._pending
+        self._pending.setdefault(key, {}).update(state)
+        if not scheduled:
+            eventlet.spawn_after(self._window, self._flush, key)
+
+    def discard(self, key):
+        self._pending.pop(key, None)
+
+    def _flush(self, key):
+        state = self._pending.pop(key, None)
+        if state is None:
+            # discarded while waiting
+            return
+        try:
+            self._send(key, state)
+        except Exception:
+            LOG.exception(_LE("Failed to send coalesced update for %s"), key)
+            if self._on_error is None:
+                return
+            try:
+                self._on_error(key)
+            except Exception:
+                LOG.exception(_LE("Failed to record status %(status)s "
+                                  "for %(id)s"),
+                              {'status': ERROR, 'id': key})
@@ -0,0 +1,211 @@
+# COPYRIGHT 2015 Pluribus Networks Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import bisect
+import hashlib
+
+import eventlet
+
+from neutron.i18n import _LE
+from neutron.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+HASH = 'hash'
+BROADCAST = 'broadcast'
+
+
+class FabricError(Exception):
+
+    """A switch request failed on some of the fabric nodes.
+
+    errors maps the name of every node that failed to its exception.
+    """
+
+    def __init__(self, method, errors):
+        self.errors = errors
+        super(FabricError, self).__init__(
+            "%s failed on %s" % (method, ', '.join(sorted(errors))))
+
+
+class HashRing(object):
+
+    """Consistent hash ring mapping keys to fabric nodes.
+
+    Every node is placed replicas times on the ring so that keys spread
+    evenly and only the keys of a node that is added or removed move.
+    """
+
+    def __init__(self, nodes, replicas=100):
+        ring = sorted((self._hash('%s-%d' % (node, i)), node)
+                      for node in nodes for i in range(replicas))
+        self._points = [point for point, _ in ring]
+        self._nodes = [node for _, node in ring]
+
+    @staticmethod
+    def _hash(key):
+        return int(hashlib.md5(key.encode('utf-8')).hexdigest()[:8], 16)
+
+    def get_node(self, key):
+        index = bisect.bisect(self._points, self._hash(key))
+        return self._nodes[index % len(self._nodes)]
+
+
+def _route_key(method, kwargs):
+    """Return the network or router a request belongs to, None when it
+    concerns the whole fabric.
+    """
+    resource = method.partition('_')[2]
+    if resource in ('network', 'network_cascade'):
+        return kwargs.get('id') or kwargs.get('network_id')
+    if resource in ('subnet', 'port'):
+        return kwargs.get('network_id')
+    if resource == 'router':
+        return kwargs.get('id') or kwargs.get('router_id')
+    if resource in ('router_interface', 'router_interfaces',
+                    'router_routes', 'floatingip', 'floatingips'):
+        # floating IPs are NATed by the vrouter of their router
+        return kwargs.get('router_id')
+    return None
+
+
+def _merge(results):
+    # list_* requests return the objects of each node, bulk requests a
+    # dict of per object errors and versioned objects, like pool graphs,
+    # the copy each node has
+    values = [r for r in results if r is not None]
+    if values and all(isinstance(r, dict) and 'version' in r
+                      for r in values):
+        # the newest copy, a push after it must carry a higher version
+        return max(values, key=lambda r: r['version'] or 0)
+    if values and all(isinstance(r, list) for r in values):
+        merged, seen = [], set()
+        for obj in (obj for r in values for obj in r):
+            if obj.get('id') not in seen:
+                seen.add(obj.get('id'))
+                merged.append(obj)
+        return merged
+    if values and all(isinstance(r, dict) for r in values):
+        merged = {}
+        for r in values:
+            merged.update(r)
+        return merged
+    return values[0] if values else None
+
+
+class FabricClient(object):
+
+    """Client for a fabric of Pluribus switches.
+
+    nodes maps each node name to the PluribusClient of that switch. With
+    the hash placement requests about a network, or anything on it, go to
+    the node the network hashes to and requests about a router, or its
+    floating IPs, to the router's node; other requests go to every node. With the broadcast
+    placement every request goes to every node. Requests for several
+    nodes are sent in parallel and FabricError is raised when any of the
+    nodes failed.
+    """
+
+    def __init__(self, nodes, placement=HASH):
+        self.nodes = nodes
+        self.placement = placement
+        self.ring = HashRing(list(nodes))
+        self._names = sorted(nodes)
+
+    def supports(self, method):
+        return self.nodes[self._names[0]].supports(method)
+
+    def accepts(self, method):
+        return self.nodes[self._names[0]].accepts(method)
+
+    def connect(self):
+        """Return a FabricClient over a dedicated connection to each
+        node.
+        """
+        return FabricClient(dict((name, node.connect())
+                                 for name, node in self.nodes.items()),
+                            self.placement)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        def call(**kwargs):
+            return self._call(name, kwargs)
+        call.__name__ = name
+        return call
+
+    def _call(self, method, kwargs):
+        if self.placement == HASH:
+            if method.endswith('_ports') and 'ports' in kwargs:
+                return self._call_batch(method, 'ports', kwargs['ports'],
+                                        'network_id')
+            if method.endswith('_floatingips') and 'floatingips' in kwargs:
+                return self._call_batch(method, 'floatingips',
+                                        kwargs['floatingips'], 'router_id')
+            key = _route_key(method, kwargs)
+            if key is not None:
+                node = self.ring.get_node(key)
+                return getattr(self.nodes[node], method)(**kwargs)
+
+        results, errors = self._fan_out(
+            dict((node, kwargs) for node in self._names), method)
+        if errors:
+            raise FabricError(method, errors)
+        return _merge(results.values())
+
+    def _call_batch(self, method, name, objs, field):
+        # one batched request per node, ports follow their network and
+        # floating IPs their router; a floating IP without a router goes
+        # to every node
+        by_node = {}
+        for obj in objs:
+            key = obj.get(field)
+            nodes = (self._names if key is None else
+                     [self.ring.get_node(key)])
+            for node in nodes:
+                by_node.setdefault(node, []).append(obj)
+
+        results, errors = self._fan_out(
+            dict((node, {name: o}) for node, o in by_node.items()),
+            method)
+        failed = _merge(results.values()) or {}
+        for node, error in errors.items():
+            for obj in by_node[node]:
+                failed[obj['id']] = str(error)
+        return failed
+
+    def _fan_out(self, requests, method):
+        """Send method to several nodes in parallel.
+
+        requests maps each node to the kwargs of its request. Returns the
+        results and the errors of the nodes, each keyed by node.
+        """
+        def send(node, kwargs):
+            try:
+                return node, getattr(self.nodes[node], method)(**kwargs), None
+            except Exception as e:
+                LOG.exception(_LE("Pluribus switch %(node)s failed "
+                                  "%(method)s"),
+                              {'node': node, 'method': method})
+                return node, None, e
+
+        pool = eventlet.GreenPool(len(requests) or 1)
+        results, errors = {}, {}
+        for node, result, error in pool.starmap(send, requests.items()):
+            if error is None:
+                results[node] = result
+            else:
+                errors[node] = error
+        return results, errors
@@ -0,0 +1,316 @@
+# COPYRIGHT 2015 Pluribus Networks Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import json
+import os
+import sqlite3
+import time
+import uuid
+
+from neutron.i18n import _LE, _LI, _LW
+from neutron.openstack.common import log as logging
+from neutron.openstack.common import loopingcall
+from neutron.plugins.ml2.drivers.pluribus import dispatch
+
+LOG = logging.getLogger(__name__)
+
+
+def compact(entries):
+    """Fold journal entries that cancel or supersede each other.
+
+    entries are dicts with seq, method, resource_id and payload keys, in
+    journal order. A create followed by updates becomes one create with
+    the merged payload, consecutive updates become one update, updates
+    followed by a delete become the delete and a create followed by a
+    delete disappears altogether. Entries only fold into the one right
+    before them: a request on another resource in between may depend on
+    either, so the order the switch sees is kept.
+
+    Returns the operations left to send, each with the list of journal
+    seqs it covers, and the seqs of the entries that folded into nothing.
+    """
+    ops, noops = [], []
+    for entry in entries:
+        verb, _, resource = entry['method'].partition('_')
+        prev = ops[-1] if ops else None
+        if prev is not None and (prev['resource'] != resource or
+                                 prev['resource_id'] != entry['resource_id'] or
+                                 prev['verb'] not in ('create', 'update')):
+            prev = None
+
+        if prev is not None and verb == 'update':
+            prev['payload'].update(entry['payload'])
+            prev['seqs'].append(entry['seq'])
+            continue
+
+        seqs = [entry['seq']]
+        if prev is not None and verb == 'delete':
+            ops.pop()
+            if prev['verb'] == 'create':
+                noops.extend(prev['seqs'] + seqs)
+                continue
+            seqs = prev['seqs'] + seqs
+
+        ops.append({'verb': verb,
+                    'resource': resource,
+                    'method': entry['method'],
+                    'resource_id': entry['resource_id'],
+                    'payload': dict(entry['payload']),
+                    'seqs': seqs})
+
+    return ops, noops
+
+
+class CircuitBreaker(object):
+
+    """Stops calls to the switch after repeated failures.
+
+    After failure_threshold consecutive failures the breaker opens and
+    allow() refuses calls for reset_timeout seconds. After that a single
+    call is let through to probe the switch, its outcome closes or
+    reopens the breaker.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self._threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+
+    def allow(self):
+        if self._opened_at is None:
+            return True
+        if time.time() - self._opened_at < self._reset_timeout:
+            return False
+        # half open, the next outcome decides
+        self._opened_at = time.time()
+        return True
+
+    def success(self):
+        if self._opened_at is not None:
+            LOG.info(_LI("Pluribus switch is reachable again"))
+        self._failures = 0
+        self._opened_at = None
+
+    def failure(self):
+        self._failures += 1
+        if self._failures >= self._threshold:
+            if self._opened_at is None:
+                LOG.warn(_LW("Pluribus switch failed %d consecutive "
+                             "requests, journaling until it recovers"),
+                         self._failures)
+            self._opened_at = time.time()
+
+
+class Journal(object):
+
+    """Write-ahead journal of switch requests kept in a SQLite file.
+
+    send() calls the switch directly while the breaker is closed and
+    nothing is journaled. Otherwise, or when the call fails, the request
+    is appended to the journal and replayed later, in order, by a
+    periodic task that drains the journal in compacted batches. Entries
+    that keep failing are dropped after max_attempts tries. done, if
+    given, is called with the method, resource id and ACTIVE or ERROR of
+    every request replayed or dropped.
+
+    The replay task is started by start(), so entries left over from
+    before a restart are replayed without waiting for a request. The file
+    is opened by the first process using the journal, so API workers
+    forked after the driver was initialized each get their own
+    connection. A worker claims the rows
+    it replays and no other worker replays while the claim holds, so
+    the switch still gets the requests in journal order.
+    """
+
+    def __init__(self, path, server, breaker, batch_size=500,
+                 max_attempts=10, claim_timeout=300, done=None):
+        self.server = server
+        self.breaker = breaker
+        self._path = path
+        self._batch_size = batch_size
+        self._max_attempts = max_attempts
+        self._claim_timeout = claim_timeout
+        self._done = done
+        self._replay_task = None
+        self._db = None
+        self._pid = None
+        self._owner = None
+
+    def start(self, interval):
+        """Replay the journal every interval seconds."""
+        self._replay_task = loopingcall.FixedIntervalLoopingCall(self.replay)
+        self._replay_task.start(interval, initial_delay=interval)
+
+    def _conn(self):
+        if self._db is not None and self._pid == os.getpid():
+            return self._db
+
+        self._pid = os.getpid()
+        self._owner = '%d-%s' % (self._pid, uuid.uuid4().hex)
+        self._db = sqlite3.connect(self._path, check_same_thread=False)
+        self._db.execute('CREATE TABLE IF NOT EXISTS journal ('
+                         'seq INTEGER PRIMARY KEY AUTOINCREMENT, '
+                         'method TEXT NOT NULL, '
+                         'resource_id TEXT NOT NULL, '
+                         'payload TEXT NOT NULL, '
+                         'attempts INTEGER NOT NULL DEFAULT 0, '
+                         'owner TEXT, '
+                         'claimed_at REAL)')
+        columns = [row[1] for row in
+                   self._db.execute('PRAGMA table_info(journal)')]
+        for column, kind in (('owner', 'TEXT'), ('claimed_at', 'REAL')):
+            if column not in columns:
+                # journal written before the rows were claimed
+                self._db.execute('ALTER TABLE journal ADD COLUMN %s %s' %
+                                 (column, kind))
+        self._db.commit()
+        return self._db
+
+    def pending(self):
+        return self._conn().execute(
+            'SELECT COUNT(*) FROM journal').fetchone()[0]
+
+    def send(self, method, resource_id, payload, journaled=None):
+        """Send a request to the switch or journal it.
+
+        Returns True when the switch has applied the request, False when
+        it was journaled. journaled, if given, is called right before the
+        request is appended, before any replay can report on it.
+        """
+        if not self.pending() and self.breaker.allow():
+            try:
+                getattr(self.server, method)(**payload)
+                self.breaker.success()
+                return True
+            except Exception:
+                LOG.exception(_LE("Pluribus switch request %s failed, "
+                                  "journaling it"), method)
+                self.breaker.failure()
+
+        if journaled is not None:
+            journaled()
+        self.append(method, resource_id, payload)
+        return False
+
+    def append(self, method, resource_id, payload):
+        db = self._conn()
+        db.execute('INSERT INTO journal (method, resource_id, payload) '
+                   'VALUES (?, ?, ?)',
+                   (method, resource_id, json.dumps(payload, default=str)))
+        db.commit()
+
+    def replay(self):
+        """Drain the journal for as long as the switch accepts requests."""
+        while self.pending() and self.breaker.allow():
+            if not self._replay_batch():
+                return
+
+    def _claim(self):
+        # claims the oldest rows unless another worker holds a claim that
+        # has not timed out, BEGIN IMMEDIATE keeps the check and the claim
+        # atomic across processes
+        db = self._conn()
+        now = time.time()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            db.execute('UPDATE journal SET owner = ?, claimed_at = ? '
+                       'WHERE seq IN (SELECT seq FROM journal '
+                       'ORDER BY seq LIMIT ?) '
+                       'AND NOT EXISTS (SELECT 1 FROM journal '
+                       'WHERE owner IS NOT NULL AND owner != ? '
+                       'AND claimed_at > ?)',
+                       (self._owner, now, self._batch_size, self._owner,
+                        now - self._claim_timeout))
+        finally:
+            db.commit()
+
+    def _release(self):
+        db = self._conn()
+        db.execute('UPDATE journal SET owner = NULL, claimed_at = NULL '
+                   'WHERE owner = ?', (self._owner,))
+        db.commit()
+
+    def _read(self):
+        self._claim()
+        rows = self._conn().execute(
+            'SELECT seq, method, resource_id, payload, attempts FROM journal '
+            'WHERE owner = ? ORDER BY seq', (self._owner,))
+        return [{'seq': seq, 'method': method, 'resource_id': resource_id,
+                 'payload': json.loads(payload), 'attempts': attempts}
+                for seq, method, resource_id, payload, attempts in rows]
+
+    def _remove(self, seqs):
+        db = self._conn()
+        db.executemany('DELETE FROM journal WHERE seq = ?',
+                       [(seq,) for seq in seqs])
+        db.commit()
+
+    def _report(self, op, status):
+        if self._done is None:
+            return
+        try:
+            self._done(op['method'], op['resource_id'], status)
+        except Exception:
+            LOG.exception(_LE("Failed to record status %(status)s for "
+                              "%(id)s"),
+                          {'status': status, 'id': op['resource_id']})
+
+    def _replay_batch(self):
+        entries = self._read()
+        if not entries:
+            # another worker is replaying
+            return False
+        try:
+            return self._replay_entries(entries)
+        finally:
+            self._release()
+
+    def _replay_entries(self, entries):
+        attempts = dict((e['seq'], e['attempts']) for e in entries)
+        ops, noops = compact(entries)
+        self._remove(noops)
+        LOG.info(_LI("Pluribus replaying %(ops)d journaled switch requests "
+                     "compacted from %(entries)d"),
+                 {'ops': len(ops), 'entries': len(entries)})
+
+        for op in ops:
+            try:
+                getattr(self.server, op['method'])(**op['payload'])
+            except Exception:
+                LOG.exception(_LE("Pluribus failed to replay %(method)s for "
+                                  "%(id)s"),
+                              {'method': op['method'],
+                               'id': op['resource_id']})
+                self.breaker.failure()
+                if max(attempts[seq] for seq in op['seqs']) + 1 >= \
+                        self._max_attempts:
+                    LOG.error(_LE("Pluribus giving up on %(method)s for "
+                                  "%(id)s"),
+                              {'method': op['method'],
+                               'id': op['resource_id']})
+                    self._remove(op['seqs'])
+                    self._report(op, dispatch.ERROR)
+                else:
+                    db = self._conn()
+                    db.executemany('UPDATE journal SET attempts = '
+                                   'attempts + 1 WHERE seq = ?',
+                                   [(seq,) for seq in op['seqs']])
+                    db.commit()
+                return False
+
+            self._remove(op['seqs'])
+            self.breaker.success()
+            self._report(op, dispatch.ACTIVE)
+        return True
@@ -13,35 +13,105 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
+import threading
+
+import eventlet
 from oslo.config import cfg
 
+from neutron import context as n_context
 from neutron import manager
 from neutron.api.v2 import attributes
 from neutron.common import constants as const
+from neutron.common import exceptions as n_exc
 from neutron.extensions import portbindings
 from neutron.openstack.common import log as logging
 from neutron.i18n import _LI, _LE
 from neutron.plugins.common import constants
 from neutron.plugins.ml2 import driver_api
 from neutron.plugins.ml2.common import exceptions as ml2_exc
+from neutron.plugins.ml2.drivers.pluribus import client as pn_client
 from neutron.plugins.ml2.drivers.pluribus import config  # noqa
-from oslo.utils import importutils
+from neutron.plugins.ml2.drivers.pluribus import db as pn_db
+from neutron.plugins.ml2.drivers.pluribus import dispatch
+from neutron.plugins.ml2.drivers.pluribus import journal
+from neutron.plugins.ml2.drivers.pluribus import schema
+from neutron.plugins.ml2.drivers.pluribus import sync
+from neutron.plugins.ml2.drivers.pluribus import topology
 
 LOG = logging.getLogger(__name__)
 
 
+class PortBatch(object):
+
+    """Port creates and deletes held back by PluribusDriver.port_batch()."""
+
+    def __init__(self):
+        self.created = []
+        self.deleted = []
+
+
+class CascadeScope(object):
+
+    """Network or tenant being deleted under PluribusDriver.cascade()."""
+
+    def __init__(self, network_id=None, tenant_id=None):
+        self.network_id = network_id
+        self.tenant_id = tenant_id
+        # (method, key, payload, resource_id) of the requests held back
+        self.held = []
+
+    def covers(self, obj, network_id):
+        if self.network_id is not None:
+            return network_id == self.network_id
+        return obj.get('tenant_id') == self.tenant_id
+
+
 class PluribusDriver(driver_api.MechanismDriver):
 
     """Ml2 Mechanism Driver for the Pluribus Networks hardware.
     """
 
+    # set up by initialize() when async_dispatch is enabled
+    dispatcher = None
+    # set up by initialize() when port_update_window is set
+    port_updates = None
+    # set up by initialize() when enable_journal is set
+    journal = None
+    # per green thread, holds the PortBatch being collected and the
+    # CascadeScope of a cascaded delete
+    _local = threading.local()
+
     def initialize(self):
 
         # setup the rpc server
-        self.server = importutils.\
-            import_object(cfg.CONF.PLURIBUS_PLUGINS['pn_api'])
+        self.server = pn_client.get_client()
         self.vif_type = portbindings.VIF_TYPE_OVS
         self.vif_details = {portbindings.CAP_PORT_FILTER: False}
+        schema.check(self.server)
+
+        if cfg.CONF.PLURIBUS_PLUGINS['async_dispatch']:
+            self.dispatcher = dispatch.OrderedDispatcher(
+                cfg.CONF.PLURIBUS_PLUGINS['dispatch_workers'])
+
+        if cfg.CONF.PLURIBUS_PLUGINS['port_update_window'] > 0:
+            self.port_updates = dispatch.UpdateCoalescer(
+                cfg.CONF.PLURIBUS_PLUGINS['port_update_window'],
+                self._update_port, self._port_update_failed)
+
+        conf = cfg.CONF.PLURIBUS_PLUGINS
+        if conf.enable_journal:
+            breaker = journal.CircuitBreaker(conf.breaker_failure_threshold,
+                                             conf.breaker_reset_timeout)
+            self.journal = journal.Journal(conf.journal_path, self.server,
+                                           breaker, conf.journal_batch_size,
+                                           conf.journal_max_attempts,
+                                           done=self._journal_done)
+            self.journal.start(conf.journal_replay_interval)
+
+        self.synchronizer = sync.Synchronizer(self.server)
+        if cfg.CONF.PLURIBUS_PLUGINS['sync_on_startup']:
+            eventlet.spawn_n(self._startup_sync)
 
         LOG.debug("%(module)s.%(name)s init done",
                   {'module': __name__,
@@ -51,14 +121,275 @@ class PluribusDriver(driver_api.MechanismDriver):
     def core_plugin(self):
         return manager.NeutronManager.get_plugin()
 
+    def sync(self):
+        """Reconcile the switch with the Neutron database."""
+        return self.synchronizer.sync()
+
+    def _startup_sync(self):
+        # the core and service plugins are still being loaded
+        while not manager.NeutronManager.has_instance():
+            eventlet.sleep(1)
+        try:
+            self.sync()
+        except Exception:
+            LOG.exception(_LE("Pluribus switch synchronization failed"))
+
+    def _send(self, method, key, payload, set_status=None,
+              resource_id=None):
+        """Send a request to the switch.
+
+        Returns True once the switch has applied the request. With
+        async_dispatch the request is queued behind any pending work on
+        the network key instead and False is returned; set_status is then
+        called with PENDING straight away and with ACTIVE or ERROR once
+        the switch has answered. False is also returned when the journal
+        took the request because the switch could not, set_status is then
+        called with PENDING and the resource stays pending until the
+        journal has replayed it.
+        """
+        resource_id = resource_id or key
+        payload = schema.build(method, payload)
+        if self.dispatcher is None:
+            return self._call_switch(method, resource_id, payload,
+                                     set_status)
+
+        def call(**kwargs):
+            if not self._call_switch(method, resource_id, kwargs):
+                return dispatch.PENDING
+        call.__name__ = method
+
+        if set_status is not None:
+            set_status(dispatch.PENDING)
+        self.dispatcher.dispatch(key, call, payload,
+                                 callback=set_status,
+                                 resource_id=resource_id)
+        return False
+
+    def _send_in_order(self, method, key, payload, resource_id=None):
+        """Send a request to the switch and wait for its answer.
+
+        With async_dispatch the request first waits for the work queued
+        on the network key, so it still reaches the switch in order. Used
+        for the subnets, whose status has no column to stay pending in.
+        """
+        if self.dispatcher is not None:
+            self.dispatcher.wait(key)
+        return self._call_switch(method, resource_id or key,
+                                 schema.build(method, payload))
+
+    def _call_switch(self, method, resource_id, payload, set_status=None):
+        if self.journal is not None:
+            journaled = None
+            if set_status is not None:
+                # in BUILD before the journal can replay it, so that the
+                # outcome of the replay is recorded
+                def journaled():
+                    set_status(dispatch.PENDING)
+            return self.journal.send(method, resource_id, payload,
+                                     journaled)
+        getattr(self.server, method)(**payload)
+        return True
+
+    def _journal_done(self, method, resource_id, status):
+        # a journaled request was replayed or given up on, its resource
+        # leaves the pending state it was left in
+        verb, _, resource = method.partition('_')
+        if self.dispatcher is not None and resource != 'subnet':
+            if verb == 'delete' and status == dispatch.ACTIVE:
+                self.dispatcher.forget(resource_id)
+            else:
+                self.dispatcher.record(resource_id, status)
+        if verb == 'delete':
+            return
+        if resource == 'port':
+            self._port_status_setter(resource_id)(status)
+        else:
+            pn_db.end_build(resource, resource_id, status)
+
+    @staticmethod
+    def _db_status_setter(update, resource_id):
+        def set_status(status):
+            if status == dispatch.PENDING:
+                status = const.PORT_STATUS_BUILD
+            update(resource_id, status)
+        return set_status
+
+    def _port_status_setter(self, port_id):
+        """Set the status of a port through the core plugin, so the change
+        is seen like any other port update.
+
+        A port only goes ACTIVE from BUILD, a port something else has
+        moved on from BUILD since its request was queued keeps its status.
+        """
+        def set_status(status):
+            context = n_context.get_admin_context()
+            if status == dispatch.PENDING:
+                status = const.PORT_STATUS_BUILD
+            elif status == dispatch.ACTIVE:
+                try:
+                    port = self.core_plugin.get_port(context, port_id)
+                except n_exc.PortNotFound:
+                    return
+                if port['status'] != const.PORT_STATUS_BUILD:
+                    return
+            self.core_plugin.update_port_status(context, port_id, status)
+        return set_status
+
+    def _current_batch(self):
+        return getattr(self._local, 'batch', None)
+
+    @contextlib.contextmanager
+    def port_batch(self):
+        """Hold back the switch requests of the ports created or deleted
+        inside the block.
+
+        The ports are collected in the PortBatch yielded to the caller,
+        which hands them to create_ports() or delete_ports() afterwards.
+        """
+        batch = PortBatch()
+        self._local.batch = batch
+        try:
+            yield batch
+        finally:
+            self._local.batch = None
+
+    def create_ports(self, ports):
+        """Create ports on the switch with a single request.
+
+        Returns a dict mapping the id of every port the switch failed to
+        create to the error it reported.
+        """
+        return self._send_bulk('create_ports', 'create_port', ports)
+
+    def delete_ports(self, ports):
+        """Delete ports from the switch with a single request.
+
+        Returns a dict mapping the id of every port the switch failed to
+        delete to the error it reported.
+        """
+        return self._send_bulk('delete_ports', 'delete_port', ports)
+
+    def _send_bulk(self, bulk_method, method, ports):
+        if not ports:
+            return {}
+
+        ports = [schema.build(method, port) for port in ports]
+        if self.dispatcher is not None:
+            # the batch must not overtake the work still queued on the
+            # networks of its ports, e.g. their create_network
+            for network_id in sorted(set(p['network_id'] for p in ports)):
+                self.dispatcher.wait(network_id)
+
+        if self.server.supports(bulk_method):
+            try:
+                results = getattr(self.server, bulk_method)(ports=ports)
+            except Exception as e:
+                # the whole batch failed, the caller undoes every port
+                LOG.exception(_LE("Pluribus %s request failed"), bulk_method)
+                results = dict((port['id'], str(e)) for port in ports)
+            return dict((port_id, error)
+                        for port_id, error in (results or {}).items()
+                        if error)
+
+        # the pn_api class has no batched call, fall back to one request
+        # per port but still report per port
+        failed = {}
+        for port in ports:
+            try:
+                getattr(self.server, method)(**port)
+            except Exception as e:
+                failed[port['id']] = str(e)
+        return failed
+
+    @contextlib.contextmanager
+    def cascade(self, network_id=None, tenant_id=None):
+        """Replace the switch requests of the networks, subnets and ports
+        deleted inside the block by one cascaded delete.
+
+        The scope is either network_id and everything on it, or every
+        object owned by tenant_id. Once the block is done the switch gets
+        a single delete_network_cascade or delete_tenant request. If the
+        block fails, the deletes held back so far are sent one by one.
+        Without the cascade call in the pn_api class nothing is held back.
+        """
+        if network_id is not None:
+            method, key = 'delete_network_cascade', network_id
+            payload = {'id': network_id}
+        else:
+            method, key = 'delete_tenant', tenant_id
+            payload = {'tenant_id': tenant_id}
+
+        if not self.server.supports(method):
+            yield None
+            return
+
+        scope = CascadeScope(network_id, tenant_id)
+        self._local.cascade = scope
+        try:
+            yield scope
+        except Exception:
+            self._local.cascade = None
+            for held_method, held_key, held_payload, resource_id in scope.held:
+                try:
+                    self._send(held_method, held_key, held_payload,
+                               resource_id=resource_id)
+                except Exception:
+                    LOG.exception(_LE("Pluribus failed to send %s held back "
+                                      "by a failed cascaded delete"),
+                                  held_method)
+            raise
+        finally:
+            self._local.cascade = None
+
+        set_status = None
+        if self.dispatcher is not None:
+            # a tenant cascade is queued on the tenant, it must not
+            # overtake the work still queued on the networks it deletes
+            for held_key in sorted(set(held[1] for held in scope.held) -
+                                   set([key])):
+                self.dispatcher.wait(held_key)
+            resource_ids = [held[3] or held[1] for held in scope.held]
+            set_status = self._forget_all_on_delete(resource_ids)
+        try:
+            if self._send(method, key, payload, set_status):
+                LOG.info(_LI("Pluribus cascaded delete of %(key)s replaced "
+                             "%(count)d switch requests"),
+                         {'key': key, 'count': len(scope.held)})
+        except Exception:
+            # the deletes are committed, as ml2 does for a failed delete
+            # postcommit the failure is only logged
+            LOG.exception(_LE("Pluribus cascaded delete of %s failed"), key)
+
+    def _held_by_cascade(self, method, key, payload, resource_id=None):
+        scope = getattr(self._local, 'cascade', None)
+        if scope is None or not scope.covers(payload, key):
+            return False
+        scope.held.append((method, key, payload, resource_id))
+        return True
+
+    def _forget_all_on_delete(self, resource_ids):
+        def set_status(status):
+            if status == dispatch.ACTIVE:
+                for resource_id in resource_ids:
+                    self.dispatcher.forget(resource_id)
+        return set_status
+
+    def _forget_on_delete(self, resource_id):
+        def set_status(status):
+            if status == dispatch.ACTIVE:
+                self.dispatcher.forget(resource_id)
+        return set_status
+
     def create_network_postcommit(self, context):
         LOG.debug(('Pluribus Driver create_network_postcommit() called:',
                    context.current))
         network = context.current
         network['router_external'] = network.pop('router:external')
-        self.server.create_network(**network)
-        LOG.info(_LI("Pluribus successfully created network %s" %
-                 network['name']))
+        set_status = self._db_status_setter(pn_db.set_network_status,
+                                            network['id'])
+        if self._send('create_network', network['id'], network, set_status):
+            LOG.info(_LI("Pluribus successfully created network %s" %
+                     network['name']))
 
     def update_network_postcommit(self, context):
         LOG.debug(('update network operation is not supported by Pluribus'))
@@ -69,9 +400,12 @@ class PluribusDriver(driver_api.MechanismDriver):
                    context.current))
         network = context.current
         network['router_external'] = network.pop('router:external')
-        self.server.delete_network(**network)
-        LOG.info(_LI("Pluribus successfully deleted network %s" %
-                 network['name']))
+        if self._held_by_cascade('delete_network', network['id'], network):
+            return
+        set_status = self._forget_on_delete(network['id'])
+        if self._send('delete_network', network['id'], network, set_status):
+            LOG.info(_LI("Pluribus successfully deleted network %s" %
+                     network['name']))
 
     def create_port_postcommit(self, context):
         LOG.debug(('Pluribus create_port_postcommit() called:',
@@ -81,8 +415,16 @@ class PluribusDriver(driver_api.MechanismDriver):
         if port['name'].endswith('-dhcp'):
             raise ml2_exc.MechanismDriverError(method='create_port_postcommit')
 
-        self.server.create_port(**port)
-        LOG.info(_LI("Pluribus successfully created port %s" % port['name']))
+        batch = self._current_batch()
+        if batch is not None:
+            batch.created.append(port)
+            return
+
+        set_status = self._port_status_setter(port['id'])
+        if self._send('create_port', port['network_id'], port, set_status,
+                      port['id']):
+            LOG.info(_LI("Pluribus successfully created port %s" %
+                     port['name']))
 
     def bind_port(self, context):
         LOG.debug("Attempting to bind port %(port)s on network %(network)s",
@@ -98,28 +440,68 @@ class PluribusDriver(driver_api.MechanismDriver):
         LOG.debug(('Pluribus update_port_postcommit() called:',
                    context.current))
         port = context.current
-        self.server.update_port(**port)
-        LOG.info(_LI("Pluribus successfully updated port %s" % port['name']))
+        # the l3 plugin may hold the port, or the gateway of its router
+        topology.get_cache().invalidate_port(port)
+        changes = schema.changes('update_port', port, context.original)
+        if changes is None:
+            LOG.debug("Pluribus skipping update of port %s, nothing changed "
+                      "on the switch", port['id'])
+            return
+
+        if self.port_updates is not None:
+            self.port_updates.submit(port['id'], changes)
+            return
+
+        self._update_port(port['id'], changes)
+
+    def _update_port(self, port_id, changes):
+        set_status = self._port_status_setter(port_id)
+        if self._send('update_port', changes['network_id'], changes,
+                      set_status, port_id):
+            LOG.info(_LI("Pluribus successfully updated port %s" % port_id))
+
+    def _port_update_failed(self, port_id):
+        # a coalesced update is sent once update_port_postcommit has
+        # returned, the failure is left on the port as for a queued one
+        self._port_status_setter(port_id)(dispatch.ERROR)
 
     def delete_port_postcommit(self, context):
         LOG.debug(('Pluribus delete_port_postcommit() called:',
                    context.current))
         port = context.current
+        topology.get_cache().invalidate_port(port)
+        if self._held_by_cascade('delete_port', port['network_id'], port,
+                                 port['id']):
+            # ml2 disassociates the floating ips in the database, the
+            # switch drops them with the cascaded delete
+            if self.port_updates is not None:
+                self.port_updates.discard(port['id'])
+            return
+
         # get the service plugin to disassociate floating ip
         service_plugins = manager.NeutronManager.get_service_plugins()
         l3_plugin = service_plugins.get(constants.L3_ROUTER_NAT)
         l3_plugin.disassociate_floatingips(context._plugin_context, port['id'])
-        LOG.info(_LI("Pluribus successfully deleted port %s" % port['name']))
-        self.server.delete_port(**port)
+        if self.port_updates is not None:
+            self.port_updates.discard(port['id'])
+
+        batch = self._current_batch()
+        if batch is not None:
+            batch.deleted.append(port)
+            return
+
+        set_status = self._forget_on_delete(port['id'])
+        if self._send('delete_port', port['network_id'], port, set_status,
+                      port['id']):
+            LOG.info(_LI("Pluribus successfully deleted port %s" %
+                     port['name']))
 
     def create_subnet_postcommit(self, context):
         LOG.debug(('Pluribus create_subnet_postcommit() called:',
                    context.current))
         subnet = context.current
-
-        # get the network information
-        net = self.core_plugin.get_network(context._plugin_context,
-                                           subnet['network_id'])
+        net = context.network.current
+        dhcp_port = None
 
         # create a new port for dhcp endpoint on the switch if it is not marked
         # as 'external network'.
@@ -153,26 +535,27 @@ class PluribusDriver(driver_api.MechanismDriver):
         subnet['dhcp_ip'] = dhcp_ip
 
         try:
-            self.server.create_subnet(**subnet)
-            LOG.info(_LI("Pluribus successfully created subnet %s" %
-                     subnet['name']))
+            sent = self._send_in_order('create_subnet', subnet['network_id'],
+                                       subnet, subnet['id'])
         except Exception as e:
             LOG.error(_LE('create_subnet failed, rolling back'))
-            # delete the dhcp port if enable dhcp was set
-            if subnet['enable_dhcp']:
+            # delete the dhcp port created above
+            if dhcp_port is not None:
                 self.core_plugin.delete_port(context._plugin_context,
                                              dhcp_port['id'], False)
             raise e
 
-        if not net['router:external']:
-            # set the DHCP port status to active
-            filters = {'subnet_id': [subnet['id']]}
-            dhcp_ports = self.core_plugin.get_ports(context._plugin_context,
-                                                    filters=filters)
-            for port in dhcp_ports:
-                port['status'] = const.PORT_STATUS_ACTIVE
-                self.core_plugin.update_port(context._plugin_context,
-                                             port['id'], {'port': port})
+        if sent:
+            LOG.info(_LI("Pluribus successfully created subnet %s" %
+                     subnet['name']))
+        if dhcp_port is not None:
+            # set the DHCP port status straight in the database, a port
+            # update would run the mechanism drivers again; a journaled
+            # subnet leaves it in BUILD until the journal has replayed it
+            status = (const.PORT_STATUS_ACTIVE if sent else
+                      const.PORT_STATUS_BUILD)
+            pn_db.set_ports_status([dhcp_port['id']], status,
+                                   context._plugin_context)
 
     def update_subnet_postcommit(self, context):
         LOG.debug(('update subnet operation not supported by Pluribus'))
@@ -182,6 +565,11 @@ class PluribusDriver(driver_api.MechanismDriver):
         LOG.debug(('Pluribus delete_subnet_postcommit() called:',
                    context.current))
         subnet = context.current
-        self.server.delete_subnet(**subnet)
-        LOG.info(_LI("Pluribus successfully deleted subnet %s" %
-                 subnet['name']))
+        topology.get_cache().invalidate_subnet(subnet['id'])
+        if self._held_by_cascade('delete_subnet', subnet['network_id'],
+                                 subnet, subnet['id']):
+            return
+        if self._send_in_order('delete_subnet', subnet['network_id'],
+                               subnet, subnet['id']):
+            LOG.info(_LI("Pluribus successfully deleted subnet %s" %
+                     subnet['name']))
@@ -0,0 +1,144 @@
+# COPYRIGHT 2015 Pluribus Networks Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from neutron.extensions import portbindings
+from neutron.i18n import _LW
+from neutron.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+# attributes the switch uses per resource, anything else Neutron returns
+# (extension attributes, binding profiles, timestamps, ...) stays out of
+# the requests
+FIELDS = {
+    'network': ('id', 'tenant_id', 'name', 'status', 'admin_state_up',
+                'shared', 'router_external', 'subnets',
+                'provider:network_type', 'provider:physical_network',
+                'provider:segmentation_id'),
+    'subnet': ('id', 'tenant_id', 'name', 'network_id', 'ip_version',
+               'cidr', 'gateway_ip', 'enable_dhcp', 'dhcp_ip', 'pn_dhcp',
+               'shared', 'dns_nameservers', 'allocation_pools',
+               'host_routes'),
+    'port': ('id', 'tenant_id', 'name', 'network_id', 'mac_address',
+             'admin_state_up', 'fixed_ips', 'device_id', 'device_owner',
+             portbindings.HOST_ID),
+    'router': ('id', 'tenant_id', 'name', 'status', 'admin_state_up',
+               'gw_port_id', 'external_gateway_info', 'external_port',
+               'external_gw_cidr'),
+    'floatingip': ('id', 'tenant_id', 'status', 'floating_network_id',
+                   'floating_ip_address', 'fixed_ip_address', 'port_id',
+                   'router_id', 'subnet_id'),
+    'pool': ('id', 'tenant_id', 'name', 'subnet_id', 'protocol',
+             'lb_method', 'admin_state_up', 'vip_id', 'provider'),
+    'vip': ('id', 'tenant_id', 'name', 'vip_name', 'address', 'protocol',
+            'protocol_port', 'subnet_id', 'port_id', 'pool_id',
+            'connection_limit', 'session_persistence', 'admin_state_up'),
+    'member': ('id', 'tenant_id', 'pool_id', 'address', 'protocol_port',
+               'weight', 'admin_state_up'),
+    'health': ('id', 'tenant_id', 'type', 'delay', 'timeout', 'max_retries',
+               'http_method', 'url_path', 'expected_codes', 'admin_state_up',
+               'pools'),
+}
+
+# attributes always sent with an update so the switch can find the object
+KEY_FIELDS = {
+    'subnet': ('id', 'network_id'),
+    'port': ('id', 'network_id'),
+    'floatingip': ('id', 'router_id'),
+    'member': ('id', 'pool_id'),
+}
+
+# fields dropped for pn_api methods that do not take them, see check()
+_unsupported = {}
+
+
+def _fields(method):
+    resource = method.partition('_')[2]
+    fields = FIELDS.get(resource)
+    if fields is None:
+        return None
+    dropped = _unsupported.get(method, ())
+    return [f for f in fields if f not in dropped]
+
+
+def build(method, obj):
+    """Return the payload of a switch request made from a Neutron dict.
+
+    Only the attributes in the schema of the resource the pn_api method
+    acts on are kept; methods without a schema get a copy of obj.
+    """
+    fields = _fields(method)
+    if fields is None:
+        return dict(obj)
+    return dict((f, obj[f]) for f in fields if f in obj)
+
+
+def changes(method, current, original):
+    """Return the payload of an update request: the schema attributes
+    that differ between original and current plus the key attributes.
+
+    Returns None when none of the schema attributes changed.
+    """
+    payload = build(method, current)
+    if original is None:
+        return payload
+    resource = method.partition('_')[2]
+    keys = KEY_FIELDS.get(resource, ('id',))
+    changed = [f for f, value in payload.items()
+               if f not in keys and original.get(f) != value]
+    if not changed:
+        return None
+    return dict((f, payload[f]) for f in list(keys) + changed
+                if f in payload)
+
+
+def route_delta(old_routes, new_routes):
+    """Return the routes added and removed going from old_routes to
+    new_routes, lists of destination/nexthop dicts.
+    """
+    old = set((r['destination'], r['nexthop']) for r in old_routes)
+    new = set((r['destination'], r['nexthop']) for r in new_routes)
+    return ([{'destination': d, 'nexthop': n} for d, n in sorted(new - old)],
+            [{'destination': d, 'nexthop': n} for d, n in sorted(old - new)])
+
+
+def check(server):
+    """Check the schemas against the arguments of the pn_api methods.
+
+    Called once at startup. Schema fields a method does not take are
+    dropped from its requests, arguments a method requires that the
+    schema does not provide are reported.
+    """
+    _unsupported.clear()
+    for resource, fields in FIELDS.items():
+        for verb in ('create', 'update', 'delete'):
+            method = '%s_%s' % (verb, resource)
+            if not server.supports(method):
+                continue
+            signature = server.accepts(method)
+            if signature is None:
+                # takes any keyword argument
+                continue
+            args, required = signature
+            extra = [f for f in fields if f not in args]
+            if extra:
+                LOG.debug("pn_api %(method)s does not take %(fields)s, "
+                          "leaving them out", {'method': method,
+                                               'fields': extra})
+                _unsupported[method] = extra
+            missing = [a for a in required if a not in fields]
+            if missing:
+                LOG.warn(_LW("pn_api %(method)s requires %(args)s which "
+                             "Neutron does not send"),
+                         {'method': method, 'args': missing})
@@ -0,0 +1,390 @@
+# COPYRIGHT 2015 Pluribus Networks Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import sys
+import time
+
+import eventlet
+from oslo.config import cfg
+
+from neutron import context as n_context
+from neutron import manager
+from neutron.common import config as common_config
+from neutron.common import constants as const
+from neutron.i18n import _LE, _LI, _LW
+from neutron.openstack.common import log as logging
+from neutron.plugins.common import constants
+from neutron.plugins.ml2.drivers.pluribus import client as pn_client
+from neutron.plugins.ml2.drivers.pluribus import config  # noqa
+from neutron.plugins.ml2.drivers.pluribus import schema
+
+LOG = logging.getLogger(__name__)
+
+# resources in the order they are created, deletes run in reverse
+RESOURCES = ('network', 'subnet', 'port', 'router', 'floatingip', 'pool',
+             'vip')
+
+# attributes compared to decide whether a resource needs an update
+COMPARE_FIELDS = {
+    'network': ('name', 'admin_state_up', 'shared', 'router_external'),
+    'subnet': ('name', 'network_id', 'cidr', 'gateway_ip', 'enable_dhcp',
+               'dhcp_ip'),
+    'port': ('name', 'network_id', 'mac_address', 'admin_state_up',
+             'fixed_ips', 'device_id', 'device_owner'),
+    'router': ('name', 'admin_state_up'),
+    'floatingip': ('floating_ip_address', 'fixed_ip_address', 'port_id',
+                   'router_id'),
+    'pool': ('name', 'subnet_id', 'protocol', 'lb_method', 'admin_state_up'),
+    'vip': ('name', 'address', 'protocol', 'protocol_port', 'pool_id',
+            'connection_limit', 'admin_state_up'),
+}
+
+
+def _normalize(value):
+    # lists such as fixed_ips are compared regardless of their order
+    if isinstance(value, list):
+        return sorted(_normalize(v) for v in value)
+    if isinstance(value, dict):
+        return sorted((k, _normalize(v)) for k, v in value.items())
+    return value
+
+
+# summary entry counting each router request
+_SUMMARY = {'plug': 'create', 'add': 'create',
+            'unplug': 'delete', 'remove': 'delete'}
+
+
+def _unplug(interface):
+    return ('unplug', 'router_interface',
+            dict((f, interface.get(f)) for f in
+                 ('network_id', 'router_id', 'subnet_id', 'cidr')))
+
+
+class Synchronizer(object):
+
+    """Brings the switch in line with the Neutron database.
+
+    Both sides are listed once per resource type and compared by id, so
+    only the creates, updates and deletes needed to remove the drift are
+    sent. They are sent in batches of sync_batch_size requests, at most
+    sync_rate requests per second, ports through the batched port calls
+    when the pn_api class has them. The interfaces, gateway and extra
+    routes of every router are reconciled too, the removals before any
+    delete and the additions once everything else is in place.
+    """
+
+    def __init__(self, server):
+        self.server = server
+
+    def sync(self):
+        """Run a full reconciliation and return the number of requests
+        sent per operation.
+        """
+        LOG.info(_LI("Pluribus switch synchronization started"))
+        context = n_context.get_admin_context()
+        neutron = self._neutron_inventory(context)
+
+        creates, updates, deletes = [], [], []
+        first, last = [], []
+        for resource in RESOURCES:
+            if resource not in neutron:
+                continue
+            switch = self._switch_inventory(resource)
+            if switch is None:
+                continue
+            if resource == 'router':
+                first, last = self.diff_router_state(neutron, switch)
+            c, u, d = self.diff(resource, neutron[resource], switch)
+            if u and not self.server.supports('update_%s' % resource):
+                LOG.warn(_LW("pn_api has no update_%(resource)s, %(count)d "
+                             "out of date %(resource)ss are left as they "
+                             "are"), {'resource': resource, 'count': len(u)})
+                u = []
+            creates.extend(c)
+            updates.extend(u)
+            deletes[:0] = d
+
+        summary = {'create': 0, 'update': 0, 'delete': 0, 'failed': 0}
+        self._apply(first + deletes + creates + updates + last, summary)
+        LOG.info(_LI("Pluribus switch synchronization done: %s"), summary)
+        return summary
+
+    def diff(self, resource, neutron_objs, switch_objs):
+        """Compute the requests that turn switch_objs into neutron_objs."""
+        fields = COMPARE_FIELDS[resource]
+        switch_by_id = dict((obj['id'], obj) for obj in switch_objs)
+
+        creates, updates = [], []
+        for obj in neutron_objs:
+            current = switch_by_id.pop(obj['id'], None)
+            if current is None:
+                creates.append(('create', resource, obj))
+                continue
+            changed = dict((f, obj.get(f)) for f in fields
+                           if f in current and
+                           _normalize(obj.get(f)) != _normalize(current[f]))
+            if changed:
+                # like the updates the drivers send, with the attributes
+                # the switch, or the fabric, finds the object by
+                for f in schema.KEY_FIELDS.get(resource, ('id',)):
+                    changed[f] = obj.get(f)
+                updates.append(('update', resource, changed))
+
+        deletes = [('delete', resource, obj) for obj in switch_by_id.values()]
+        return creates, updates, deletes
+
+    def diff_router_state(self, neutron, switch_routers):
+        """Compute the requests that bring the interfaces, the gateway and
+        the extra routes of the routers on the switch in line.
+
+        Returns the removals, to send before any delete, and the
+        additions, to send after everything else. Interfaces are compared
+        when the pn_api class has list_router_interfaces, routes when the
+        switch lists them with the routers; routers the switch does not
+        have get all of theirs.
+        """
+        subnets = dict((s['id'], s) for s in neutron['subnet'])
+        ports = neutron['port']
+        switch_by_id = dict((r['id'], r) for r in switch_routers)
+        plugged = self._switch_router_interfaces()
+
+        first, last = [], []
+        for router in neutron['router']:
+            router_id = router['id']
+            current = switch_by_id.pop(router_id, None)
+
+            wanted = self._router_interfaces(router_id, ports, subnets)
+            if current is None:
+                on_switch = {}
+            elif plugged is None:
+                # nothing to compare with, left as they are
+                on_switch = wanted
+            else:
+                on_switch = plugged.get(router_id, {})
+            for subnet_id in sorted(set(on_switch) - set(wanted)):
+                first.append(_unplug(on_switch[subnet_id]))
+            for subnet_id in sorted(set(wanted) - set(on_switch)):
+                last.append(('plug', 'router_interface', wanted[subnet_id]))
+
+            # a new router gets its gateway with create_router
+            gateway = router.get('external_gateway_info')
+            if (current is not None and
+                    'external_gateway_info' in current and
+                    _normalize(current['external_gateway_info']) !=
+                    _normalize(gateway)):
+                last.append(('update', 'router',
+                             self._router_gateway(router, ports, subnets)))
+
+            if current is None or 'routes' in current:
+                added, removed = schema.route_delta(
+                    (current or {}).get('routes') or [],
+                    router.get('routes') or [])
+                if removed:
+                    first.append(('remove', 'router_routes',
+                                  {'router_id': router_id,
+                                   'routes': removed}))
+                if added:
+                    last.append(('add', 'router_routes',
+                                 {'router_id': router_id, 'routes': added}))
+
+        # routers deleted from neutron lose their interfaces first
+        for router_id in sorted(switch_by_id):
+            for subnet_id, interface in sorted(
+                    (plugged or {}).get(router_id, {}).items()):
+                first.append(_unplug(interface))
+
+        return first, last
+
+    @staticmethod
+    def _router_interfaces(router_id, ports, subnets):
+        # the interfaces of a router by subnet, as add_router_interface
+        # plugs them
+        interfaces = {}
+        for port in ports:
+            owner = port.get('device_owner')
+            if (port.get('device_id') != router_id or
+                    owner != const.DEVICE_OWNER_ROUTER_INTF):
+                continue
+            for ip in port['fixed_ips']:
+                subnet = subnets.get(ip['subnet_id'])
+                if subnet is None:
+                    continue
+                interface = {'network_id': port['network_id'],
+                             'router_id': router_id,
+                             'cidr': subnet['cidr'],
+                             'subnet_id': subnet['id'],
+                             'interface_ip': ip['ip_address']}
+                if ip['ip_address'] != subnet['gateway_ip']:
+                    interface['use_specific_ip'] = True
+                interfaces[subnet['id']] = interface
+        return interfaces
+
+    @staticmethod
+    def _router_gateway(router, ports, subnets):
+        # the update_router request of the l3 plugin setting the gateway,
+        # with the port holding the router address on the external network
+        payload = dict(router)
+        if not router.get('external_gateway_info'):
+            return payload
+        gateway_ports = [p for p in ports
+                         if p.get('device_id') == router['id'] and
+                         p.get('device_owner') == const.DEVICE_OWNER_ROUTER_GW]
+        if not gateway_ports or not gateway_ports[0]['fixed_ips']:
+            return payload
+        subnet = subnets.get(gateway_ports[0]['fixed_ips'][0]['subnet_id'])
+        if subnet is None:
+            return payload
+        name = subnet['name'] + router['id']
+        payload['external_port'] = [
+            {'network_id': port['network_id'],
+             'port': dict(port, cidr=subnet['cidr'])}
+            for port in ports
+            if port['name'] == name and
+            port['network_id'] == subnet['network_id']]
+        return payload
+
+    def _switch_router_interfaces(self):
+        # the interfaces plugged on the switch by router and subnet
+        if not self.server.supports('list_router_interfaces'):
+            LOG.warn(_LW("pn_api has no list_router_interfaces, only the "
+                         "routers missing on the switch get their "
+                         "interfaces"))
+            return None
+        plugged = {}
+        for interface in self.server.list_router_interfaces():
+            plugged.setdefault(interface['router_id'], {})[
+                interface['subnet_id']] = interface
+        return plugged
+
+    def _neutron_inventory(self, context):
+        core_plugin = manager.NeutronManager.get_plugin()
+        service_plugins = manager.NeutronManager.get_service_plugins()
+        inventory = {}
+
+        networks = core_plugin.get_networks(context)
+        for network in networks:
+            network['router_external'] = network.pop('router:external')
+        inventory['network'] = networks
+
+        # dhcp ports are programmed as part of their subnet
+        ports, dhcp_ips = [], {}
+        for port in core_plugin.get_ports(context):
+            if port['name'].endswith('-dhcp'):
+                for ip in port['fixed_ips']:
+                    dhcp_ips[ip['subnet_id']] = ip['ip_address']
+            else:
+                ports.append(port)
+        inventory['port'] = ports
+
+        subnets = core_plugin.get_subnets(context)
+        for subnet in subnets:
+            subnet['dhcp_ip'] = dhcp_ips.get(subnet['id'],
+                                             subnet['gateway_ip'])
+        inventory['subnet'] = subnets
+
+        l3_plugin = service_plugins.get(constants.L3_ROUTER_NAT)
+        if l3_plugin is not None:
+            inventory['router'] = l3_plugin.get_routers(context)
+            inventory['floatingip'] = l3_plugin.get_floatingips(context)
+
+        lb_plugin = service_plugins.get(constants.LOADBALANCER)
+        if lb_plugin is not None:
+            inventory['pool'] = lb_plugin.get_pools(context)
+            inventory['vip'] = lb_plugin.get_vips(context)
+
+        return inventory
+
+    def _switch_inventory(self, resource):
+        method = 'list_%ss' % resource
+        if not self.server.supports(method):
+            LOG.warn(_LW("pn_api has no %s, %ss are not synchronized"),
+                     method, resource)
+            return None
+        return getattr(self.server, method)()
+
+    def _apply(self, ops, summary):
+        conf = cfg.CONF.PLURIBUS_PLUGINS
+        batch_size = max(conf.sync_batch_size, 1)
+        for start in range(0, len(ops), batch_size):
+            begin = time.time()
+            batch = ops[start:start + batch_size]
+            self._apply_batch(batch, summary)
+            if conf.sync_rate > 0:
+                delay = float(len(batch)) / conf.sync_rate
+                eventlet.sleep(max(0, delay - (time.time() - begin)))
+
+    def _apply_batch(self, batch, summary):
+        ports, port_op = [], None
+        for op, resource, obj in batch:
+            if (resource == 'port' and op in ('create', 'delete') and
+                    self.server.supports('%s_ports' % op)):
+                if port_op != op:
+                    self._apply_ports(port_op, ports, summary)
+                    ports, port_op = [], op
+                ports.append(obj)
+                continue
+
+            # keep the order, ports queued so far go first
+            self._apply_ports(port_op, ports, summary)
+            ports, port_op = [], None
+            method = '%s_%s' % (op, resource)
+            if method == 'delete_router':
+                # the l3 plugin deletes routers by router_id
+                payload = {'router_id': obj['id']}
+            else:
+                payload = schema.build(method, obj)
+            try:
+                getattr(self.server, method)(**payload)
+                summary[_SUMMARY.get(op, op)] += 1
+            except Exception:
+                LOG.exception(_LE("Pluribus failed to %(op)s %(resource)s "
+                                  "%(id)s during synchronization"),
+                              {'op': op, 'resource': resource,
+                               'id': obj.get('id') or obj.get('router_id')})
+                summary['failed'] += 1
+
+        self._apply_ports(port_op, ports, summary)
+
+    def _apply_ports(self, op, ports, summary):
+        if not ports:
+            return
+        ports = [schema.build('%s_port' % op, port) for port in ports]
+        try:
+            results = getattr(self.server, '%s_ports' % op)(ports=ports)
+        except Exception:
+            LOG.exception(_LE("Pluribus failed to %(op)s %(count)d ports "
+                              "during synchronization"),
+                          {'op': op, 'count': len(ports)})
+            summary['failed'] += len(ports)
+            return
+
+        failed = dict((port_id, error)
+                      for port_id, error in (results or {}).items() if error)
+        for port_id, error in failed.items():
+            LOG.error(_LE("Pluribus failed to %(op)s port %(id)s during "
+                          "synchronization: %(error)s"),
+                      {'op': op, 'id': port_id, 'error': error})
+        summary[op] += len(ports) - len(failed)
+        summary['failed'] += len(failed)
+
+
+def main():
+    common_config.init(sys.argv[1:])
+    common_config.setup_logging()
+    # the plugins are loaded to read the database, their driver must not
+    # start a synchronization of its own
+    cfg.CONF.set_override('sync_on_startup', False, 'PLURIBUS_PLUGINS')
+    summary = Synchronizer(pn_client.get_client()).sync()
+    if summary['failed']:
+        sys.exit(1)
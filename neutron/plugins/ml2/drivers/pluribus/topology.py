@@ -0,0 +1,140 @@
+# COPYRIGHT 2015 Pluribus Networks Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import time
+
+from oslo.config import cfg
+
+from neutron.callbacks import events
+from neutron.callbacks import registry
+from neutron.callbacks import resources
+from neutron.openstack.common import log as logging
+from neutron.plugins.ml2.drivers.pluribus import config  # noqa
+
+LOG = logging.getLogger(__name__)
+
+_cache = None
+
+
+def get_cache():
+    """Return the topology cache shared by the Pluribus plugins of this
+    process.
+    """
+    global _cache
+    if _cache is None:
+        _cache = TopologyCache(
+            cfg.CONF.PLURIBUS_PLUGINS.topology_cache_size,
+            cfg.CONF.PLURIBUS_PLUGINS.topology_cache_ttl)
+        _cache.subscribe()
+    return _cache
+
+
+class TopologyCache(object):
+
+    """Process-local LRU cache of the router topology.
+
+    Holds ports and subnets by id and the gateway ports of routers, the
+    objects the L3 plugin reads to find a router's interfaces, their
+    CIDRs and the fixed port and subnet of floating IPs. At most
+    max_entries objects are kept, the least recently used go first; 0
+    disables the cache. Entries are dropped on the Neutron callback
+    events about ports and routers and by the plugins after their own
+    writes. Those only reach this process, so an entry is also read
+    again once it is ttl seconds old, which bounds how long a change
+    made by another API worker goes unseen; a ttl of 0 keeps entries
+    until they are dropped. Cached objects are shared, callers must not
+    modify them.
+    """
+
+    def __init__(self, max_entries, ttl=0):
+        self._max_entries = max_entries
+        self._ttl = ttl
+        # key -> (object, time it was loaded)
+        self._entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, load):
+        """Return the object cached under key, calling load() to read it
+        from the database on a miss.
+        """
+        if self._max_entries <= 0:
+            return load()
+        now = time.time()
+        value, loaded_at = self._entries.pop(key, (None, None))
+        if loaded_at is not None and (self._ttl <= 0 or
+                                      now - loaded_at < self._ttl):
+            self.hits += 1
+        else:
+            self.misses += 1
+            value, loaded_at = load(), now
+            while len(self._entries) >= self._max_entries:
+                self._entries.popitem(last=False)
+        # most recently used last
+        self._entries[key] = (value, loaded_at)
+        return value
+
+    def get_port(self, port_id, load):
+        return self.get(('port', port_id), load)
+
+    def get_subnet(self, subnet_id, load):
+        return self.get(('subnet', subnet_id), load)
+
+    def get_gateway_ports(self, router_id, load):
+        return self.get(('gateway', router_id), load)
+
+    def invalidate(self, key):
+        self._entries.pop(key, None)
+
+    def invalidate_port(self, port):
+        """Drop a port and the gateway ports of the router it belongs to.
+
+        port is a port dict or a port id.
+        """
+        if isinstance(port, dict):
+            self.invalidate(('gateway', port.get('device_id')))
+            port = port.get('id')
+        self.invalidate(('port', port))
+
+    def invalidate_router(self, router_id):
+        self.invalidate(('gateway', router_id))
+
+    def invalidate_subnet(self, subnet_id):
+        self.invalidate(('subnet', subnet_id))
+
+    def clear(self):
+        self._entries.clear()
+
+    def subscribe(self):
+        for resource in (resources.PORT, resources.ROUTER,
+                         resources.ROUTER_GATEWAY,
+                         resources.ROUTER_INTERFACE):
+            for event in (events.AFTER_CREATE, events.AFTER_UPDATE,
+                          events.BEFORE_DELETE, events.AFTER_DELETE):
+                registry.subscribe(self._on_event, resource, event)
+
+    def _on_event(self, resource, event, trigger, **kwargs):
+        LOG.debug("Pluribus topology cache got %(event)s for %(resource)s",
+                  {'event': event, 'resource': resource})
+        port = kwargs.get('port')
+        if port is not None:
+            self.invalidate_port(port)
+        if kwargs.get('port_id'):
+            self.invalidate_port(kwargs['port_id'])
+        router_id = kwargs.get('router_id')
+        if router_id is None and resource == resources.ROUTER:
+            router_id = (kwargs.get('router') or {}).get('id')
+        if router_id:
+            self.invalidate_router(router_id)
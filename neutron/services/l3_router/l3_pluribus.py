@@ -12,20 +12,29 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-from oslo.config import cfg
+import collections
 import logging
 
+from oslo.config import cfg
+
+from neutron import context as n_context
 from neutron import manager
 from neutron.api.v2 import attributes
 from neutron.common import constants as const
+from neutron.common import exceptions as n_exc
 from neutron.db import db_base_plugin_v2
 from neutron.db import extraroute_db
 from neutron.db import l3_gwmode_db
 from neutron.db import l3_db
-from neutron.i18n import _LI, _LE
-from oslo.utils import importutils
+from neutron.i18n import _LE, _LI, _LW
+from neutron.openstack.common import loopingcall
 from neutron.plugins.common import constants
+from neutron.plugins.ml2.drivers.pluribus import client as pn_client
 from neutron.plugins.ml2.drivers.pluribus import config  # noqa
+from neutron.plugins.ml2.drivers.pluribus import db as pn_db
+from neutron.plugins.ml2.drivers.pluribus import dispatch
+from neutron.plugins.ml2.drivers.pluribus import schema
+from neutron.plugins.ml2.drivers.pluribus import topology
 
 LOG = logging.getLogger(__name__)
 
@@ -39,13 +48,32 @@ class PluribusRouterPlugin(db_base_plugin_v2.NeutronDbPluginV2,
     related to L3 routing.
     """
 
-    supported_extension_aliases = ["router"]
+    supported_extension_aliases = ["router", "extraroute"]
+
+    # set up by __init__ when async_routers is enabled
+    dispatcher = None
 
     def __init__(self):
 
         super(PluribusRouterPlugin, self).__init__()
-        self.server = importutils.\
-            import_object(cfg.CONF.PLURIBUS_PLUGINS['pn_api'])
+        self.server = pn_client.get_client()
+        self.topology = topology.get_cache()
+        # port updates sent to the switch and skipped as redundant
+        self.port_update_stats = collections.Counter()
+        interval = cfg.CONF.PLURIBUS_PLUGINS['port_update_report_interval']
+        if interval > 0:
+            self._report_task = loopingcall.FixedIntervalLoopingCall(
+                self._report_port_updates)
+            self._report_task.start(interval, initial_delay=interval)
+        if cfg.CONF.PLURIBUS_PLUGINS['async_routers']:
+            self.dispatcher = dispatch.OrderedDispatcher(
+                cfg.CONF.PLURIBUS_PLUGINS['dispatch_workers'])
+
+    def _report_port_updates(self):
+        LOG.info(_LI("Pluribus port updates: %(forwarded)d sent to the "
+                     "switch, %(redundant)d skipped as redundant"),
+                 {'forwarded': self.port_update_stats['forwarded'],
+                  'redundant': self.port_update_stats['redundant']})
 
     @property
     def core_plugin(self):
@@ -61,6 +89,84 @@ class PluribusRouterPlugin(db_base_plugin_v2.NeutronDbPluginV2,
                 " Openstack across multiple compute nodes or the"
                 " same compute node.")
 
+    @staticmethod
+    def _lookups(context):
+        # lookup cache living as long as the API request of context
+        cache = getattr(context, '_pluribus_lookups', None)
+        if cache is None:
+            cache = context._pluribus_lookups = {}
+        return cache
+
+    def _cached(self, context, key, load):
+        cache = self._lookups(context)
+        if key not in cache:
+            cache[key] = load()
+        return cache[key]
+
+    def _invalidate_ports(self, context):
+        """Drop the cached port lookups, called after every port or
+        router write made while serving the request.
+        """
+        cache = self._lookups(context)
+        for key in [key for key in cache if key[0] == 'ports']:
+            del cache[key]
+
+    def _get_cached_subnet(self, context, subnet_id, shared=True):
+        """Return a subnet, read once per request.
+
+        With shared False the process wide topology cache is skipped, the
+        subnet is then read from the database.
+        """
+        def load():
+            return self.get_subnet(context, subnet_id)
+
+        if not shared:
+            return self._cached(context, ('subnet', 'db', subnet_id), load)
+        return self._cached(context, ('subnet', subnet_id),
+                            lambda: self.topology.get_subnet(subnet_id,
+                                                             load))
+
+    def _get_cached_port(self, context, port_id):
+        return self._cached(context, ('ports', 'id', port_id),
+                            lambda: self.topology.get_port(
+                                port_id,
+                                lambda: self.get_port(context, port_id)))
+
+    def _dispatch(self, context, router_id, pending, func, payload,
+                  on_active=None, on_error=None):
+        """Queue func(**payload) behind any pending switch work on the
+        same router.
+
+        The router is set to the pending status until the switch has
+        answered. Then on_active or on_error is called with an admin
+        context, by default they record ACTIVE or ERROR as its status.
+        """
+        pn_db.set_router_status(router_id, pending, context)
+
+        def done(status):
+            hook = on_active if status == dispatch.ACTIVE else on_error
+            admin_context = n_context.get_admin_context()
+            if hook is not None:
+                hook(admin_context)
+            else:
+                pn_db.set_router_status(router_id, status, admin_context)
+            LOG.debug("Pluribus %(method)s for router %(id)s finished "
+                      "with %(status)s",
+                      {'method': getattr(func, '__name__', func),
+                       'id': router_id, 'status': status})
+
+        self.dispatcher.dispatch(router_id, func, payload, callback=done)
+
+    def _wait_router(self, *router_ids):
+        """With async_routers, wait for the requests queued on the given
+        routers before sending one that must follow them.
+        """
+        if self.dispatcher is None:
+            return
+        for router_id in set(router_ids):
+            if router_id is not None:
+                self.dispatcher.wait(router_id)
+
     def create_router_db(self, context, router):
         return super(PluribusRouterPlugin, self).create_router(context,
                                                                router)
@@ -69,8 +175,28 @@ class PluribusRouterPlugin(db_base_plugin_v2.NeutronDbPluginV2,
         LOG.debug(('create_router() called', router))
 
         r = self.create_router_db(context, router)
+        if self.dispatcher is not None:
+            def rollback(admin_context):
+                LOG.error(_LE("Failed to create router %s, rolling back"),
+                          r['id'])
+                try:
+                    self.delete_router_db(admin_context, r['id'])
+                except Exception:
+                    # interfaces were added while it was pending, the
+                    # user has to delete it
+                    pn_db.set_router_status(r['id'], constants.ERROR,
+                                            admin_context)
+                    raise
+
+            payload = schema.build('create_router', r)
+            r['status'] = constants.PENDING_CREATE
+            self._dispatch(context, r['id'], constants.PENDING_CREATE,
+                           self.server.create_router, payload,
+                           on_error=rollback)
+            return r
+
         try:
-            self.server.create_router(**r)
+            self.server.create_router(**schema.build('create_router', r))
             LOG.info(_LI("Pluribus successfully created router %s" % r['id']))
 
         except Exception as e:
@@ -85,8 +211,20 @@ class PluribusRouterPlugin(db_base_plugin_v2.NeutronDbPluginV2,
 
     def delete_router(self, context, id):
         LOG.debug("delete_router() called")
-        self.delete_router_db(context, id)
         r = {'router_id': id}
+        if self.dispatcher is not None:
+            # the router is removed from the database once the switch has
+            # deleted it, refuse now what the removal would refuse then
+            self._ensure_router_not_in_use(context, id)
+            self.topology.invalidate_router(id)
+            self._dispatch(context, id, constants.PENDING_DELETE,
+                           self.server.delete_router, r,
+                           on_active=lambda admin_context:
+                           self.delete_router_db(admin_context, id))
+            return
+
+        self.delete_router_db(context, id)
+        self.topology.invalidate_router(id)
         try:
             self.server.delete_router(**r)
             LOG.info(_LI("Pluribus successfully deleted router %s" % id))
@@ -97,31 +235,74 @@ class PluribusRouterPlugin(db_base_plugin_v2.NeutronDbPluginV2,
     def update_router(self, context, id, router):
         LOG.debug(("update_router() called", id, router))
 
+        body = router['router']
+        old_routes = None
+        if 'routes' in body:
+            old_routes = self._get_extra_routes_by_router_id(context, id)
+
+        if set(body) == set(['routes']):
+            # only the routes change, the vrouter itself is left alone
+            updt_router = super(PluribusRouterPlugin, self).\
+                update_router(context, id, router)
+            payload = {}
+        else:
+            updt_router = self._update_router_gateway(context, id, router)
+            payload = schema.build('update_router', updt_router)
+
+        added, removed = [], []
+        if old_routes is not None:
+            added, removed = schema.route_delta(
+                old_routes, updt_router.get('routes', []))
+            if not (payload or added or removed):
+                return updt_router
+
+        def update_router(**kwargs):
+            if kwargs:
+                self.server.update_router(**kwargs)
+            self._update_routes(id, added, removed)
+
+        if self.dispatcher is not None:
+            updt_router['status'] = constants.PENDING_UPDATE
+            self._dispatch(context, id, constants.PENDING_UPDATE,
+                           update_router, payload)
+            return updt_router
+
+        try:
+            update_router(**payload)
+            LOG.info(_LI("Pluribus updated the router successfully %s" % id))
+        except Exception as e:
+            LOG.error(_LE("Failed to update the router %s" % id))
+            raise e
+
+        return updt_router
+
+    def _update_router_gateway(self, context, id, router):
+        # the gateway ports are read from the database rather than the
+        # topology cache, a port changed by another worker would have the
+        # wrong port deleted or updated
         ext_gw_subnet_info = None
-        if self.router_has_external_gateway(context, id):
-            ext_gw_subnet_info = self.get_router_external_subnet_info(context,
-                                                                      id)
+        if self.router_has_external_gateway(context, id, shared=False):
+            ext_gw_subnet_info = self.get_router_external_subnet_info(
+                context, id, shared=False)
 
         updt_router = super(PluribusRouterPlugin, self).\
             update_router(context, id, router)
+        self.topology.invalidate_router(id)
+        self._invalidate_ports(context)
 
         LOG.debug(("updated_router = ", updt_router))
 
         if updt_router['external_gateway_info'] is not None:
 
-            # get the external subnet id
-            device_filter = {'device_id': [id],
-                             'device_owner': ["network:router_gateway"]}
-            ext_port_list = self.get_ports(context, filters=device_filter)
-            LOG.debug(('external port = ', ext_port_list))
-            ext_port = ext_port_list[0]
-            ext_subnet_id = ext_port['fixed_ips'][0]['subnet_id']
+            # a copy, the cached port is shared
+            ext_port = dict(self.get_external_port_info(
+                context, id, shared=False)[0])
 
             updt_router['external_port'] = []
 
             # assign a IP address
-            ports = self.create_port_on_external_network(context, id,
-                                                         updt_router['name'])
+            ports = self.create_port_on_external_network(
+                context, id, updt_router['name'], shared=False)
 
             port_info = {'network_id': ports['network_id'],
                          'port': ports}
@@ -134,22 +315,36 @@ class PluribusRouterPlugin(db_base_plugin_v2.NeutronDbPluginV2,
             LOG.debug(('setting external gateway to None'))
 
             if ext_gw_subnet_info is not None:
-                all_ports = self.get_ports(context)
-
                 # remove the port
                 port_name = ext_gw_subnet_info['name'] + id
-                self.delete_ports_with_name(context, all_ports, port_name)
+                self.delete_ports_with_name(context,
+                                            ext_gw_subnet_info['network_id'],
+                                            port_name)
                 updt_router['external_gw_cidr'] = ext_gw_subnet_info['cidr']
 
-        try:
-            self.server.update_router(**updt_router)
-            LOG.info(_LI("Pluribus updated the router successfully %s" % id))
-        except Exception as e:
-            LOG.error(_LE("Failed to update the router %s" % id))
-            raise e
-
         return updt_router
 
+    def _update_routes(self, router_id, added, removed):
+        """Program the routes added to and removed from a router."""
+        if not (added or removed):
+            return
+        if not (self.server.supports('add_router_routes') and
+                self.server.supports('remove_router_routes')):
+            LOG.warn(_LW("pn_api does not program extra routes, router %s "
+                         "routes are only recorded"), router_id)
+            return
+
+        LOG.debug("Pluribus router %(id)s routes: %(added)d added, "
+                  "%(removed)d removed",
+                  {'id': router_id, 'added': len(added),
+                   'removed': len(removed)})
+        # removed first, a route whose nexthop changed is in both
+        if removed:
+            self.server.remove_router_routes(router_id=router_id,
+                                             routes=removed)
+        if added:
+            self.server.add_router_routes(router_id=router_id, routes=added)
+
     def add_router_interface_db(self, context, router_id, interface_info):
         return super(PluribusRouterPlugin, self).\
             add_router_interface(context, router_id, interface_info)
@@ -160,7 +355,8 @@ class PluribusRouterPlugin(db_base_plugin_v2.NeutronDbPluginV2,
 
         if 'subnet_id' in interface_info:
             # get the subnet information and the network it belongs to
-            sbn = self.get_subnet(context, interface_info['subnet_id'])
+            sbn = self._get_cached_subnet(context,
+                                          interface_info['subnet_id'])
 
             LOG.debug(("subnet", sbn))
             network_id = sbn['network_id']
@@ -168,19 +364,7 @@ class PluribusRouterPlugin(db_base_plugin_v2.NeutronDbPluginV2,
             cidr = sbn['cidr']
 
             if not sbn['gateway_ip']:
-                fixed_ip = {'subnet_id': sbn['id']}
-                port_name = sbn['name'] + router_id
-                port_data = {
-                    'tenant_id': sbn['tenant_id'],
-                    'name': port_name,
-                    'network_id': sbn['network_id'],
-                    'mac_address': attributes.ATTR_NOT_SPECIFIED,
-                    'admin_state_up': False,
-                    'device_id': '',
-                    'device_owner': '',
-                    'fixed_ips': [fixed_ip]
-                }
-
+                port_data = self._gateway_port_data(sbn, router_id)
                 ports = self.core_plugin.create_port(context,
                                                      {'port': port_data})
 
@@ -189,13 +373,12 @@ class PluribusRouterPlugin(db_base_plugin_v2.NeutronDbPluginV2,
             else:
                 interface_ip = sbn['gateway_ip']
         elif 'port_id' in interface_info:
-            pfilter = {'id': [interface_info['port_id']]}
-            port = self.get_ports(context, filters=pfilter)
-            network_id = port[0]['network_id']
-            subnet_id = port[0]['fixed_ips'][0]['subnet_id']
-            sbn = self.get_subnet(context, subnet_id)
+            port = self._get_cached_port(context, interface_info['port_id'])
+            network_id = port['network_id']
+            subnet_id = port['fixed_ips'][0]['subnet_id']
+            sbn = self._get_cached_subnet(context, subnet_id)
             cidr = sbn['cidr']
-            interface_ip = port[0]['fixed_ips'][0]['ip_address']
+            interface_ip = port['fixed_ips'][0]['ip_address']
             use_specific_ip = True
 
         router = {'network_id': network_id,
@@ -208,6 +391,68 @@ class PluribusRouterPlugin(db_base_plugin_v2.NeutronDbPluginV2,
 
         return router
 
+    @staticmethod
+    def _gateway_port_data(sbn, router_id):
+        # port giving the router an address on a subnet without gateway ip
+        return {
+            'tenant_id': sbn['tenant_id'],
+            'name': sbn['name'] + router_id,
+            'network_id': sbn['network_id'],
+            'mac_address': attributes.ATTR_NOT_SPECIFIED,
+            'admin_state_up': False,
+            'device_id': '',
+            'device_owner': '',
+            'fixed_ips': [{'subnet_id': sbn['id']}]
+        }
+
+    def _get_routers_info(self, context, router_id, interfaces):
+        """Bulk version of _get_router_info.
+
+        Returns the router interfaces to plug and the gateway ports
+        created for them.
+        """
+        port_ids = [i['port_id'] for i in interfaces if 'subnet_id' not in i]
+        ports = {}
+        if port_ids:
+            ports = dict((p['id'], p) for p in
+                         self.get_ports(context, filters={'id': port_ids}))
+
+        subnet_ids = [i['subnet_id'] if 'subnet_id' in i else
+                      ports[i['port_id']]['fixed_ips'][0]['subnet_id']
+                      for i in interfaces]
+        subnets = dict((s['id'], s) for s in
+                       self.get_subnets(context, filters={'id': subnet_ids}))
+
+        port_data = [{'port': self._gateway_port_data(subnets[s], router_id)}
+                     for i, s in zip(interfaces, subnet_ids)
+                     if 'subnet_id' in i and not subnets[s]['gateway_ip']]
+        gateway_ports = []
+        if port_data:
+            gateway_ports = self.core_plugin.create_port_bulk(
+                context, {'ports': port_data})
+        gateway_ips = dict((p['fixed_ips'][0]['subnet_id'],
+                            p['fixed_ips'][0]['ip_address'])
+                           for p in gateway_ports)
+
+        routers = []
+        for interface_info, subnet_id in zip(interfaces, subnet_ids):
+            sbn = subnets[subnet_id]
+            router = {'network_id': sbn['network_id'],
+                      'router_id': router_id,
+                      'cidr': sbn['cidr'],
+                      'subnet_id': subnet_id}
+            if 'subnet_id' in interface_info:
+                router['interface_ip'] = (sbn['gateway_ip'] or
+                                          gateway_ips[subnet_id])
+            else:
+                port = ports[interface_info['port_id']]
+                router['network_id'] = port['network_id']
+                router['interface_ip'] = port['fixed_ips'][0]['ip_address']
+                router['use_specific_ip'] = True
+            routers.append(router)
+
+        return routers, gateway_ports
+
     def add_router_interface(self, context, router_id, interface_info):
         LOG.debug(("add_router_interface() called", interface_info))
 
@@ -215,6 +460,7 @@ class PluribusRouterPlugin(db_base_plugin_v2.NeutronDbPluginV2,
         router = self._get_router_info(context, router_id, interface_info)
 
         try:
+            self._wait_router(router_id)
             self.server.plug_router_interface(**router)
             LOG.info(_LI("Pluribus added the router interface successfully"
                          "on subnet %s" % router['subnet_id']))
@@ -231,18 +477,81 @@ class PluribusRouterPlugin(db_base_plugin_v2.NeutronDbPluginV2,
 
         return info
 
+    def add_router_interfaces(self, context, router_id, interfaces):
+        """Attach several subnets or ports to a router in one operation,
+        for tools calling the plugin directly; the router_interface
+        action of the l3 extension takes a single interface.
+
+        interfaces is a list of interface_info dicts as taken by
+        add_router_interface. The subnets are read with one query, the
+        gateway ports needed are created together and the switch is
+        programmed with a single plug_router_interfaces request. If any
+        of it fails, everything done so far is undone.
+        """
+        LOG.debug(("add_router_interfaces() called", interfaces))
+
+        added, gateway_ports = [], []
+        try:
+            infos = []
+            for interface_info in interfaces:
+                infos.append(self.add_router_interface_db(context, router_id,
+                                                          interface_info))
+                added.append(interface_info)
+            routers, gateway_ports = self._get_routers_info(context,
+                                                            router_id,
+                                                            interfaces)
+            self._plug_router_interfaces(router_id, routers)
+            LOG.info(_LI("Pluribus added %(count)d interfaces to router "
+                         "%(id)s"), {'count': len(routers), 'id': router_id})
+        except Exception as e:
+            LOG.error(_LE('add router interfaces failed, rolling back for'
+                          ' router %s' % router_id))
+            for port in gateway_ports:
+                self.core_plugin.delete_port(context, port['id'])
+            for interface_info in reversed(added):
+                super(PluribusRouterPlugin, self).\
+                    remove_router_interface(context, router_id,
+                                            interface_info)
+            raise e
+
+        pn_db.set_router_ports_status(router_id,
+                                      [r['subnet_id'] for r in routers],
+                                      const.PORT_STATUS_ACTIVE, context)
+        return infos
+
+    def _plug_router_interfaces(self, router_id, routers):
+        if self.server.supports('plug_router_interfaces'):
+            self.server.plug_router_interfaces(router_id=router_id,
+                                               interfaces=routers)
+            return
+
+        # one request per interface, unplug the ones done on failure
+        plugged = []
+        try:
+            for router in routers:
+                self.server.plug_router_interface(**router)
+                plugged.append(router)
+        except Exception:
+            for router in plugged:
+                try:
+                    self.server.unplug_router_interface(
+                        network_id=router['network_id'],
+                        router_id=router_id,
+                        subnet_id=router['subnet_id'],
+                        cidr=router['cidr'])
+                except Exception:
+                    LOG.exception(_LE("Failed to unplug the interface of "
+                                      "router %(router)s on subnet "
+                                      "%(subnet)s"),
+                                  {'router': router_id,
+                                   'subnet': router['subnet_id']})
+            raise
+
     def set_port_status_active(self, context, router_id, subnet_id):
-        device_filter = {'device_id': [router_id]}
-        router_ports = self.get_ports(context, filters=device_filter)
-        for p in router_ports:
-            fa = p['fixed_ips']
-            for addr in fa:
-                if addr['subnet_id'] == subnet_id:
-                    p['status'] = const.PORT_STATUS_ACTIVE
-                    port_info = {}
-                    port_info['port'] = p
-                    self.core_plugin.update_port(context, p['id'], port_info)
-                    break
+        # straight in the database, a port update would run the mechanism
+        # drivers and send the switch an update for a status change only
+        pn_db.set_router_ports_status(router_id, [subnet_id],
+                                      const.PORT_STATUS_ACTIVE, context)
 
     def remove_router_interface_db(self, context, router_id, interface_info):
         super(PluribusRouterPlugin, self).remove_router_interface(
@@ -257,18 +566,20 @@ class PluribusRouterPlugin(db_base_plugin_v2.NeutronDbPluginV2,
                          ' present'))
                 return
 
-            pfilter = {'id': [interface_info['port_id']]}
-            port = self.get_ports(context, filters=pfilter)
-            if not port:
+            try:
+                port = self._get_cached_port(context,
+                                             interface_info['port_id'])
+            except n_exc.PortNotFound:
                 LOG.warn(_LW("remove router interface, unable to find port"))
                 return
 
-            subnet_id = port[0]['fixed_ips'][0]['subnet_id']
+            subnet_id = port['fixed_ips'][0]['subnet_id']
+            self.topology.invalidate_port(port)
         else:
             subnet_id = interface_info['subnet_id']
 
         self.remove_router_interface_db(context, router_id, interface_info)
-        subnet = self.get_subnet(context, subnet_id)
+        subnet = self._get_cached_subnet(context, subnet_id)
 
         router = {'network_id': subnet['network_id'],
                   'router_id': router_id,
@@ -278,10 +589,11 @@ class PluribusRouterPlugin(db_base_plugin_v2.NeutronDbPluginV2,
         # delete the gateway ip which might have been created
         if not subnet['gateway_ip']:
             port_name = subnet['name'] + router_id
-            ports = self.get_ports(context)
-            self.delete_ports_with_name(context, ports, port_name)
+            self.delete_ports_with_name(context, subnet['network_id'],
+                                        port_name)
 
         try:
+            self._wait_router(router_id)
             self.server.unplug_router_interface(**router)
             LOG.info(_LI("Pluribus removed the router interface successfully"
                      "from router %s on subnet %s" % (router_id, subnet_id)))
@@ -290,42 +602,55 @@ class PluribusRouterPlugin(db_base_plugin_v2.NeutronDbPluginV2,
                       ' subnet %s' % (router_id, subnet_id)))
             raise e
 
-    def get_external_port_info(self, context, router_id):
+    def get_external_port_info(self, context, router_id, shared=True):
         LOG.debug(('get_external_port_info ', router_id))
 
         device_filter = {'device_id': [router_id],
                          'device_owner': ["network:router_gateway"]}
-        ext_ports = self.get_ports(context, filters=device_filter)
+
+        def load():
+            return self.get_ports(context, filters=device_filter)
+
+        if shared:
+            ext_ports = self._cached(
+                context, ('ports', 'gateway', router_id),
+                lambda: self.topology.get_gateway_ports(router_id, load))
+        else:
+            # skip the topology cache, still read once per request
+            ext_ports = self._cached(
+                context, ('ports', 'gateway', 'db', router_id), load)
         LOG.debug(('external port = ', ext_ports))
         return ext_ports
 
-    def router_has_external_gateway(self, context, router_id):
+    def router_has_external_gateway(self, context, router_id, shared=True):
         LOG.debug(('router_has_external_gateway ', router_id))
 
-        ext_ports = self.get_external_port_info(context, router_id)
+        ext_ports = self.get_external_port_info(context, router_id, shared)
         # if there is no external gateway return
         return True if len(ext_ports) else False
 
-    def get_router_external_subnet_info(self, context, router_id):
+    def get_router_external_subnet_info(self, context, router_id,
+                                        shared=True):
         LOG.debug(('get_router_external_subnet_info ', router_id))
 
-        ext_ports = self.get_external_port_info(context, router_id)
+        ext_ports = self.get_external_port_info(context, router_id, shared)
 
         # get the external subnet_id
         ext_subnet_id = ext_ports[0]['fixed_ips'][0]['subnet_id']
 
-        return self.get_subnet(context, ext_subnet_id)
+        return self._get_cached_subnet(context, ext_subnet_id, shared)
 
-    def create_port_on_external_network(self, context, router_id, name):
+    def create_port_on_external_network(self, context, router_id, name,
+                                        shared=True):
         LOG.debug(('create_port_on_external_network ', router_id))
 
         # get the network id of the external gateway
-        ext_ports = self.get_external_port_info(context, router_id)
+        ext_ports = self.get_external_port_info(context, router_id, shared)
         LOG.debug(('external port = ', ext_ports))
 
         # get the subnet associated with the external subnet
-        ext_subnet_info = self.get_router_external_subnet_info(context,
-                                                               router_id)
+        ext_subnet_info = self.get_router_external_subnet_info(
+            context, router_id, shared)
         ext_subnet_id = ext_subnet_info['id']
         fixed_ip = {'subnet_id': ext_subnet_id}
 
@@ -345,17 +670,22 @@ class PluribusRouterPlugin(db_base_plugin_v2.NeutronDbPluginV2,
         }
 
         ports = self.core_plugin.create_port(context, {'port': port_data})
+        self._invalidate_ports(context)
 
         ports['cidr'] = ext_subnet_info['cidr']
 
         return ports
 
-    def delete_ports_with_name(self, context, port_list, port_name):
+    def delete_ports_with_name(self, context, network_id, port_name):
         LOG.debug(('delete_ports_with_name : ', port_name))
-        for p in port_list:
-            if port_name == p['name']:
-                LOG.debug(('deleting port with name, id ', p['name'], p['id']))
-                self.core_plugin.delete_port(context, p['id'])
+        # the network_id index narrows the lookup down to the ports of one
+        # network instead of loading every port of the deployment
+        pfilter = {'network_id': [network_id], 'name': [port_name]}
+        for p in self.get_ports(context, filters=pfilter, fields=['id']):
+            LOG.debug(('deleting port with name, id ', port_name, p['id']))
+            self.core_plugin.delete_port(context, p['id'])
+            self.topology.invalidate_port(p['id'])
+            self._invalidate_ports(context)
 
     def update_port(self, context, id, port):
         """
@@ -363,12 +693,31 @@ class PluribusRouterPlugin(db_base_plugin_v2.NeutronDbPluginV2,
         plugins.
         """
         LOG.debug(("update_port() called"))
+        # status only updates, like the ones made by update_router, change
+        # nothing the switch programs; the original is read from the
+        # database, the cache may lag behind a write made elsewhere
+        original = None
+        if set(port['port']) & set(schema.FIELDS['port']):
+            original = self.get_port(context, id)
+
         updated_port = super(PluribusRouterPlugin, self).update_port(
             context, id, port)
+        self.topology.invalidate_port(updated_port)
+        self._invalidate_ports(context)
 
         LOG.debug(("updated port =", updated_port))
 
-        self.server.update_port(**updated_port)
+        changes = None
+        if original is not None:
+            changes = schema.changes('update_port', updated_port, original)
+        if changes is None:
+            self.port_update_stats['redundant'] += 1
+            LOG.debug("Pluribus skipping update of port %s, nothing changed "
+                      "on the switch", id)
+            return updated_port
+
+        self.port_update_stats['forwarded'] += 1
+        self.server.update_port(**changes)
 
         return updated_port
 
@@ -378,7 +727,9 @@ class PluribusRouterPlugin(db_base_plugin_v2.NeutronDbPluginV2,
                                                                   floatingip)
 
         try:
-            self.server.create_floatingip(**fip)
+            self._wait_router(fip['router_id'])
+            self.server.create_floatingip(
+                **schema.build('create_floatingip', fip))
             LOG.info(_LI('Pluribus created floating IP successfully %s' %
                      fip['id']))
         except Exception as e:
@@ -390,8 +741,71 @@ class PluribusRouterPlugin(db_base_plugin_v2.NeutronDbPluginV2,
 
         return fip
 
+    def create_floatingips(self, context, floatingips):
+        """Create and associate a batch of floating IPs, for tools such as
+        tenant migrations calling the plugin directly; the floatingips API
+        resource of the l3 extension takes no bulk requests.
+
+        floatingips is a list of {'floatingip': {...}} bodies. Returns the
+        floating IPs created and a dict mapping the id of every floating
+        IP the switch failed to create, and which was deleted again, to
+        the error it reported. If one of them cannot be allocated, the
+        ones allocated before it are deleted and nothing is sent to the
+        switch.
+        """
+        LOG.debug(("create_floatingips", len(floatingips)))
+        # each floating IP is allocated in its own transaction, like
+        # create_floatingip does: its external port is created through
+        # the core plugin, whose mechanism drivers call the switch and
+        # must not do so with a transaction held open
+        fips = []
+        try:
+            for floatingip in floatingips:
+                fips.append(super(PluribusRouterPlugin, self).
+                            create_floatingip(context, floatingip))
+        except Exception as e:
+            LOG.error(_LE("Failed to allocate floating IP %(index)d of "
+                          "%(count)d, rolling back"),
+                      {'index': len(fips) + 1, 'count': len(floatingips)})
+            for fip in fips:
+                super(PluribusRouterPlugin, self).delete_floatingip(
+                    context, fip['id'])
+            raise e
+
+        payload = [schema.build('create_floatingip', fip) for fip in fips]
+        self._wait_router(*[fip['router_id'] for fip in fips])
+        if self.server.supports('create_floatingips'):
+            try:
+                results = self.server.create_floatingips(floatingips=payload)
+            except Exception as e:
+                results = dict((fip['id'], str(e)) for fip in fips)
+            failed = dict((fip_id, error)
+                          for fip_id, error in (results or {}).items()
+                          if error)
+        else:
+            failed = {}
+            for fip in payload:
+                try:
+                    self.server.create_floatingip(**fip)
+                except Exception as e:
+                    failed[fip['id']] = str(e)
+
+        for fip_id, error in failed.items():
+            LOG.error(_LE("Pluribus failed to create floating IP %(id)s: "
+                          "%(error)s, rolling back"),
+                      {'id': fip_id, 'error': error})
+            super(PluribusRouterPlugin, self).delete_floatingip(context,
+                                                                fip_id)
+        LOG.info(_LI("Pluribus created %(count)d floating IPs, "
+                     "%(failed)d failed"),
+                 {'count': len(fips) - len(failed), 'failed': len(failed)})
+        return [fip for fip in fips if fip['id'] not in failed], failed
+
     def update_floatingip(self, context, id, floatingip):
         LOG.debug(("update_floatingip", id, floatingip))
+        old_router_id = None
+        if self.dispatcher is not None:
+            old_router_id = self._get_floatingip(context, id)['router_id']
         # get the floating ip information
         ufip = super(PluribusRouterPlugin, self).update_floatingip(context, id,
                                                                    floatingip)
@@ -401,7 +815,9 @@ class PluribusRouterPlugin(db_base_plugin_v2.NeutronDbPluginV2,
             subnet_id = self._get_floatingip_subnet(context, ufip)
             ufip['subnet_id'] = subnet_id
         try:
-            self.server.update_floatingip(**ufip)
+            self._wait_router(old_router_id, ufip['router_id'])
+            self.server.update_floatingip(
+                **schema.build('update_floatingip', ufip))
             LOG.info(_LI('Pluribus updated floating IP successfully %s' % id))
         except Exception as e:
             LOG.error(_LE('update_floatingip failed %s' % id))
@@ -410,10 +826,13 @@ class PluribusRouterPlugin(db_base_plugin_v2.NeutronDbPluginV2,
 
     def delete_floatingip(self, context, id):
         LOG.debug(("delete_floatingip", id))
+        # the switch of the router NATing the floating IP has to drop it
+        router_id = self._get_floatingip(context, id)['router_id']
 
         super(PluribusRouterPlugin, self).delete_floatingip(context, id)
-        fip = {'id': id}
+        fip = {'id': id, 'router_id': router_id}
         try:
+            self._wait_router(router_id)
             self.server.delete_floatingip(**fip)
             LOG.info(_LI('Pluribus deleted floating IP successfully %s' % id))
         except Exception as e:
@@ -422,31 +841,60 @@ class PluribusRouterPlugin(db_base_plugin_v2.NeutronDbPluginV2,
 
     def _get_floatingip_subnet(self, context, fip):
         LOG.debug(("get_floatingip_subnet ", fip))
-        pfilter = {'id': [fip['port_id']]}
-        ports = self.get_ports(context, filters=pfilter)
-        fixed_ip_list = ports[0]['fixed_ips']
+        fixed_ip_list = self._get_cached_port(context,
+                                              fip['port_id'])['fixed_ips']
         for f in fixed_ip_list:
             if fip['fixed_ip_address'] == f['ip_address']:
                 return f['subnet_id']
         return None
 
     def disassociate_floatingips(self, context, port_id, do_notify=True):
-        # determing the floating IP's id using port_id
-        floating_ip_ids = []
+        # the database is done with before the switch is called so that
+        # no lock is held while waiting on it
         with context.session.begin(subtransactions=True):
-            floating_ip = (context.session.query(l3_db.FloatingIP).
-                           filter_by(fixed_port_id=port_id))
-            for entry in floating_ip:
-                floating_ip_ids.append(entry['id'])
-                LOG.debug(("disassociate_floatingips", port_id))
-                super(PluribusRouterPlugin, self).disassociate_floatingips(
-                    context, port_id, do_notify)
-                fid = {'id': floating_ip_ids}
+            floating_ips = (context.session.query(l3_db.FloatingIP).
+                            filter_by(fixed_port_id=port_id))
+            # the floating IPs of each router, read before the router is
+            # cleared from them
+            floating_ip_ids = {}
+            for entry in floating_ips:
+                floating_ip_ids.setdefault(entry['router_id'],
+                                           []).append(entry['id'])
+            if not floating_ip_ids:
+                return set()
+            LOG.debug(("disassociate_floatingips", port_id))
+            router_ids = super(PluribusRouterPlugin, self).\
+                disassociate_floatingips(context, port_id, do_notify)
+
+        if context.session.is_active:
+            # the caller's transaction is still open, the switch is told
+            # once it has committed
+            def disassociate():
                 try:
-                    self.server.disassociate_floatingips(**fid)
-                    LOG.info(_LI('Pluribus disassociated floating IP'
-				 ' successfully %s' % fid['id']))
-                except Exception as e:
-                    LOG.error(_LE('disassociate_floatingips failed %s' %
+                    self._disassociate_floatingips(floating_ip_ids)
+                except Exception:
+                    # logged, the caller has committed and cannot be
+                    # failed any more
+                    return
+            pn_db.after_commit(context.session, disassociate)
+            return router_ids
+
+        self._disassociate_floatingips(floating_ip_ids)
+        return router_ids
+
+    def _disassociate_floatingips(self, floating_ip_ids):
+        # floating_ip_ids maps each router to the ids of its floating IPs,
+        # one request is sent per router. A retry after a failure finds
+        # the same floating ips again, the switch disassociates them
+        # whatever their state
+        for router_id, ids in floating_ip_ids.items():
+            fid = {'id': ids, 'router_id': router_id}
+            try:
+                self._wait_router(router_id)
+                self.server.disassociate_floatingips(**fid)
+                LOG.info(_LI('Pluribus disassociated floating IP'
+                             ' successfully %s' % fid['id']))
+            except Exception as e:
+                LOG.error(_LE('disassociate_floatingips failed %s' %
                               fid['id']))
-                    raise e
+                raise e
@@ -0,0 +1,132 @@
+# COPYRIGHT 2015 Pluribus Networks Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from neutron.i18n import _LE
+from neutron.openstack.common import log as logging
+from neutron.plugins.ml2.drivers.pluribus import dispatch
+from neutron.plugins.ml2.drivers.pluribus import schema
+
+LOG = logging.getLogger(__name__)
+
+POOL = 'pool'
+VIP = 'vip'
+MEMBER = 'member'
+HEALTH = 'health'
+
+
+def empty():
+    return {POOL: {}, VIP: {}, MEMBER: {}, HEALTH: {}}
+
+
+def _apply(graph, changes):
+    # a new graph, the applied one is kept for rollbacks
+    new = dict((kind, dict(objs)) for kind, objs in graph.items())
+    for (kind, obj_id), obj in changes.items():
+        if obj is None:
+            new[kind].pop(obj_id, None)
+        else:
+            new[kind][obj_id] = obj
+    return new
+
+
+def _payload(graph):
+    def build(kind):
+        return [schema.build('create_%s' % kind, obj)
+                for _, obj in sorted(graph[kind].items())]
+    pools, vips = build(POOL), build(VIP)
+    return {'pool': pools[0] if pools else None,
+            'vip': vips[0] if vips else None,
+            'members': build(MEMBER),
+            'monitors': build(HEALTH)}
+
+
+class GraphPusher(object):
+
+    """Pushes the load balancer configuration of a pool as one versioned
+    transaction.
+
+    The graph of a pool holds the pool, its VIP, its members and its
+    health monitors. Changes submitted within window seconds of each
+    other are merged into the graph load(pool_id) reads from the
+    database and sent to the switch together with one apply_pool_graph
+    request carrying the whole graph. Its version follows the one
+    get_pool_graph reports for the graph the switch last accepted, so
+    any worker can push and restarts lose nothing. If the request fails,
+    that last accepted graph is applied again with a single request and
+    the failed changes are dropped. done(pool_id, changes, status) is
+    called after each push with ACTIVE or ERROR.
+    """
+
+    def __init__(self, server, window, load, done):
+        self.server = server
+        self._load = load
+        self._done = done
+        self._updates = dispatch.UpdateCoalescer(window, self._push)
+
+    def submit(self, pool_id, kind, obj):
+        self._updates.submit(pool_id, {(kind, obj['id']): obj})
+
+    def remove(self, pool_id, kind, obj_id):
+        self._updates.submit(pool_id, {(kind, obj_id): None})
+
+    def forget(self, pool_id):
+        """Drop any change pending on a deleted pool."""
+        self._updates.discard(pool_id)
+
+    def _push(self, pool_id, changes):
+        try:
+            graph = self._load(pool_id)
+            applied = self.server.get_pool_graph(pool_id=pool_id) or {}
+        except Exception:
+            LOG.exception(_LE("Pluribus failed to read the graph of pool "
+                              "%s"), pool_id)
+            self._done(pool_id, changes, dispatch.ERROR)
+            return
+        if graph is None:
+            LOG.debug("Pluribus dropping %(count)d changes to deleted pool "
+                      "%(id)s", {'count': len(changes), 'id': pool_id})
+            return
+
+        version = applied.get('version') or 0
+        try:
+            self.server.apply_pool_graph(pool_id=pool_id,
+                                         version=version + 1,
+                                         graph=_payload(_apply(graph,
+                                                               changes)))
+        except Exception:
+            LOG.exception(_LE("Pluribus failed to apply version %(version)d "
+                              "of the graph of pool %(id)s, rolling back"),
+                          {'version': version + 1, 'id': pool_id})
+            self._rollback(pool_id, version, applied.get('graph'))
+            self._done(pool_id, changes, dispatch.ERROR)
+            return
+
+        LOG.debug("Pluribus applied version %(version)d of the graph of "
+                  "pool %(id)s with %(count)d changes",
+                  {'version': version + 1, 'id': pool_id,
+                   'count': len(changes)})
+        self._done(pool_id, changes, dispatch.ACTIVE)
+
+    def _rollback(self, pool_id, version, payload):
+        if not version:
+            # the switch never accepted a graph, it has nothing to go
+            # back to
+            return
+        try:
+            self.server.apply_pool_graph(pool_id=pool_id, version=version,
+                                         graph=payload)
+        except Exception:
+            LOG.exception(_LE("Pluribus failed to roll the graph of pool "
+                              "%(id)s back to version %(version)d"),
+                          {'id': pool_id, 'version': version})
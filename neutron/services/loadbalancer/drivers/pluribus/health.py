@@ -0,0 +1,150 @@
+# COPYRIGHT 2015 Pluribus Networks Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from neutron.db.loadbalancer import loadbalancer_db as ldb
+from neutron.i18n import _LE
+from neutron.i18n import _LW
+from neutron.openstack.common import log as logging
+from neutron.openstack.common import loopingcall
+from neutron.plugins.common import constants
+from neutron.plugins.ml2.drivers.pluribus import db as pn_db
+from neutron.plugins.ml2.drivers.pluribus import dispatch
+
+LOG = logging.getLogger(__name__)
+
+# health check results of the switch and the member status they give
+_STATUSES = {'UP': constants.ACTIVE,
+             'DOWN': constants.INACTIVE,
+             constants.ACTIVE: constants.ACTIVE,
+             constants.INACTIVE: constants.INACTIVE}
+
+# only members the switch has been configured with take its health,
+# pending and failed ones keep the status the driver gave them
+_HEALTH_STATUSES = (constants.ACTIVE, constants.INACTIVE)
+
+
+class MemberHealth(object):
+
+    """Records the health of the pool members seen by the switch.
+
+    Health check results come from the switch's health events when the
+    pn_api class has subscribe_member_health, otherwise from a
+    get_members_health request covering every member made every
+    interval seconds. The subscription is made over a connection of its
+    own, kept out of the pool, which is pinged every interval seconds
+    and subscribed again once it is lost. Only the members whose health changed are written,
+    the changes reported within window seconds of each other together,
+    with one statement per status.
+    """
+
+    def __init__(self, server, window):
+        self.server = server
+        self._health = {}
+        self._changes = dispatch.UpdateCoalescer(window, self._write)
+        self._poll_task = None
+        self._subscriber = None
+        self._watch_task = None
+
+    def start(self, interval):
+        if self.server.supports('subscribe_member_health'):
+            self._subscribe()
+            self._watch_task = loopingcall.FixedIntervalLoopingCall(
+                self._watch)
+            self._watch_task.start(interval, initial_delay=interval)
+            return
+        if not self.server.supports('get_members_health'):
+            LOG.debug("pn_api reports no member health, member statuses "
+                      "are left as the driver sets them")
+            return
+        self._poll_task = loopingcall.FixedIntervalLoopingCall(self.poll)
+        self._poll_task.start(interval)
+
+    def _subscribe(self):
+        try:
+            self._subscriber = self.server.connect()
+            self._subscriber.subscribe_member_health(callback=self.report)
+        except Exception:
+            LOG.exception(_LE("Pluribus failed to subscribe to the member "
+                              "health"))
+            self._close_subscriber()
+
+    def _watch(self):
+        if self._subscriber is not None:
+            ping = getattr(self._subscriber, 'ping', None)
+            if ping is None:
+                return
+            try:
+                ping()
+                return
+            except Exception:
+                LOG.warn(_LW("Pluribus member health subscription lost, "
+                             "subscribing again"))
+                self._close_subscriber()
+        self._subscribe()
+
+    def _close_subscriber(self):
+        subscriber, self._subscriber = self._subscriber, None
+        close = getattr(subscriber, 'close', None)
+        if close is None:
+            return
+        try:
+            close()
+        except Exception:
+            LOG.debug("Error closing Pluribus member health subscription",
+                      exc_info=True)
+
+    def poll(self):
+        try:
+            results = self.server.get_members_health()
+        except Exception:
+            LOG.exception(_LE("Pluribus failed to poll the member health"))
+            return
+        self.report(results or {})
+
+    def report(self, results):
+        """Take health check results, a dict mapping member ids to UP or
+        DOWN.
+        """
+        changes = {}
+        for member_id, result in results.items():
+            status = _STATUSES.get(result)
+            if status is None:
+                LOG.debug("Pluribus ignoring health %(result)s of member "
+                          "%(id)s", {'result': result, 'id': member_id})
+                continue
+            if self._health.get(member_id) != status:
+                changes[member_id] = status
+        if changes:
+            self._changes.submit(None, changes)
+
+    def forget(self, member_id):
+        """Drop what is known of the health of member_id, called whenever
+        the driver sets the status of the member itself.
+        """
+        self._health.pop(member_id, None)
+
+    def _write(self, key, changes):
+        by_status = {}
+        for member_id, status in changes.items():
+            by_status.setdefault(status, []).append(member_id)
+        for status, member_ids in by_status.items():
+            LOG.debug("Pluribus setting %(count)d members %(status)s",
+                      {'count': len(member_ids), 'status': status})
+            written = pn_db.update_status_bulk(
+                ldb.Member, member_ids, status,
+                from_statuses=_HEALTH_STATUSES)
+            # members skipped because they are pending or failed get their
+            # health written once they are configured
+            for member_id in written:
+                self._health[member_id] = status
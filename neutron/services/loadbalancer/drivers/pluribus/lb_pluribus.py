@@ -12,16 +12,25 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+from oslo.config import cfg
+
+from neutron import context as n_context
 from neutron.openstack.common import log as logging
 from neutron.i18n import _LI, _LE
 from neutron.plugins.common import constants
+from neutron.plugins.ml2.drivers.pluribus import client as pn_client
 from neutron.plugins.ml2.drivers.pluribus import config  # noqa
+from neutron.plugins.ml2.drivers.pluribus import db as pn_db
+from neutron.plugins.ml2.drivers.pluribus import schema
 from neutron.db.loadbalancer import loadbalancer_db as ldb
-from oslo.config import cfg
-from oslo.utils import importutils
+from neutron.services.loadbalancer.drivers.pluribus import graph
+from neutron.services.loadbalancer.drivers.pluribus import health
+from neutron.services.loadbalancer.drivers.pluribus import stats
 
 LOG = logging.getLogger(__name__)
 
+_MODELS = {graph.POOL: ldb.Pool, graph.VIP: ldb.Vip}
+
 
 class PluribusLoadBalancerDriver(object):
 
@@ -37,16 +46,116 @@ class PluribusLoadBalancerDriver(object):
         """
         Do the initialization for the loadbalancer driver here.
         """
-        self.server = importutils.\
-            import_object(cfg.CONF.PLURIBUS_PLUGINS['pn_api'])
+        self.server = pn_client.get_client()
         self.plugin = plugin
+        conf = cfg.CONF.PLURIBUS_PLUGINS
+        self.pool_stats = stats.PoolStats(self.server, conf.stats_ttl)
+        if conf.stats_poll_interval > 0:
+            self.pool_stats.start(conf.stats_poll_interval)
+        self.member_health = health.MemberHealth(self.server,
+                                                 conf.member_health_window)
+        if conf.member_health_interval > 0:
+            self.member_health.start(conf.member_health_interval)
+        # pools are configured with one transaction per burst of changes
+        self.graphs = None
+        if (conf.lb_graph_window > 0 and
+                self.server.supports('apply_pool_graph') and
+                self.server.supports('get_pool_graph')):
+            self.graphs = graph.GraphPusher(self.server,
+                                            conf.lb_graph_window,
+                                            self._load_graph,
+                                            self._graph_done)
         LOG.info(_LI("PluribusLoadBalancerDriver has been initialised"))
 
+    def _load_graph(self, pool_id):
+        # the graph of a pool as the database holds it, None once the
+        # pool is gone; objects being deleted are left out
+        context = n_context.get_admin_context()
+        pools = self.plugin.get_pools(context, filters={'id': [pool_id]})
+        if not pools:
+            return None
+        pool = pools[0]
+        result = graph.empty()
+        result[graph.POOL][pool_id] = pool
+        if pool.get('vip_id'):
+            vip = self.plugin.get_vip(context, pool['vip_id'])
+            if vip['status'] != constants.PENDING_DELETE:
+                result[graph.VIP][vip['id']] = vip
+        for member in self.plugin.get_members(
+                context, filters={'pool_id': [pool_id]}):
+            if member['status'] != constants.PENDING_DELETE:
+                result[graph.MEMBER][member['id']] = member
+        monitor_ids = [hm['monitor_id'] for hm in
+                       pool.get('health_monitors_status', [])
+                       if hm['status'] != constants.PENDING_DELETE]
+        if monitor_ids:
+            for hm in self.plugin.get_health_monitors(
+                    context, filters={'id': monitor_ids}):
+                result[graph.HEALTH][hm['id']] = hm
+        return result
+
+    def _graph_done(self, pool_id, changes, status):
+        # record the outcome of a graph push on everything it created or
+        # updated, the members with a single statement
+        context = n_context.get_admin_context()
+        members = []
+        for (kind, obj_id), obj in changes.items():
+            if obj is None:
+                continue
+            if kind == graph.MEMBER:
+                self.member_health.forget(obj_id)
+                members.append(obj_id)
+            elif kind == graph.HEALTH:
+                self.plugin.update_pool_health_monitor(context, obj_id,
+                                                       pool_id, status)
+            else:
+                self.plugin.update_status(context, _MODELS[kind], obj_id,
+                                          status)
+        pn_db.update_status_bulk(ldb.Member, members, status, context)
+
+    def _update(self, context, model, resource, old, new):
+        """Push the attributes that differ between old and new to the
+        switch load balancer and record the outcome as the status.
+        """
+        method = 'update_%s' % resource
+        changes = schema.changes(method, new, old)
+        if resource == graph.MEMBER:
+            # the status set below replaces the health of the member
+            self.member_health.forget(new['id'])
+        if changes is not None and self.graphs is not None:
+            pool_id = new['id'] if resource == graph.POOL else new['pool_id']
+            self.graphs.submit(pool_id, resource, new)
+            return
+
+        try:
+            if changes is not None:
+                getattr(self.server, method)(**changes)
+            self.plugin.update_status(context, model, new['id'],
+                                      constants.ACTIVE)
+        except Exception as e:
+            self.plugin.update_status(context, model, new['id'],
+                                      constants.ERROR)
+            LOG.error(_LE("Pluribus LB Driver failed to update %(resource)s "
+                          "%(id)s"), {'resource': resource, 'id': new['id']})
+            raise e
+
+        if changes is None:
+            LOG.debug("Pluribus LB Driver skipping update of %(resource)s "
+                      "%(id)s, nothing changed on the switch",
+                      {'resource': resource, 'id': new['id']})
+        else:
+            LOG.info(_LI("Pluribus LB Driver successfully updated "
+                         "%(resource)s %(id)s"),
+                     {'resource': resource, 'id': new['id']})
+
     def create_vip(self, context, vip):
         LOG.debug(("create_vip : ", vip))
+        if self.graphs is not None:
+            self.graphs.submit(vip['pool_id'], graph.VIP, vip)
+            return
 
         try:
-            self.server.create_vip(**vip)
+            self.server.create_vip(**schema.build('create_vip', vip))
             self.plugin.update_status(context, ldb.Vip, vip['id'],
                                       constants.ACTIVE)
             LOG.info(_LI("Pluribus LB Driver successfully created Vip %s" %
@@ -58,11 +167,18 @@ class PluribusLoadBalancerDriver(object):
                       vip['id']))
             raise e
 
+    def update_vip(self, context, old_vip, vip):
+        LOG.debug(("update_vip : ", vip))
+        self._update(context, ldb.Vip, 'vip', old_vip, vip)
+
     def delete_vip(self, context, vip):
         LOG.debug(("delete_vip : ", vip))
+        if self.graphs is not None:
+            self.graphs.remove(vip['pool_id'], graph.VIP, vip['id'])
+            return
 
         try:
-            self.server.delete_vip(**vip)
+            self.server.delete_vip(**schema.build('delete_vip', vip))
 
             LOG.info(_LI("Pluribus LB Driver successfully deleted Vip %s" %
                      vip['id']))
@@ -75,9 +191,12 @@ class PluribusLoadBalancerDriver(object):
 
     def create_pool(self, context, pool):
         LOG.debug(("create_pool : ", pool))
+        if self.graphs is not None:
+            self.graphs.submit(pool['id'], graph.POOL, pool)
+            return
 
         try:
-            self.server.create_pool(**pool)
+            self.server.create_pool(**schema.build('create_pool', pool))
             self.plugin.update_status(context, ldb.Pool, pool['id'],
                                       constants.ACTIVE)
             LOG.info(_LI("Pluribus LB Driver successfully created Pool %s" %
@@ -89,11 +208,19 @@ class PluribusLoadBalancerDriver(object):
                       pool['id']))
             raise e
 
+    def update_pool(self, context, old_pool, pool):
+        LOG.debug(("update_pool : ", pool))
+        self._update(context, ldb.Pool, 'pool', old_pool, pool)
+
     def delete_pool(self, context, pool):
         LOG.debug(("delete_pool : ", pool))
+        if self.graphs is not None:
+            # the switch drops everything the pool holds along with it
+            self.graphs.forget(pool['id'])
 
         try:
-            self.server.delete_pool(**pool)
+            self.server.delete_pool(**schema.build('delete_pool', pool))
+            self.pool_stats.forget(pool['id'])
             LOG.info(_LI("Pluribus LB Driver successfully deleted Pool %s" %
                      pool['id']))
         except Exception as e:
@@ -105,9 +232,14 @@ class PluribusLoadBalancerDriver(object):
 
     def create_member(self, context, member):
         LOG.debug(("create_member : ", member))
+        self.member_health.forget(member['id'])
+        if self.graphs is not None:
+            self.graphs.submit(member['pool_id'], graph.MEMBER, member)
+            return member
 
         try:
-            self.server.create_member(**member)
+            self.server.create_member(
+                **schema.build('create_member', member))
             self.plugin.update_status(context, ldb.Member, member['id'],
                                       constants.ACTIVE)
             LOG.info(_LI("Pluribus LB Driver successfully created Member %s" %
@@ -120,11 +252,20 @@ class PluribusLoadBalancerDriver(object):
                       member['id']))
             raise e
 
+    def update_member(self, context, old_member, member):
+        LOG.debug(("update_member : ", member))
+        self._update(context, ldb.Member, 'member', old_member, member)
+
     def delete_member(self, context, member):
         LOG.debug(("delete_member : ", member['id']))
+        self.member_health.forget(member['id'])
+        if self.graphs is not None:
+            self.graphs.remove(member['pool_id'], graph.MEMBER, member['id'])
+            return
 
         try:
-            self.server.delete_member(**member)
+            self.server.delete_member(
+                **schema.build('delete_member', member))
             LOG.info(_LI("Pluribus LB Driver successfully deleted Member %s" %
                      member['id']))
         except Exception as e:
@@ -134,11 +275,102 @@ class PluribusLoadBalancerDriver(object):
                       member['id']))
             raise e
 
+    def _send_members(self, method, members):
+        """Send a batch of member requests to the switch.
+
+        Uses the bulk pn_api call when there is one, one request per
+        member otherwise. Returns a dict mapping the id of every member
+        the switch failed on to the error it reported.
+        """
+        payload = [schema.build(method, member) for member in members]
+        bulk_method = method + 's'
+        if self.server.supports(bulk_method):
+            try:
+                results = getattr(self.server, bulk_method)(members=payload)
+            except Exception as e:
+                results = dict((member['id'], str(e)) for member in members)
+            return dict((member_id, error)
+                        for member_id, error in (results or {}).items()
+                        if error)
+
+        failed = {}
+        for member in payload:
+            try:
+                getattr(self.server, method)(**member)
+            except Exception as e:
+                failed[member['id']] = str(e)
+        return failed
+
+    def create_members(self, context, members):
+        """Program a batch of members, such as the ones an autoscaling
+        group adds, with one switch request.
+
+        The statuses of the members are set with one statement for those
+        created and one for those that failed. Returns a dict mapping the
+        id of every member the switch failed to create to the error it
+        reported.
+        """
+        LOG.debug(("create_members : ", len(members)))
+        for member in members:
+            self.member_health.forget(member['id'])
+        if self.graphs is not None:
+            for member in members:
+                self.graphs.submit(member['pool_id'], graph.MEMBER, member)
+            return {}
+
+        failed = self._send_members('create_member', members)
+        pn_db.update_status_bulk(ldb.Member,
+                                 [m['id'] for m in members
+                                  if m['id'] not in failed],
+                                 constants.ACTIVE, context)
+        pn_db.update_status_bulk(ldb.Member, list(failed), constants.ERROR,
+                                 context)
+        for member_id, error in failed.items():
+            LOG.error(_LE("Pluribus LB Driver failed to create Member "
+                          "%(id)s: %(error)s"),
+                      {'id': member_id, 'error': error})
+        LOG.info(_LI("Pluribus LB Driver created %(count)d Members, "
+                     "%(failed)d failed"),
+                 {'count': len(members) - len(failed), 'failed': len(failed)})
+        return failed
+
+    def delete_members(self, context, members):
+        """Remove a batch of members from the switch with one request.
+
+        Returns a dict mapping the id of every member the switch failed
+        to delete, set to ERROR with one statement, to the error it
+        reported.
+        """
+        LOG.debug(("delete_members : ", len(members)))
+        for member in members:
+            self.member_health.forget(member['id'])
+        if self.graphs is not None:
+            for member in members:
+                self.graphs.remove(member['pool_id'], graph.MEMBER,
+                                   member['id'])
+            return {}
+
+        failed = self._send_members('delete_member', members)
+        pn_db.update_status_bulk(ldb.Member, list(failed), constants.ERROR,
+                                 context)
+        for member_id, error in failed.items():
+            LOG.error(_LE("Pluribus LB Driver failed to delete Member "
+                          "%(id)s: %(error)s"),
+                      {'id': member_id, 'error': error})
+        LOG.info(_LI("Pluribus LB Driver deleted %(count)d Members, "
+                     "%(failed)d failed"),
+                 {'count': len(members) - len(failed), 'failed': len(failed)})
+        return failed
+
     def delete_pool_health_monitor(self, context, health_monitor, pool_id):
         LOG.debug(("delete_health_monitor : ", pool_id))
+        if self.graphs is not None:
+            self.graphs.remove(pool_id, graph.HEALTH, health_monitor['id'])
+            return
 
         try:
-            self.server.delete_health(**health_monitor)
+            self.server.delete_health(
+                **schema.build('delete_health', health_monitor))
             LOG.info(_LI("Pluribus LB Driver successfully created health "
                      "monitor for pool_id %s" % pool_id))
         except Exception as e:
@@ -152,10 +384,14 @@ class PluribusLoadBalancerDriver(object):
 
     def create_pool_health_monitor(self, context, health_monitor, pool_id):
         LOG.debug(("create_health_monitor : ", health_monitor, pool_id))
+        if self.graphs is not None:
+            self.graphs.submit(pool_id, graph.HEALTH, health_monitor)
+            return health_monitor
 
         try:
             LOG.debug(("create_health", health_monitor))
-            self.server.create_health(**health_monitor)
+            self.server.create_health(
+                **schema.build('create_health', health_monitor))
             self.plugin.update_pool_health_monitor(context,
                                                    health_monitor["id"],
                                                    pool_id,
@@ -170,3 +406,38 @@ class PluribusLoadBalancerDriver(object):
                                                    health_monitor["id"],
                                                    pool_id,
                                                    constants.ERROR)
+
+    def update_pool_health_monitor(self, context, old_health_monitor,
+                                   health_monitor, pool_id):
+        LOG.debug(("update_health_monitor : ", health_monitor, pool_id))
+
+        # the pools of a monitor only carry their association status,
+        # they never make an update worth sending
+        changes = schema.changes(
+            'update_health', health_monitor,
+            dict(old_health_monitor, pools=health_monitor.get('pools')))
+        if changes is not None and self.graphs is not None:
+            self.graphs.submit(pool_id, graph.HEALTH, health_monitor)
+            return
+
+        try:
+            if changes is not None:
+                self.server.update_health(**changes)
+            self.plugin.update_pool_health_monitor(context,
+                                                   health_monitor["id"],
+                                                   pool_id,
+                                                   constants.ACTIVE)
+            LOG.info(_LI("Pluribus LB Driver successfully updated health "
+                     "monitor for pool_id %s" % pool_id))
+        except Exception as e:
+            LOG.error(_LE("Pluribus LB Driver failed to update health "
+                      "monitor for pool_id %s" % pool_id))
+            self.plugin.update_pool_health_monitor(context,
+                                                   health_monitor["id"],
+                                                   pool_id,
+                                                   constants.ERROR)
+            raise e
+
+    def stats(self, context, pool_id):
+        LOG.debug(("stats : ", pool_id))
+        return self.pool_stats.get(pool_id)
@@ -0,0 +1,113 @@
+# COPYRIGHT 2015 Pluribus Networks Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import time
+
+from eventlet import semaphore
+
+from neutron.i18n import _LE
+from neutron.openstack.common import log as logging
+from neutron.openstack.common import loopingcall
+from neutron.services.loadbalancer import constants as lb_const
+
+LOG = logging.getLogger(__name__)
+
+# counters kept per pool, in the order they are stored
+KEYS = (lb_const.STATS_IN_BYTES,
+        lb_const.STATS_OUT_BYTES,
+        lb_const.STATS_ACTIVE_CONNECTIONS,
+        lb_const.STATS_TOTAL_CONNECTIONS)
+
+
+class PoolStats(object):
+
+    """Cache of the pool statistics of the switch load balancer.
+
+    The counters of every pool are fetched with a single get_pools_stats
+    request, every interval seconds by a periodic task and on demand when
+    the counters asked for are older than ttl seconds. Each pool costs a
+    timestamp and a tuple of counters. Switches without get_pools_stats
+    are asked about one pool at a time with get_pool_stats, with the
+    same ttl.
+    """
+
+    def __init__(self, server, ttl):
+        self.server = server
+        self._ttl = ttl
+        self._stats = {}
+        self._polled_at = 0
+        self._lock = semaphore.Semaphore()
+        self._poll_task = None
+
+    def start(self, interval):
+        if not self.server.supports('get_pools_stats'):
+            return
+        self._poll_task = loopingcall.FixedIntervalLoopingCall(self.poll)
+        self._poll_task.start(interval)
+
+    def poll(self):
+        """Refresh the counters of all the pools with one request."""
+        try:
+            results = self.server.get_pools_stats() or {}
+        except Exception:
+            LOG.exception(_LE("Pluribus failed to poll the pool statistics"))
+            return
+        now = self._polled_at = time.time()
+        self._stats = dict((pool_id, (now, self._pack(counters)))
+                           for pool_id, counters in results.items())
+
+    def get(self, pool_id):
+        """Return the counters of pool_id, an empty dict when there are
+        no fresh ones so that the plugin serves the counters it stored.
+        """
+        entry = self._fresh(pool_id)
+        if entry is None:
+            # several callers may find the counters expired, only the
+            # first one goes to the switch
+            with self._lock:
+                entry = self._fresh(pool_id)
+                if entry is None:
+                    self._refresh(pool_id)
+                    entry = self._fresh(pool_id)
+        if entry is None:
+            return {}
+        return dict(zip(KEYS, entry[1]))
+
+    def forget(self, pool_id):
+        self._stats.pop(pool_id, None)
+
+    def _fresh(self, pool_id):
+        entry = self._stats.get(pool_id)
+        if entry is not None and time.time() - entry[0] < self._ttl:
+            return entry
+        return None
+
+    def _refresh(self, pool_id):
+        if self.server.supports('get_pools_stats'):
+            # a pool missing from a recent poll has no counters yet
+            if time.time() - self._polled_at >= self._ttl:
+                self.poll()
+            return
+        try:
+            counters = self.server.get_pool_stats(pool_id=pool_id)
+        except Exception:
+            LOG.exception(_LE("Pluribus failed to get the statistics of "
+                              "pool %s"), pool_id)
+            return
+        if counters is not None:
+            self._stats[pool_id] = (time.time(), self._pack(counters))
+
+    @staticmethod
+    def _pack(counters):
+        return tuple(int(counters.get(key) or 0) for key in KEYS)
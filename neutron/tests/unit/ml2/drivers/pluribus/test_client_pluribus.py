@@ -0,0 +1,95 @@
+# COPYRIGHT 2015 Pluribus Networks Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from neutron.plugins.ml2.drivers.pluribus import client as pn_client
+from neutron.tests import base
+
+
+class FakeApi(object):
+
+    """Stands in for the pn_api class for testing purposes only."""
+
+    def __init__(self):
+        self.create_network = mock.Mock()
+        self.close = mock.Mock()
+        self.ping = mock.Mock()
+
+
+class PluribusClientTestCase(base.BaseTestCase):
+
+    """Test case for the shared Pluribus switch client."""
+
+    def setUp(self):
+        super(PluribusClientTestCase, self).setUp()
+        patcher = mock.patch('oslo.utils.importutils.import_object',
+                             side_effect=lambda name: FakeApi())
+        self.import_object = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = pn_client.PluribusClient('pn_api', 2, 300, 0)
+
+    def test_connection_is_reused(self):
+        self.client.create_network(id='net-1')
+        self.client.create_network(id='net-2')
+        self.assertEqual(1, self.import_object.call_count)
+        conn = self.client._idle[0]
+        self.assertEqual(2, conn.api.create_network.call_count)
+
+    def test_failed_connection_is_dropped(self):
+        self.client.create_network(id='net-1')
+        api = self.client._idle[0].api
+        api.create_network.side_effect = Exception('connection reset')
+        self.assertRaises(Exception, self.client.create_network, id='net-2')
+        api.close.assert_called_once_with()
+        self.assertEqual(0, len(self.client._idle))
+
+    def test_idle_connection_is_closed(self):
+        self.client.create_network(id='net-1')
+        conn = self.client._idle[0]
+        conn.last_used -= 301
+        self.client.create_network(id='net-2')
+        conn.api.close.assert_called_once_with()
+        self.assertEqual(2, self.import_object.call_count)
+
+    def test_keepalive_drops_unhealthy_connection(self):
+        self.client.create_network(id='net-1')
+        conn = self.client._idle[0]
+        conn.api.ping.side_effect = Exception('switch unreachable')
+        self.client._keepalive()
+        conn.api.close.assert_called_once_with()
+        self.assertEqual(0, len(self.client._idle))
+
+    def test_idle_pool_is_capped(self):
+        self.client.create_network(id='net-1')
+        conn = self.client._idle[0]
+
+        def ping():
+            # two calls open connections while the keepalive holds conn
+            opened = [self.client._checkout(), self.client._checkout()]
+            self.client._idle.extend(opened)
+        conn.api.ping.side_effect = ping
+        self.client._keepalive()
+        self.assertEqual(2, len(self.client._idle))
+        conn.api.close.assert_called_once_with()
+
+    def test_dedicated_connection_is_not_pooled(self):
+        api = self.client.connect()
+        self.assertIsInstance(api, FakeApi)
+        self.client.create_network(id='net-1')
+        self.assertEqual(2, self.import_object.call_count)
+        self.assertIsNot(api, self.client._idle[0].api)
+
+    def test_plugins_share_one_client(self):
+        self.assertIs(pn_client.get_client(), pn_client.get_client())
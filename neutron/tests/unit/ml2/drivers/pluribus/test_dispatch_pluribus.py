@@ -0,0 +1,129 @@
+# COPYRIGHT 2015 Pluribus Networks Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import eventlet
+import mock
+
+from neutron.plugins.ml2.drivers.pluribus import dispatch
+from neutron.tests import base
+
+
+class OrderedDispatcherTestCase(base.BaseTestCase):
+
+    """Test case for the Pluribus switch operation dispatcher."""
+
+    def setUp(self):
+        super(OrderedDispatcherTestCase, self).setUp()
+        self.dispatcher = dispatch.OrderedDispatcher(4)
+        self.calls = []
+
+    def _op(self, name, fail=False):
+        def op(**kwargs):
+            # give other workers a chance to run in between
+            eventlet.sleep(0)
+            self.calls.append((name, kwargs))
+            if fail:
+                raise Exception('switch error')
+        return op
+
+    def test_operations_on_same_key_run_in_order(self):
+        for i in range(5):
+            self.dispatcher.dispatch('net-1', self._op('op'), {'seq': i})
+        eventlet.sleep(0.1)
+        self.assertEqual([i for i in range(5)],
+                         [kwargs['seq'] for name, kwargs in self.calls])
+
+    def test_status_pending_until_switch_answers(self):
+        callback = mock.Mock()
+        self.dispatcher.dispatch('net-1', self._op('create'), {},
+                                 callback=callback, resource_id='port-1')
+        self.assertEqual(dispatch.PENDING,
+                         self.dispatcher.get_status('port-1'))
+        eventlet.sleep(0.1)
+        self.assertEqual(dispatch.ACTIVE,
+                         self.dispatcher.get_status('port-1'))
+        callback.assert_called_once_with(dispatch.ACTIVE)
+
+    def test_failed_operation_reports_error(self):
+        callback = mock.Mock()
+        self.dispatcher.dispatch('net-1', self._op('create', fail=True), {},
+                                 callback=callback)
+        eventlet.sleep(0.1)
+        self.assertEqual(dispatch.ERROR, self.dispatcher.get_status('net-1'))
+        callback.assert_called_once_with(dispatch.ERROR)
+
+    def test_wait_returns_once_queued_operations_ran(self):
+        for i in range(3):
+            self.dispatcher.dispatch('router-1', self._op('op'), {'seq': i})
+        self.dispatcher.wait('router-1')
+        self.assertEqual(3, len(self.calls))
+        self.assertEqual(dispatch.ACTIVE,
+                         self.dispatcher.get_status('router-1'))
+
+    def test_wait_without_queued_operations(self):
+        self.dispatcher.wait('router-1')
+        self.assertIsNone(self.dispatcher.get_status('router-1'))
+
+    def test_handed_on_operation_stays_pending(self):
+        callback = mock.Mock()
+        self.dispatcher.dispatch('net-1', lambda: dispatch.PENDING, {},
+                                 callback=callback, resource_id='port-1')
+        eventlet.sleep(0.1)
+        self.assertEqual(dispatch.PENDING,
+                         self.dispatcher.get_status('port-1'))
+        self.assertFalse(callback.called)
+
+        self.dispatcher.record('port-1', dispatch.ACTIVE)
+        self.assertEqual(dispatch.ACTIVE,
+                         self.dispatcher.get_status('port-1'))
+
+    def test_forget(self):
+        self.dispatcher.dispatch('net-1', self._op('delete'), {})
+        eventlet.sleep(0.1)
+        self.dispatcher.forget('net-1')
+        self.assertIsNone(self.dispatcher.get_status('net-1'))
+
+
+class UpdateCoalescerTestCase(base.BaseTestCase):
+
+    """Test case for the Pluribus port update coalescer."""
+
+    def setUp(self):
+        super(UpdateCoalescerTestCase, self).setUp()
+        self.send = mock.Mock()
+        self.on_error = mock.Mock()
+        self.coalescer = dispatch.UpdateCoalescer(0.01, self.send,
+                                                  self.on_error)
+
+    def test_updates_within_window_are_collapsed(self):
+        for i in range(3):
+            self.coalescer.submit('port-1', {'seq': i})
+        self.coalescer.submit('port-2', {'seq': 0})
+        eventlet.sleep(0.05)
+        self.assertEqual(2, self.send.call_count)
+        self.send.assert_any_call('port-1', {'seq': 2})
+        self.send.assert_any_call('port-2', {'seq': 0})
+
+    def test_discarded_update_is_not_sent(self):
+        self.coalescer.submit('port-1', {'seq': 0})
+        self.coalescer.discard('port-1')
+        eventlet.sleep(0.05)
+        self.assertFalse(self.send.called)
+
+    def test_failed_update_is_reported(self):
+        self.send.side_effect = [Exception('switch down'), None]
+        self.coalescer.submit('port-1', {'seq': 0})
+        self.coalescer.submit('port-2', {'seq': 0})
+        eventlet.sleep(0.05)
+        self.on_error.assert_called_once_with('port-1')
@@ -0,0 +1,133 @@
+# COPYRIGHT 2015 Pluribus Networks Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from neutron.plugins.ml2.drivers.pluribus import fabric
+from neutron.tests import base
+
+
+class FabricClientTestCase(base.BaseTestCase):
+
+    """Test case for the Pluribus fabric client."""
+
+    def setUp(self):
+        super(FabricClientTestCase, self).setUp()
+        self.nodes = {'sw-1': mock.Mock(), 'sw-2': mock.Mock(),
+                      'sw-3': mock.Mock()}
+        self.client = fabric.FabricClient(self.nodes)
+
+    def _node_of(self, key):
+        return self.nodes[self.client.ring.get_node(key)]
+
+    def test_hash_ring_is_stable(self):
+        ring = fabric.HashRing(['sw-1', 'sw-2', 'sw-3'])
+        placed = dict((key, ring.get_node(key))
+                      for key in ('net-%d' % i for i in range(100)))
+        self.assertEqual(set(['sw-1', 'sw-2', 'sw-3']), set(placed.values()))
+
+        # only the keys of the removed node move
+        smaller = fabric.HashRing(['sw-1', 'sw-2'])
+        for key, node in placed.items():
+            if node != 'sw-3':
+                self.assertEqual(node, smaller.get_node(key))
+
+    def test_port_follows_its_network(self):
+        self.client.create_port(id='port-1', network_id='net-1')
+        node = self._node_of('net-1')
+        node.create_port.assert_called_once_with(id='port-1',
+                                                 network_id='net-1')
+        for other in self.nodes.values():
+            if other is not node:
+                self.assertFalse(other.create_port.called)
+
+    def test_broadcast_failure(self):
+        self.nodes['sw-2'].create_pool.side_effect = Exception('down')
+        e = self.assertRaises(fabric.FabricError, self.client.create_pool,
+                              id='pool-1')
+        self.assertEqual(['sw-2'], list(e.errors))
+        for node in self.nodes.values():
+            node.create_pool.assert_called_once_with(id='pool-1')
+
+    def test_list_results_are_merged(self):
+        for name, node in self.nodes.items():
+            node.list_pools.return_value = [{'id': 'pool-1'},
+                                            {'id': 'pool-%s' % name}]
+        self.assertEqual(4, len(self.client.list_pools()))
+
+    def test_ports_are_batched_per_node(self):
+        ports = [{'id': 'port-%d' % i, 'network_id': 'net-%d' % i}
+                 for i in range(10)]
+        for node in self.nodes.values():
+            node.create_ports.return_value = {}
+        failing = self._node_of('net-0')
+        failing.create_ports.side_effect = Exception('down')
+
+        failed = self.client.create_ports(ports=ports)
+        self.assertEqual(sorted(p['id'] for p in ports
+                                if self._node_of(p['network_id']) is failing),
+                         sorted(failed))
+        for node in self.nodes.values():
+            if node.create_ports.called:
+                sent = node.create_ports.call_args[1]['ports']
+                self.assertTrue(all(self._node_of(p['network_id']) is node
+                                    for p in sent))
+
+    def test_router_routes_follow_their_router(self):
+        self.client.add_router_routes(router_id='router-1', routes=[])
+        node = self._node_of('router-1')
+        node.add_router_routes.assert_called_once_with(router_id='router-1',
+                                                       routes=[])
+        for other in self.nodes.values():
+            if other is not node:
+                self.assertFalse(other.add_router_routes.called)
+
+    def test_floatingips_follow_their_router(self):
+        self.client.delete_floatingip(id='float-1', router_id='router-1')
+        node = self._node_of('router-1')
+        node.delete_floatingip.assert_called_once_with(id='float-1',
+                                                       router_id='router-1')
+        for other in self.nodes.values():
+            if other is not node:
+                self.assertFalse(other.delete_floatingip.called)
+
+    def test_floatingips_are_batched_per_router_node(self):
+        fips = [{'id': 'float-%d' % i, 'router_id': 'router-%d' % i}
+                for i in range(10)]
+        fips.append({'id': 'float-free', 'router_id': None})
+        for node in self.nodes.values():
+            node.create_floatingips.return_value = {}
+
+        self.assertEqual({}, self.client.create_floatingips(floatingips=fips))
+        for node in self.nodes.values():
+            sent = node.create_floatingips.call_args[1]['floatingips']
+            # a floating IP without a router goes everywhere
+            self.assertIn(fips[-1], sent)
+            self.assertTrue(all(self._node_of(f['router_id']) is node
+                                for f in sent if f['router_id']))
+
+    def test_newest_pool_graph_is_returned(self):
+        for version, node in enumerate(self.nodes.values()):
+            node.get_pool_graph.return_value = {
+                'version': version + 1, 'graph': {'node': version + 1}}
+        graph = self.client.get_pool_graph(pool_id='pool-1')
+        self.assertEqual({'version': 3, 'graph': {'node': 3}}, graph)
+
+    def test_cascaded_network_delete_goes_to_the_network_node(self):
+        self.client.delete_network_cascade(id='net-1')
+        node = self._node_of('net-1')
+        node.delete_network_cascade.assert_called_once_with(id='net-1')
+        for other in self.nodes.values():
+            if other is not node:
+                self.assertFalse(other.delete_network_cascade.called)
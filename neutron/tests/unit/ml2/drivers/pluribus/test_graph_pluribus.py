@@ -0,0 +1,103 @@
+# COPYRIGHT 2015 Pluribus Networks Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import eventlet
+import mock
+
+from neutron.services.loadbalancer.drivers.pluribus import graph
+from neutron.tests import base
+
+
+class GraphPusherTestCase(base.BaseTestCase):
+
+    """Test case for the Pluribus load balancer graph pusher."""
+
+    def setUp(self):
+        super(GraphPusherTestCase, self).setUp()
+        self.server = mock.Mock()
+        self.server.get_pool_graph.return_value = {}
+        self.db_graph = graph.empty()
+        self.load = mock.Mock(side_effect=lambda pool_id: self.db_graph)
+        self.done = mock.Mock()
+        self.pusher = graph.GraphPusher(self.server, 0.01, self.load,
+                                        self.done)
+        self.pool = {'id': 'pool-1', 'lb_method': 'ROUND_ROBIN'}
+        self.vip = {'id': 'vip-1', 'pool_id': 'pool-1', 'address': '1.1.1.1'}
+        self.members = [{'id': 'member-%d' % i, 'pool_id': 'pool-1',
+                         'address': '10.0.0.%d' % i} for i in range(3)]
+
+    def _build_pool(self):
+        self.pusher.submit('pool-1', graph.POOL, self.pool)
+        self.pusher.submit('pool-1', graph.VIP, self.vip)
+        for member in self.members:
+            self.pusher.submit('pool-1', graph.MEMBER, member)
+        eventlet.sleep(0.05)
+
+    def _store_pool(self):
+        # the pool as the database and the switch hold it at version 1
+        self.db_graph[graph.POOL]['pool-1'] = self.pool
+        self.db_graph[graph.VIP]['vip-1'] = self.vip
+        for member in self.members:
+            self.db_graph[graph.MEMBER][member['id']] = member
+        self.applied = {'pool': self.pool, 'vip': self.vip,
+                        'members': self.members, 'monitors': []}
+        self.server.get_pool_graph.return_value = {'version': 1,
+                                                   'graph': self.applied}
+
+    def test_changes_are_pushed_as_one_transaction(self):
+        self._build_pool()
+
+        self.server.apply_pool_graph.assert_called_once_with(
+            pool_id='pool-1', version=1,
+            graph={'pool': self.pool, 'vip': self.vip,
+                   'members': self.members, 'monitors': []})
+        self.load.assert_called_once_with('pool-1')
+        (pool_id, changes, status), _ = self.done.call_args
+        self.assertEqual('ACTIVE', status)
+        self.assertEqual(5, len(changes))
+
+    def test_next_version_holds_the_whole_graph(self):
+        self._store_pool()
+        self.pusher.remove('pool-1', graph.MEMBER, 'member-0')
+        eventlet.sleep(0.05)
+
+        _, kwargs = self.server.apply_pool_graph.call_args
+        self.assertEqual(2, kwargs['version'])
+        self.assertEqual(self.vip, kwargs['graph']['vip'])
+        self.assertEqual(self.members[1:], kwargs['graph']['members'])
+
+    def test_failed_transaction_is_rolled_back(self):
+        self._store_pool()
+        self.server.apply_pool_graph.side_effect = [RuntimeError, None]
+        self.pusher.submit('pool-1', graph.VIP,
+                           dict(self.vip, address='2.2.2.2'))
+        eventlet.sleep(0.05)
+
+        # the failed version 2, then version 1 again
+        self.server.apply_pool_graph.assert_called_with(
+            pool_id='pool-1', version=1, graph=self.applied)
+        self.assertEqual('ERROR', self.done.call_args[0][2])
+
+    def test_deleted_pool_is_not_pushed(self):
+        self.load.side_effect = None
+        self.load.return_value = None
+        self._build_pool()
+        self.assertFalse(self.server.apply_pool_graph.called)
+        self.assertFalse(self.done.called)
+
+    def test_forget(self):
+        self.pusher.submit('pool-1', graph.POOL, self.pool)
+        self.pusher.forget('pool-1')
+        eventlet.sleep(0.05)
+        self.assertFalse(self.server.apply_pool_graph.called)
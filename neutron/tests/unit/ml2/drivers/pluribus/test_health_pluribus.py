@@ -0,0 +1,114 @@
+# COPYRIGHT 2015 Pluribus Networks Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import eventlet
+import mock
+
+from neutron.services.loadbalancer.drivers.pluribus import health
+from neutron.tests import base
+
+
+@mock.patch('neutron.plugins.ml2.drivers.pluribus.db.update_status_bulk')
+class MemberHealthTestCase(base.BaseTestCase):
+
+    """Test case for the Pluribus member health consumer."""
+
+    def setUp(self):
+        super(MemberHealthTestCase, self).setUp()
+        self.server = mock.Mock()
+        self.health = health.MemberHealth(self.server, 0.01)
+
+    def _writes_all(self, mock_set_status):
+        mock_set_status.side_effect = (
+            lambda model, member_ids, status, **kwargs: member_ids)
+
+    def _written(self, mock_set_status):
+        return dict((c[0][2], sorted(c[0][1]))
+                    for c in mock_set_status.call_args_list)
+
+    def test_changes_are_written_in_batches(self, mock_set_status):
+        self.health.report({'member-1': 'UP', 'member-2': 'DOWN'})
+        self.health.report({'member-3': 'DOWN'})
+        eventlet.sleep(0.05)
+
+        self.assertEqual({'ACTIVE': ['member-1'],
+                          'INACTIVE': ['member-2', 'member-3']},
+                         self._written(mock_set_status))
+        self.assertEqual(('ACTIVE', 'INACTIVE'),
+                         mock_set_status.call_args[1]['from_statuses'])
+
+    def test_unchanged_health_is_not_written(self, mock_set_status):
+        self._writes_all(mock_set_status)
+        self.health.report({'member-1': 'UP', 'member-2': 'UP'})
+        eventlet.sleep(0.05)
+        mock_set_status.reset_mock()
+
+        self.health.report({'member-1': 'UP', 'member-2': 'DOWN',
+                            'member-3': 'UNKNOWN'})
+        eventlet.sleep(0.05)
+        self.assertEqual({'INACTIVE': ['member-2']},
+                         self._written(mock_set_status))
+
+    def test_skipped_members_are_written_again(self, mock_set_status):
+        mock_set_status.return_value = []
+        self.health.report({'member-1': 'UP'})
+        eventlet.sleep(0.05)
+        mock_set_status.reset_mock()
+
+        self.health.report({'member-1': 'UP'})
+        eventlet.sleep(0.05)
+        self.assertEqual({'ACTIVE': ['member-1']},
+                         self._written(mock_set_status))
+
+    def test_forgotten_health_is_written_again(self, mock_set_status):
+        self._writes_all(mock_set_status)
+        self.health.report({'member-1': 'UP'})
+        eventlet.sleep(0.05)
+        mock_set_status.reset_mock()
+
+        self.health.forget('member-1')
+        self.health.report({'member-1': 'UP'})
+        eventlet.sleep(0.05)
+        self.assertEqual({'ACTIVE': ['member-1']},
+                         self._written(mock_set_status))
+
+    def test_poll(self, mock_set_status):
+        self.server.get_members_health.return_value = {'member-1': 'DOWN'}
+        self.health.poll()
+        eventlet.sleep(0.05)
+        self.assertEqual({'INACTIVE': ['member-1']},
+                         self._written(mock_set_status))
+
+    def test_start_subscribes_to_health_events(self, mock_set_status):
+        with mock.patch.object(health.loopingcall,
+                               'FixedIntervalLoopingCall'):
+            self.health.start(10)
+        subscriber = self.server.connect.return_value
+        subscriber.subscribe_member_health.assert_called_once_with(
+            callback=self.health.report)
+        self.assertFalse(self.server.subscribe_member_health.called)
+
+    def test_lost_subscription_is_renewed(self, mock_set_status):
+        lost, renewed = mock.Mock(), mock.Mock()
+        self.server.connect.side_effect = [lost, renewed]
+        with mock.patch.object(health.loopingcall,
+                               'FixedIntervalLoopingCall'):
+            self.health.start(10)
+        self.health._watch()
+        self.assertEqual(1, self.server.connect.call_count)
+        lost.ping.side_effect = Exception('connection reset')
+        self.health._watch()
+        lost.close.assert_called_once_with()
+        renewed.subscribe_member_health.assert_called_once_with(
+            callback=self.health.report)
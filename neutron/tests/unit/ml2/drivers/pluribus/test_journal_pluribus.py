@@ -0,0 +1,157 @@
+# COPYRIGHT 2015 Pluribus Networks Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import time
+
+import mock
+
+from neutron.plugins.ml2.drivers.pluribus import journal
+from neutron.tests import base
+
+
+class JournalTestCase(base.BaseTestCase):
+
+    """Test case for the Pluribus switch request journal."""
+
+    def setUp(self):
+        super(JournalTestCase, self).setUp()
+        self.server = mock.Mock()
+        self.breaker = journal.CircuitBreaker(failure_threshold=2,
+                                              reset_timeout=30)
+        self.journal = journal.Journal(':memory:', self.server, self.breaker)
+
+    def _entry(self, seq, method, resource_id, **payload):
+        return {'seq': seq, 'method': method, 'resource_id': resource_id,
+                'payload': payload}
+
+    def test_compact(self):
+        ops, noops = journal.compact([
+            self._entry(1, 'create_network', 'net-1', id='net-1', name='a'),
+            self._entry(2, 'update_network', 'net-1', name='b'),
+            self._entry(3, 'create_network', 'net-2', id='net-2'),
+            self._entry(4, 'delete_network', 'net-2', id='net-2'),
+            self._entry(5, 'update_port', 'port-1', name='c'),
+            self._entry(6, 'delete_port', 'port-1', id='port-1')])
+
+        self.assertEqual([3, 4], sorted(noops))
+        self.assertEqual([('create_network', {'id': 'net-1', 'name': 'b'},
+                           [1, 2]),
+                          ('delete_port', {'id': 'port-1'}, [5, 6])],
+                         [(op['method'], op['payload'], op['seqs'])
+                          for op in ops])
+
+    def test_compact_keeps_order_across_resources(self):
+        ops, noops = journal.compact([
+            self._entry(1, 'create_port', 'port-1', id='port-1', name='a'),
+            self._entry(2, 'create_subnet', 'sub-2', id='sub-2'),
+            self._entry(3, 'update_port', 'port-1', name='b'),
+            self._entry(4, 'create_network', 'net-3', id='net-3'),
+            self._entry(5, 'create_subnet', 'sub-3', id='sub-3'),
+            self._entry(6, 'delete_network', 'net-3', id='net-3')])
+
+        self.assertEqual([], noops)
+        self.assertEqual([[1], [2], [3], [4], [5], [6]],
+                         [op['seqs'] for op in ops])
+
+    def test_breaker_opens_after_threshold(self):
+        self.breaker.failure()
+        self.assertTrue(self.breaker.allow())
+        self.breaker.failure()
+        self.assertFalse(self.breaker.allow())
+        self.breaker.success()
+        self.assertTrue(self.breaker.allow())
+
+    def test_send_journals_on_failure(self):
+        self.server.create_network.side_effect = Exception('switch down')
+        self.assertFalse(self.journal.send('create_network', 'net-1',
+                                           {'id': 'net-1'}))
+        self.assertFalse(self.journal.send('delete_network', 'net-2',
+                                           {'id': 'net-2'}))
+        self.assertEqual(2, self.journal.pending())
+        # requests queue behind the journal to keep their order
+        self.assertFalse(self.server.delete_network.called)
+
+    def test_send_calls_journaled_before_appending(self):
+        self.server.create_network.side_effect = Exception('switch down')
+        pending = []
+
+        def journaled():
+            pending.append(self.journal.pending())
+        self.journal.send('create_network', 'net-1', {'id': 'net-1'},
+                          journaled)
+        self.assertEqual([0], pending)
+        self.assertEqual(1, self.journal.pending())
+
+    def test_replay_drains_journal(self):
+        self.journal.append('create_network', 'net-1', {'id': 'net-1'})
+        self.journal.append('create_port', 'port-1', {'id': 'port-1'})
+        self.journal.append('delete_port', 'port-1', {'id': 'port-1'})
+        self.journal.replay()
+
+        self.assertEqual([mock.call.create_network(id='net-1')],
+                         self.server.method_calls)
+        self.assertEqual(0, self.journal.pending())
+
+    def test_replay_stops_on_failure(self):
+        self.server.create_network.side_effect = Exception('switch down')
+        self.journal.append('create_network', 'net-1', {'id': 'net-1'})
+        self.journal.append('create_subnet', 'sub-1', {'id': 'sub-1'})
+        self.journal.replay()
+
+        self.assertFalse(self.server.create_subnet.called)
+        self.assertEqual(2, self.journal.pending())
+
+    def test_replay_reports_outcome(self):
+        done = mock.Mock()
+        self.journal = journal.Journal(':memory:', self.server, self.breaker,
+                                       max_attempts=1, done=done)
+        self.server.create_subnet.side_effect = Exception('switch down')
+        self.journal.append('create_port', 'port-1', {'id': 'port-1'})
+        self.journal.append('create_subnet', 'sub-1', {'id': 'sub-1'})
+        self.journal.replay()
+        self.journal.replay()
+
+        self.assertEqual([mock.call('create_port', 'port-1', 'ACTIVE'),
+                          mock.call('create_subnet', 'sub-1', 'ERROR')],
+                         done.call_args_list)
+        self.assertEqual(0, self.journal.pending())
+
+    def test_replay_skips_rows_claimed_by_another_worker(self):
+        self.journal.append('create_network', 'net-1', {'id': 'net-1'})
+        self.journal._conn().execute(
+            "UPDATE journal SET owner = 'other', claimed_at = ?",
+            (time.time(),))
+        self.journal.replay()
+        self.assertFalse(self.server.create_network.called)
+
+        # the claim of a worker that died times out
+        self.journal._claim_timeout = 0
+        self.journal.replay()
+        self.server.create_network.assert_called_once_with(id='net-1')
+        self.assertEqual(0, self.journal.pending())
+
+    def test_connection_is_opened_by_the_process_using_it(self):
+        with mock.patch.object(journal.loopingcall,
+                               'FixedIntervalLoopingCall') as loop:
+            self.journal.start(10)
+        # replays entries left over without waiting for a request
+        loop.return_value.start.assert_called_once_with(10,
+                                                        initial_delay=10)
+        self.assertIsNone(self.journal._db)
+        with mock.patch.object(journal.os, 'getpid', return_value=1):
+            self.journal.pending()
+            first = self.journal._db
+        with mock.patch.object(journal.os, 'getpid', return_value=2):
+            self.journal.pending()
+        self.assertIsNot(first, self.journal._db)
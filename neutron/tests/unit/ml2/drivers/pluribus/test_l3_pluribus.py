@@ -15,6 +15,10 @@
 import mock
 from mock import PropertyMock
 
+from neutron.api.v2 import base as api_base
+from neutron.extensions import l3
+from neutron.plugins.ml2.drivers.pluribus import schema
+from neutron.plugins.ml2.drivers.pluribus import topology
 from neutron.services.l3_router.l3_pluribus import PluribusRouterPlugin
 from neutron.tests import base
 from oslo.config import cfg
@@ -81,6 +85,8 @@ class PluribusRouterTestCase(base.BaseTestCase,
         super(PluribusRouterTestCase, self).setUp()
         self.service = PluribusRouterPlugin()
         self.service.server = mock_server
+        # disabled, each test reads from its own mocks
+        self.service.topology = topology.TopologyCache(0)
         self.tenant_id = 'tenant-1'
         self.context = FakeContext()
         setattr(cfg.CONF, 'core_plugin', 'neutron.plugins.ml2.plugin.Ml2Plugin')
@@ -190,8 +196,177 @@ class PluribusRouterTestCase(base.BaseTestCase,
                 router_id=self.router_id
             )
 
+    def _dispatch_callback(self):
+        # the switch request queued on the dispatcher and its callback
+        (key, func, payload), kwargs = self.service.dispatcher.dispatch.\
+            call_args
+        self.assertEqual(self.router_id, key)
+        return func, payload, kwargs['callback']
+
+    @mock.patch('neutron.plugins.ml2.drivers.pluribus.db.set_router_status')
+    def test_create_router_async(self, mock_set_status):
+        self.service.dispatcher = mock.Mock()
+        with mock.patch('neutron.db.l3_db.L3_NAT_dbonly_mixin.'
+                        'create_router') as create_router:
+            create_router.return_value = self._get_server_router_dict()
+            r = self.service.create_router(self.context,
+                                           {'router': self._get_router_dict()})
+
+        self.assertEqual('PENDING_CREATE', r['status'])
+        mock_set_status.assert_called_once_with(
+            self.router_id, 'PENDING_CREATE', self.context)
+        func, payload, callback = self._dispatch_callback()
+        self.assertEqual(self.service.server.create_router, func)
+        self.assertEqual(self.status, payload['status'])
+        self.assertFalse(self.service.server.create_router.called)
+
+        callback('ACTIVE')
+        self.assertEqual('ACTIVE', mock_set_status.call_args[0][1])
+
+    @mock.patch('neutron.plugins.ml2.drivers.pluribus.db.set_router_status')
+    def test_create_router_async_rolls_back(self, mock_set_status):
+        self.service.dispatcher = mock.Mock()
+        with mock.patch('neutron.db.l3_db.L3_NAT_dbonly_mixin.'
+                        'create_router') as create_router:
+            create_router.return_value = self._get_server_router_dict()
+            self.service.create_router(self.context,
+                                       {'router': self._get_router_dict()})
+
+        _, _, callback = self._dispatch_callback()
+        with mock.patch.object(self.service,
+                               'delete_router_db') as delete_router_db:
+            callback('ERROR')
+            self.assertEqual(self.router_id,
+                             delete_router_db.call_args[0][1])
+        self.assertEqual(1, mock_set_status.call_count)
+
+    @mock.patch('neutron.plugins.ml2.drivers.pluribus.db.set_router_status')
+    def test_delete_router_async(self, mock_set_status):
+        self.service.dispatcher = mock.Mock()
+        self.service._ensure_router_not_in_use = mock.Mock()
+        with mock.patch.object(self.service,
+                               'delete_router_db') as delete_router_db:
+            self.service.delete_router(self.context, self.router_id)
+            mock_set_status.assert_called_once_with(
+                self.router_id, 'PENDING_DELETE', self.context)
+            self.assertFalse(delete_router_db.called)
+
+            func, payload, callback = self._dispatch_callback()
+            self.assertEqual(self.service.server.delete_router, func)
+            self.assertEqual({'router_id': self.router_id}, payload)
+
+            # the router stays until the switch has deleted it
+            callback('ERROR')
+            self.assertFalse(delete_router_db.called)
+            self.assertEqual('ERROR', mock_set_status.call_args[0][1])
+
+            callback('ACTIVE')
+            self.assertEqual(self.router_id,
+                             delete_router_db.call_args[0][1])
+
+    def test_router_requests_wait_for_async_ones(self):
+        self.service.dispatcher = mock.Mock()
+        calls = []
+        self.service.dispatcher.wait.side_effect = (
+            lambda key: calls.append(('wait', key)))
+        self.service.server.plug_router_interface.side_effect = (
+            lambda **kwargs: calls.append(('plug', kwargs['router_id'])))
+        self.service.add_router_interface_db = mock.Mock()
+        self.service._get_router_info = mock.Mock(
+            return_value={'router_id': self.router_id,
+                          'subnet_id': self.subnet_id})
+        self.service.set_port_status_active = mock.Mock()
+
+        self.service.add_router_interface(self.context, self.router_id,
+                                          self._get_router_interface_dict())
+        self.assertEqual([('wait', self.router_id),
+                          ('plug', self.router_id)], calls)
+
+    def test_floatingip_requests_wait_for_async_ones(self):
+        self.service.dispatcher = mock.Mock()
+        self.service._get_floatingip = mock.Mock(
+            return_value={'router_id': 'router-0'})
+        with mock.patch('neutron.db.l3_db.L3_NAT_db_mixin.'
+                        'update_floatingip') as float_ip:
+            float_ip.return_value = self._get_floatingip_dict_server()
+            self.service.update_floatingip(
+                self.context, self.floating_id,
+                {'floatingip': {'port_id': None}})
+        self.service.dispatcher.wait.assert_called_once_with('router-0')
+
+        self.service.dispatcher.reset_mock()
+        with mock.patch('neutron.db.l3_db.L3_NAT_db_mixin.'
+                        'delete_floatingip'):
+            self.service.delete_floatingip(self.context, self.floating_id)
+        self.service.dispatcher.wait.assert_called_once_with('router-0')
+
+    def _routes(self, *nexthops):
+        return [{'destination': '10.%d.0.0/16' % i, 'nexthop': nexthop}
+                for i, nexthop in enumerate(nexthops)]
+
+    def test_route_delta(self):
+        old = self._routes('150.0.0.5', '150.0.0.6', '150.0.0.7')
+        new = self._routes('150.0.0.5', '150.0.0.9')
+        added, removed = schema.route_delta(old, new)
+        self.assertEqual([new[1]], added)
+        self.assertEqual(old[1:], removed)
+        self.assertEqual(([], []), schema.route_delta(new, new))
+
+    def test_update_router_routes_only(self):
+        old = self._routes('150.0.0.5', '150.0.0.6')
+        new = self._routes('150.0.0.5', '150.0.0.6', '150.0.0.7')
+        self.service._get_extra_routes_by_router_id = mock.Mock(
+            return_value=old)
+        self.service._update_router_gateway = mock.Mock()
+        self.service.server.supports.return_value = True
+        with mock.patch('neutron.db.l3_db.L3_NAT_dbonly_mixin.'
+                        'update_router') as update_router:
+            update_router.return_value = {'id': self.router_id,
+                                          'routes': new}
+            self.service.update_router(self.context, self.router_id,
+                                       {'router': {'routes': new}})
+
+        # neither the gateway nor the vrouter is touched, only the new
+        # route is sent
+        self.assertFalse(self.service._update_router_gateway.called)
+        self.assertFalse(self.service.server.update_router.called)
+        self.assertFalse(self.service.server.remove_router_routes.called)
+        self.service.server.add_router_routes.assert_called_once_with(
+            router_id=self.router_id, routes=[new[2]])
+
+    def test_update_router_with_routes(self):
+        old = self._routes('150.0.0.5', '150.0.0.6')
+        new = self._routes('150.0.0.5')
+        updt_router = dict(self._get_server_router_dict(), routes=new)
+        self.service._get_extra_routes_by_router_id = mock.Mock(
+            return_value=old)
+        self.service._update_router_gateway = mock.Mock(
+            return_value=updt_router)
+        self.service.server.supports.return_value = True
+        self.service.update_router(self.context, self.router_id,
+                                   {'router': {'name': self.router_name,
+                                               'routes': new}})
+
+        self.assertEqual(self.router_id,
+                         self.service.server.update_router.call_args[1]['id'])
+        self.assertNotIn('routes',
+                         self.service.server.update_router.call_args[1])
+        self.service.server.remove_router_routes.assert_called_once_with(
+            router_id=self.router_id, routes=[old[1]])
+        self.assertFalse(self.service.server.add_router_routes.called)
+
+    def test_update_routes_needs_both_methods(self):
+        routes = self._routes('150.0.0.5')
+        self.service.server.supports.side_effect = (
+            lambda method: method == 'add_router_routes')
+        self.service._update_routes(self.router_id, routes, routes)
+        self.assertFalse(self.service.server.add_router_routes.called)
+        self.assertFalse(self.service.server.remove_router_routes.called)
+
+    @mock.patch('neutron.plugins.ml2.drivers.pluribus.db.'
+                'set_router_ports_status')
     @mock.patch('neutron.plugins.ml2.plugin.Ml2Plugin')
-    def test_add_router_interface(self, mock_ml2):
+    def test_add_router_interface(self, mock_ml2, mock_set_status):
         r_intf = self._get_router_interface_dict()
 
         with mock.patch('neutron.db.l3_db.L3_NAT_db_mixin.'
@@ -216,6 +391,74 @@ class PluribusRouterTestCase(base.BaseTestCase,
                     subnet_id=self.subnet_id,
                     interface_ip=self.gateway_ip
                 )
+                mock_set_status.assert_called_once_with(
+                    self.router_id, [self.subnet_id], 'ACTIVE', self.context)
+                self.assertFalse(mock_ml2.update_port.called)
+
+    def _mock_add_router_interfaces(self, mock_ml2):
+        subnets = [self._get_subnet_info_dict(),
+                   dict(self._get_subnet_info_dict(), id='subnet-2',
+                        name='s2', cidr='160.0.0.0/24', gateway_ip=None)]
+        self.service.get_subnets = mock.Mock(return_value=subnets)
+        gateway_port = self._get_port_info_dict()
+        gateway_port['fixed_ips'] = [{'subnet_id': 'subnet-2',
+                                      'ip_address': '160.0.0.2'}]
+        mock_ml2.create_port_bulk.return_value = [gateway_port]
+        return [{'subnet_id': self.subnet_id}, {'subnet_id': 'subnet-2'}]
+
+    @mock.patch('neutron.plugins.ml2.drivers.pluribus.db.'
+                'set_router_ports_status')
+    @mock.patch('neutron.plugins.ml2.plugin.Ml2Plugin')
+    def test_add_router_interfaces(self, mock_ml2, mock_set_status):
+        with mock.patch('neutron.db.l3_db.L3_NAT_db_mixin.'
+                        'add_router_interface'):
+            with mock.patch('neutron.services.l3_router.l3_pluribus.'
+                            'PluribusRouterPlugin.core_plugin',
+                            new_callable=PropertyMock) as mock_core_plugin:
+                mock_core_plugin.return_value = mock_ml2
+                interfaces = self._mock_add_router_interfaces(mock_ml2)
+                self.service.add_router_interfaces(self.context,
+                                                   self.router_id,
+                                                   interfaces)
+
+        self.assertEqual(1, self.service.get_subnets.call_count)
+        self.assertEqual(1, mock_ml2.create_port_bulk.call_count)
+        self.service.server.plug_router_interfaces.assert_called_once_with(
+            router_id=self.router_id,
+            interfaces=[{'network_id': self.network_id,
+                         'router_id': self.router_id,
+                         'cidr': self.cidr,
+                         'subnet_id': self.subnet_id,
+                         'interface_ip': self.gateway_ip},
+                        {'network_id': self.network_id,
+                         'router_id': self.router_id,
+                         'cidr': '160.0.0.0/24',
+                         'subnet_id': 'subnet-2',
+                         'interface_ip': '160.0.0.2'}])
+        mock_set_status.assert_called_once_with(
+            self.router_id, [self.subnet_id, 'subnet-2'], 'ACTIVE',
+            self.context)
+
+    @mock.patch('neutron.plugins.ml2.plugin.Ml2Plugin')
+    def test_add_router_interfaces_rolls_back(self, mock_ml2):
+        self.service.server.plug_router_interfaces.side_effect = Exception(
+            'vrouter busy')
+        with mock.patch('neutron.db.l3_db.L3_NAT_db_mixin.'
+                        'add_router_interface'):
+            with mock.patch('neutron.db.l3_db.L3_NAT_db_mixin.'
+                            'remove_router_interface') as rem_intf:
+                with mock.patch('neutron.services.l3_router.l3_pluribus.'
+                                'PluribusRouterPlugin.core_plugin',
+                                new_callable=PropertyMock) as mock_core:
+                    mock_core.return_value = mock_ml2
+                    interfaces = self._mock_add_router_interfaces(mock_ml2)
+                    self.assertRaises(Exception,
+                                      self.service.add_router_interfaces,
+                                      self.context, self.router_id,
+                                      interfaces)
+                    self.assertEqual(2, rem_intf.call_count)
+        mock_ml2.delete_port.assert_called_once_with(self.context,
+                                                     self.port_id)
 
     def test_remove_router_interface(self):
         r_intf = self._get_router_interface_dict()
@@ -235,6 +478,74 @@ class PluribusRouterTestCase(base.BaseTestCase,
                                         subnet_id=self.subnet_id,
                                         cidr=self.cidr)
 
+    @mock.patch('neutron.plugins.ml2.plugin.Ml2Plugin')
+    def test_remove_router_interface_deletes_gateway_port(self, mock_ml2):
+        r_intf = self._get_router_interface_dict()
+        subnet = self._get_subnet_info_dict()
+        subnet['gateway_ip'] = None
+
+        with mock.patch('neutron.db.l3_db.L3_NAT_db_mixin.'
+                        'remove_router_interface'):
+            with mock.patch('neutron.services.l3_router.l3_pluribus.'
+                            'PluribusRouterPlugin.core_plugin',
+                            new_callable=PropertyMock) as mock_core_plugin:
+                mock_core_plugin.return_value = mock_ml2
+                self.service.get_ports = mock.Mock()
+                self.service.get_ports.return_value = [{'id': self.port_id}]
+                self.service.get_subnet = mock.Mock()
+                self.service.get_subnet.return_value = subnet
+                self.service.remove_router_interface(self.context,
+                                                     self.router_id,
+                                                     r_intf)
+                self.service.get_ports.assert_called_once_with(
+                    self.context,
+                    filters={'network_id': [self.network_id],
+                             'name': [self.subnet_name + self.router_id]},
+                    fields=['id'])
+                mock_ml2.delete_port.assert_called_once_with(self.context,
+                                                             self.port_id)
+
+    def test_update_port_forwards_changes(self):
+        original = self._get_port_info_dict()
+        updated = dict(original, name='p2', mac_address='fa:16:3e:00:00:02')
+        self.service.get_port = mock.Mock(return_value=original)
+        with mock.patch('neutron.db.l3_db.L3_NAT_dbonly_mixin.'
+                        'update_port') as update_port:
+            update_port.return_value = updated
+            self.service.update_port(
+                self.context, self.port_id,
+                {'port': {'name': 'p2',
+                          'mac_address': 'fa:16:3e:00:00:02'}})
+
+        self.service.server.update_port.assert_called_once_with(
+            id=self.port_id, network_id=self.network_id, name='p2',
+            mac_address='fa:16:3e:00:00:02')
+        self.assertEqual(1, self.service.port_update_stats['forwarded'])
+
+    def test_update_port_skips_redundant_updates(self):
+        port = self._get_port_info_dict()
+        self.service.get_port = mock.Mock(return_value=port)
+        with mock.patch('neutron.db.l3_db.L3_NAT_dbonly_mixin.'
+                        'update_port') as update_port:
+            update_port.return_value = port
+            # status only, the original port is not even read
+            self.service.update_port(self.context, self.port_id,
+                                     {'port': {'status': 'ACTIVE'}})
+            self.assertFalse(self.service.get_port.called)
+            self.service.update_port(self.context, self.port_id,
+                                     {'port': {'name': self.port_name}})
+
+        self.assertFalse(self.service.server.update_port.called)
+        self.assertEqual(2, self.service.port_update_stats['redundant'])
+
+    def test_report_port_updates(self):
+        self.service.port_update_stats.update(forwarded=3, redundant=5)
+        with mock.patch('neutron.services.l3_router.l3_pluribus.'
+                        'LOG') as mock_log:
+            self.service._report_port_updates()
+        self.assertEqual({'forwarded': 3, 'redundant': 5},
+                         mock_log.info.call_args[0][1])
+
     def test_create_floatingip(self):
         fip = self._get_floatingip_dict(fixed=False)
         with mock.patch('neutron.db.l3_db.L3_NAT_db_mixin.'
@@ -251,22 +562,142 @@ class PluribusRouterTestCase(base.BaseTestCase,
                 router_id=self.router_id
             )
 
+    def test_create_floatingips(self):
+        fips = [dict(self._get_floatingip_dict_server(), id='float-%d' % i)
+                for i in range(3)]
+        context = mock.MagicMock()
+        self.service.server.create_floatingips.return_value = {
+            'float-1': 'nat table full'}
+        with mock.patch('neutron.db.l3_db.L3_NAT_db_mixin.'
+                        'create_floatingip') as create_fip:
+            with mock.patch('neutron.db.l3_db.L3_NAT_db_mixin.'
+                            'delete_floatingip') as delete_fip:
+                create_fip.side_effect = fips
+                created, failed = self.service.create_floatingips(
+                    context, [{'floatingip': {}}] * 3)
+                delete_fip.assert_called_once_with(context, 'float-1')
+
+        self.assertEqual(['float-0', 'float-2'], [f['id'] for f in created])
+        self.assertEqual({'float-1': 'nat table full'}, failed)
+        self.assertEqual(1, self.service.server.create_floatingips.call_count)
+        self.assertFalse(self.service.server.create_floatingip.called)
+        # each floating IP is committed on its own
+        self.assertFalse(context.session.begin.called)
+
+    def test_create_floatingips_allocation_fails(self):
+        fip = dict(self._get_floatingip_dict_server(), id='float-0')
+        context = mock.MagicMock()
+        with mock.patch('neutron.db.l3_db.L3_NAT_db_mixin.'
+                        'create_floatingip') as create_fip:
+            with mock.patch('neutron.db.l3_db.L3_NAT_db_mixin.'
+                            'delete_floatingip') as delete_fip:
+                create_fip.side_effect = [fip, Exception('no more IPs')]
+                self.assertRaises(Exception, self.service.create_floatingips,
+                                  context, [{'floatingip': {}}] * 3)
+                delete_fip.assert_called_once_with(context, 'float-0')
+
+        self.assertFalse(self.service.server.create_floatingips.called)
+        self.assertFalse(self.service.server.create_floatingip.called)
+
+    def test_floatingip_api_creates_one_at_a_time(self):
+        # the l3 extension takes no bulk floating ip requests, the API
+        # must not hand the plugin any either
+        controller = api_base.Controller(
+            self.service, 'floatingips', 'floatingip',
+            l3.RESOURCE_ATTRIBUTE_MAP['floatingips'])
+        self.assertFalse(controller._allow_bulk)
+        self.assertFalse(controller._native_bulk)
+
     def test_delete_floatingip(self):
+        self.service._get_floatingip = mock.Mock(
+            return_value={'router_id': self.router_id})
         with mock.patch('neutron.db.l3_db.L3_NAT_db_mixin.'
                         'delete_floatingip') as float_ip:
             self.service.delete_floatingip(self.context, self.floating_id)
             self.service.server.delete_floatingip.assert_called_once_with(
-                id=self.floating_id
+                id=self.floating_id, router_id=self.router_id
             )
 
+    def test_gateway_lookups_are_cached_per_request(self):
+        self.service.get_ports = mock.Mock()
+        self.service.get_ports.return_value = [self._get_port_info_dict()]
+        self.service.get_subnet = mock.Mock()
+        self.service.get_subnet.return_value = self._get_subnet_info_dict()
+
+        self.assertTrue(self.service.router_has_external_gateway(
+            self.context, self.router_id))
+        for i in range(2):
+            self.assertEqual(self.subnet_id,
+                             self.service.get_router_external_subnet_info(
+                                 self.context, self.router_id)['id'])
+        self.assertEqual(1, self.service.get_ports.call_count)
+        self.assertEqual(1, self.service.get_subnet.call_count)
+
+        # a port write drops the cached ports, a new request starts afresh
+        self.service._invalidate_ports(self.context)
+        self.service.get_external_port_info(self.context, self.router_id)
+        self.service.get_external_port_info(FakeContext(), self.router_id)
+        self.assertEqual(3, self.service.get_ports.call_count)
+
+    def test_clearing_gateway_bypasses_cache(self):
+        self.service.topology = topology.TopologyCache(10)
+        self.service.get_ports = mock.Mock(return_value=[])
+        # an earlier request left the topology cache without the gateway
+        # port another worker has added since
+        self.service.get_external_port_info(FakeContext(), self.router_id)
+        self.service.get_ports.return_value = [self._get_port_info_dict()]
+        self.service.get_subnet = mock.Mock(
+            return_value=self._get_subnet_info_dict())
+        self.service.delete_ports_with_name = mock.Mock()
+        with mock.patch('neutron.db.l3_db.L3_NAT_dbonly_mixin.'
+                        'update_router') as update_router:
+            update_router.return_value = self._get_server_router_dict()
+            updt_router = self.service._update_router_gateway(
+                self.context, self.router_id,
+                {'router': {'external_gateway_info': None}})
+
+        self.service.delete_ports_with_name.assert_called_once_with(
+            self.context, self.network_id, self.subnet_name + self.router_id)
+        self.assertEqual(self.cidr, updt_router['external_gw_cidr'])
+        # the gateway port and its subnet were each read once
+        self.assertEqual(2, self.service.get_ports.call_count)
+        self.assertEqual(1, self.service.get_subnet.call_count)
+
+    @mock.patch('neutron.plugins.ml2.plugin.Ml2Plugin')
+    def test_setting_gateway_reads_once_per_request(self, mock_ml2):
+        self.service.get_ports = mock.Mock(
+            return_value=[self._get_port_info_dict()])
+        self.service.get_subnet = mock.Mock(
+            return_value=self._get_subnet_info_dict())
+        self.service.update_port = mock.Mock()
+        mock_ml2.create_port.return_value = self._get_port_info_dict()
+        router = dict(self._get_server_router_dict(),
+                      external_gateway_info={'network_id': self.network_id})
+        with mock.patch('neutron.db.l3_db.L3_NAT_dbonly_mixin.'
+                        'update_router') as update_router:
+            with mock.patch('neutron.services.l3_router.l3_pluribus.'
+                            'PluribusRouterPlugin.core_plugin',
+                            new_callable=PropertyMock) as mock_core_plugin:
+                mock_core_plugin.return_value = mock_ml2
+                update_router.return_value = router
+                self.service._update_router_gateway(
+                    self.context, self.router_id,
+                    {'router': {'external_gateway_info':
+                                {'network_id': self.network_id}}})
+
+        # once before the router update and once after, which dropped the
+        # cached ports; the subnet is read once
+        self.assertEqual(2, self.service.get_ports.call_count)
+        self.assertEqual(1, self.service.get_subnet.call_count)
+
     def test_update_floatingip(self):
         float_data = self._get_floatingip_dict(fixed=True)
         with mock.patch('neutron.db.l3_db.L3_NAT_db_mixin.'
                         'update_floatingip') as float_ip:
             float_ip.return_value = \
                 self._get_floatingip_dict_server(fixed=True)
-            self.service.get_ports = mock.Mock()
-            self.service.get_ports.return_value = [self._get_port_info_dict()]
+            self.service.get_port = mock.Mock()
+            self.service.get_port.return_value = self._get_port_info_dict()
             self.service.update_floatingip(
                 self.context,
                 self.floating_id,
@@ -283,5 +714,63 @@ class PluribusRouterTestCase(base.BaseTestCase,
                 router_id=self.router_id
             )
 
-    def _test_disassociate_floatingip(self):
-        pass
+    def test_floatingip_port_is_cached_across_requests(self):
+        self.service.topology = topology.TopologyCache(10)
+        self.service.get_port = mock.Mock()
+        self.service.get_port.return_value = self._get_port_info_dict()
+        fip = {'port_id': self.port_id, 'fixed_ip_address': self.ip_address}
+
+        for context in (FakeContext(), FakeContext()):
+            self.assertEqual(self.subnet_id,
+                             self.service._get_floatingip_subnet(context,
+                                                                 fip))
+        self.service.get_port.assert_called_once_with(mock.ANY,
+                                                      self.port_id)
+
+    def test_disassociate_floatingips(self):
+        context = mock.MagicMock()
+        context.session.is_active = False
+        query = context.session.query.return_value.filter_by
+        query.return_value = [{'id': 'float-1', 'router_id': 'router-1'},
+                              {'id': 'float-2', 'router_id': 'router-2'},
+                              {'id': 'float-3', 'router_id': 'router-1'}]
+        with mock.patch('neutron.db.l3_db.L3_NAT_db_mixin.'
+                        'disassociate_floatingips') as disassociate:
+            disassociate.return_value = set(['router-1', 'router-2'])
+            router_ids = self.service.disassociate_floatingips(context,
+                                                               self.port_id)
+            disassociate.assert_called_once_with(context, self.port_id, True)
+        self.assertEqual(set(['router-1', 'router-2']), router_ids)
+        # one request per router, for the switch hosting its vrouter
+        calls = self.service.server.disassociate_floatingips.call_args_list
+        self.assertEqual(
+            [mock.call(id=['float-1', 'float-3'], router_id='router-1'),
+             mock.call(id=['float-2'], router_id='router-2')],
+            sorted(calls, key=lambda c: c[1]['router_id']))
+
+    def test_disassociate_floatingips_without_any(self):
+        context = mock.MagicMock()
+        context.session.query.return_value.filter_by.return_value = []
+        self.service.disassociate_floatingips(context, self.port_id)
+        self.assertFalse(self.service.server.disassociate_floatingips.called)
+
+    @mock.patch('neutron.plugins.ml2.drivers.pluribus.db.after_commit')
+    def test_disassociate_floatingips_in_transaction(self, mock_after_commit):
+        context = mock.MagicMock()
+        context.session.is_active = True
+        query = context.session.query.return_value.filter_by
+        query.return_value = [{'id': 'float-1', 'router_id': self.router_id}]
+        with mock.patch('neutron.db.l3_db.L3_NAT_db_mixin.'
+                        'disassociate_floatingips') as disassociate:
+            disassociate.return_value = set([self.router_id])
+            self.service.disassociate_floatingips(context, self.port_id)
+
+        # nothing reaches the switch until the caller commits
+        self.assertFalse(self.service.server.disassociate_floatingips.called)
+        session, send = mock_after_commit.call_args[0]
+        self.assertEqual(context.session, session)
+        self.service.server.disassociate_floatingips.side_effect = \
+            RuntimeError
+        send()
+        self.service.server.disassociate_floatingips.assert_called_once_with(
+            id=['float-1'], router_id=self.router_id)
@@ -231,3 +231,148 @@ class PluribusLoadBalancerTestCase(base.BaseTestCase,
             type=self.type,
             id=self.healthmonitor_id,
         )
+
+    def test_update_member(self):
+        old_member = dict(self._create_member_dict(), pool_id=self.pool_id)
+        member = dict(old_member, weight=5)
+        self.service.update_member(self.context, old_member, member)
+        self.service.server.update_member.assert_called_once_with(
+            id=self.member_id,
+            pool_id=self.pool_id,
+            weight=5
+        )
+        self.assertEqual('ACTIVE',
+                         self.service.plugin.update_status.call_args[0][3])
+
+    def test_member_status_replaces_health(self):
+        self.service.member_health = mock.Mock()
+        old_member = dict(self._create_member_dict(), pool_id=self.pool_id)
+        member = dict(old_member, weight=5)
+        self.service.update_member(self.context, old_member, member)
+        self.service.create_member(self.context, member)
+        self.assertEqual(
+            [mock.call(self.member_id)] * 2,
+            self.service.member_health.forget.call_args_list)
+
+    def test_update_pool_without_switch_changes(self):
+        old_pool = self._create_pool_dict()
+        pool = dict(old_pool, description='tuned', status='PENDING_UPDATE')
+        self.service.update_pool(self.context, old_pool, pool)
+        self.assertFalse(self.service.server.update_pool.called)
+        self.assertEqual('ACTIVE',
+                         self.service.plugin.update_status.call_args[0][3])
+
+    def test_update_vip_fails(self):
+        old_vip = self._create_vip_dict()
+        vip = dict(old_vip, connection_limit=100)
+        self.service.server.update_vip.side_effect = RuntimeError
+        self.assertRaises(RuntimeError, self.service.update_vip,
+                          self.context, old_vip, vip)
+        self.assertEqual('ERROR',
+                         self.service.plugin.update_status.call_args[0][3])
+
+    def test_update_pool_health_monitor(self):
+        old_hm = self._create_health_monitor()
+        hm = dict(old_hm, delay=5, pools=[{'pool_id': self.pool_id,
+                                           'status': 'PENDING_UPDATE'}])
+        self.service.update_pool_health_monitor(self.context, old_hm, hm,
+                                                self.pool_id)
+        self.service.server.update_health.assert_called_once_with(
+            id=self.healthmonitor_id,
+            delay=5
+        )
+
+    def test_stats(self):
+        self.service.pool_stats = mock.Mock()
+        self.service.stats(self.context, self.pool_id)
+        self.service.pool_stats.get.assert_called_once_with(self.pool_id)
+
+    def _create_member_dicts(self, count):
+        return [dict(self._create_member_dict(), id='member-%d' % i,
+                     pool_id=self.pool_id) for i in range(count)]
+
+    @mock.patch('neutron.plugins.ml2.drivers.pluribus.db.update_status_bulk')
+    def test_create_members(self, mock_set_status):
+        members = self._create_member_dicts(3)
+        self.service.server.supports.return_value = True
+        self.service.server.create_members.return_value = {
+            'member-1': 'no backend', 'member-2': None}
+
+        failed = self.service.create_members(self.context, members)
+
+        self.assertEqual({'member-1': 'no backend'}, failed)
+        self.assertEqual(1, self.service.server.create_members.call_count)
+        self.assertEqual(
+            ['member-0', 'member-1', 'member-2'],
+            [m['id'] for m in
+             self.service.server.create_members.call_args[1]['members']])
+        self.assertFalse(self.service.server.create_member.called)
+        self.assertEqual(
+            [(['member-0', 'member-2'], 'ACTIVE'), (['member-1'], 'ERROR')],
+            [c[0][1:3] for c in mock_set_status.call_args_list])
+        self.assertFalse(self.service.plugin.update_status.called)
+
+    @mock.patch('neutron.plugins.ml2.drivers.pluribus.db.update_status_bulk')
+    def test_delete_members_without_bulk_call(self, mock_set_status):
+        members = self._create_member_dicts(2)
+        self.service.server.supports.return_value = False
+        self.service.server.delete_member.side_effect = [None, RuntimeError]
+
+        failed = self.service.delete_members(self.context, members)
+
+        self.assertEqual(['member-1'], list(failed))
+        self.assertEqual(2, self.service.server.delete_member.call_count)
+        mock_set_status.assert_called_once_with(
+            mock.ANY, ['member-1'], 'ERROR', self.context)
+
+    def test_create_member_with_graph(self):
+        self.service.graphs = mock.Mock()
+        member = dict(self._create_member_dict(), pool_id=self.pool_id)
+        self.service.create_member(self.context, member)
+        self.service.graphs.submit.assert_called_once_with(
+            self.pool_id, 'member', member)
+        self.assertFalse(self.service.server.create_member.called)
+
+    @mock.patch('neutron.plugins.ml2.drivers.pluribus.db.update_status_bulk')
+    def test_graph_done(self, mock_set_status):
+        changes = {('pool', self.pool_id): self._create_pool_dict(),
+                   ('member', 'member-1'): {'id': 'member-1'},
+                   ('member', 'member-2'): None,
+                   ('health', self.healthmonitor_id): {}}
+        self.service._graph_done(self.pool_id, changes, 'ACTIVE')
+
+        self.assertEqual(self.pool_id,
+                         self.service.plugin.update_status.call_args[0][2])
+        self.assertEqual(
+            (self.healthmonitor_id, self.pool_id, 'ACTIVE'),
+            self.service.plugin.update_pool_health_monitor.call_args[0][1:])
+        self.assertEqual((['member-1'], 'ACTIVE'),
+                         mock_set_status.call_args[0][1:3])
+
+    def test_load_graph(self):
+        plugin = self.service.plugin
+        plugin.get_pools.return_value = [dict(
+            self._create_pool_dict(), vip_id=self.vip_id,
+            health_monitors_status=[
+                {'monitor_id': self.healthmonitor_id, 'status': 'ACTIVE'},
+                {'monitor_id': 'hm-2', 'status': 'PENDING_DELETE'}])]
+        plugin.get_vip.return_value = dict(self._create_vip_dict(),
+                                           status='ACTIVE')
+        plugin.get_members.return_value = [
+            dict(self._create_member_dict(), status='ACTIVE'),
+            {'id': 'member-2', 'status': 'PENDING_DELETE'}]
+        plugin.get_health_monitors.return_value = [
+            self._create_health_monitor()]
+
+        loaded = self.service._load_graph(self.pool_id)
+
+        self.assertEqual([self.pool_id], list(loaded['pool']))
+        self.assertEqual([self.vip_id], list(loaded['vip']))
+        self.assertEqual([self.member_id], list(loaded['member']))
+        self.assertEqual([self.healthmonitor_id], list(loaded['health']))
+        self.assertEqual({'id': [self.healthmonitor_id]},
+                         plugin.get_health_monitors.call_args[1]['filters'])
+
+    def test_load_graph_of_deleted_pool(self):
+        self.service.plugin.get_pools.return_value = []
+        self.assertIsNone(self.service._load_graph(self.pool_id))
@@ -12,9 +12,11 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import eventlet
 import mock
 
 from neutron.services.l3_router.l3_pluribus import PluribusRouterPlugin
+from neutron.plugins.ml2.drivers.pluribus import dispatch
 from neutron.plugins.ml2.drivers.pluribus import mech_pluribus as pluribus
 from neutron.plugins.common import constants
 from neutron.tests import base
@@ -66,14 +68,19 @@ class FakePortContext(object):
 
     """To generate port context for testing purposes only."""
 
-    def __init__(self, port, network):
+    def __init__(self, port, network, original=None):
         self._port = port
         self._network_context = network
+        self._original = original
 
     @property
     def current(self):
         return self._port
 
+    @property
+    def original(self):
+        return self._original
+
     @property
     def network(self):
         return self._network_context
@@ -83,13 +90,18 @@ class FakeSubnetContext(object):
 
     """To generate subnet context for testing purposes only."""
 
-    def __init__(self, subnet):
+    def __init__(self, subnet, network=None):
         self._subnet = subnet
+        self._network_context = network
 
     @property
     def current(self):
         return self._subnet
 
+    @property
+    def network(self):
+        return self._network_context
+
 
 class PluribusDriverTestCase(base.BaseTestCase,
                              Network,
@@ -117,7 +129,7 @@ class PluribusDriverTestCase(base.BaseTestCase,
     def _set_subnet_config(self, external=False):
         self.network_context = self._get_network_context(external)
 
-        self.subnet_context = self._get_subnet_context()
+        self.subnet_context = self._get_subnet_context(self.network_context)
         self.subnet_context._plugin_context = self.subnet_context
 
         self.subnet_info = self.subnet_context.current
@@ -173,14 +185,13 @@ class PluribusDriverTestCase(base.BaseTestCase,
             tenant_id=self.net_info["tenant_id"]
         )
 
-    def test_create_subnet_on_internal_network_valid(self):
+    @mock.patch('neutron.plugins.ml2.drivers.pluribus.db.set_ports_status')
+    def test_create_subnet_on_internal_network_valid(self, mock_set_status):
         self._set_subnet_config(external=False)
         self.mock_create_port()
 
         manager.NeutronManager.get_plugin = mock.Mock()
         manager.NeutronManager.get_plugin.return_value = self.fake_ml2
-        self.fake_ml2.get_network = mock.Mock()
-        self.fake_ml2.get_network.return_value = self.net_info
 
         self.driver.create_subnet_postcommit(self.subnet_context)
 
@@ -197,6 +208,108 @@ class PluribusDriverTestCase(base.BaseTestCase,
             pn_dhcp=self.subnet_info['pn_dhcp'],
             enable_dhcp=self.subnet_info['enable_dhcp']
         )
+        mock_set_status.assert_called_once_with([self.port_id], 'ACTIVE',
+                                                self.subnet_context)
+        self.assertFalse(self.fake_ml2.get_network.called)
+        self.assertFalse(self.fake_ml2.update_port.called)
+
+    @mock.patch('neutron.plugins.ml2.drivers.pluribus.db.set_ports_status')
+    def test_create_subnet_journaled(self, mock_set_status):
+        self._set_subnet_config(external=False)
+        self.mock_create_port()
+        manager.NeutronManager.get_plugin = mock.Mock()
+        manager.NeutronManager.get_plugin.return_value = self.fake_ml2
+        self.driver.journal = mock.Mock()
+        self.driver.journal.send.return_value = False
+
+        self.driver.create_subnet_postcommit(self.subnet_context)
+
+        self.assertEqual(('create_subnet', self.subnet_info['id']),
+                         self.driver.journal.send.call_args[0][:2])
+        self.assertFalse(self.driver.server.create_subnet.called)
+        mock_set_status.assert_called_once_with([self.port_id], 'BUILD',
+                                                self.subnet_context)
+
+    @mock.patch('neutron.plugins.ml2.drivers.pluribus.db.set_network_status')
+    def test_journaled_network_is_built(self, mock_set_status):
+        self._set_network_config()
+        self.driver.journal = mock.Mock()
+
+        def send(method, resource_id, payload, journaled):
+            journaled()
+            return False
+        self.driver.journal.send.side_effect = send
+
+        self.driver.create_network_postcommit(self.network_context)
+        # end_build only takes networks out of BUILD
+        mock_set_status.assert_called_once_with(self.net_info['id'],
+                                                'BUILD')
+
+    @mock.patch('neutron.context.get_admin_context')
+    @mock.patch('neutron.plugins.ml2.drivers.pluribus.db.end_build')
+    def test_journaled_request_stays_pending(self, mock_end_build,
+                                             mock_admin_context):
+        self._set_port_config()
+        manager.NeutronManager.get_plugin = mock.Mock()
+        manager.NeutronManager.get_plugin.return_value = self.fake_ml2
+        self.fake_ml2.get_port.return_value = dict(self.port_info,
+                                                   status='BUILD')
+        self.driver.journal = mock.Mock()
+        self.driver.journal.send.return_value = False
+        self.driver.dispatcher = mock.Mock()
+        self.driver.create_port_postcommit(self.port_context)
+
+        (key, call, payload), kwargs = \
+            self.driver.dispatcher.dispatch.call_args
+        self.assertEqual('PENDING', call(**payload))
+
+        self.driver._journal_done('create_port', self.port_id, 'ACTIVE')
+        self.driver.dispatcher.record.assert_called_once_with(self.port_id,
+                                                              'ACTIVE')
+        self.fake_ml2.update_port_status.assert_called_with(
+            mock_admin_context.return_value, self.port_id, 'ACTIVE')
+
+        self.driver._journal_done('delete_port', self.port_id, 'ACTIVE')
+        self.driver.dispatcher.forget.assert_called_once_with(self.port_id)
+        self.assertEqual(2, self.fake_ml2.update_port_status.call_count)
+        self.assertFalse(mock_end_build.called)
+
+    @mock.patch('neutron.context.get_admin_context')
+    def test_port_status_only_leaves_build(self, mock_admin_context):
+        self._set_port_config()
+        manager.NeutronManager.get_plugin = mock.Mock()
+        manager.NeutronManager.get_plugin.return_value = self.fake_ml2
+        # the agent reported the port DOWN while its request was queued
+        self.fake_ml2.get_port.return_value = dict(self.port_info,
+                                                   status='DOWN')
+        set_status = self.driver._port_status_setter(self.port_id)
+
+        set_status('ACTIVE')
+        self.assertFalse(self.fake_ml2.update_port_status.called)
+
+        set_status('ERROR')
+        self.fake_ml2.update_port_status.assert_called_once_with(
+            mock_admin_context.return_value, self.port_id, 'ERROR')
+
+    @mock.patch('neutron.plugins.ml2.drivers.pluribus.db.set_ports_status')
+    def test_subnet_waits_for_network_work(self, mock_set_status):
+        self._set_subnet_config(external=False)
+        self.mock_create_port()
+        manager.NeutronManager.get_plugin = mock.Mock()
+        manager.NeutronManager.get_plugin.return_value = self.fake_ml2
+        self.driver.dispatcher = mock.Mock()
+
+        self.driver.create_subnet_postcommit(self.subnet_context)
+        self.driver.delete_subnet_postcommit(self.subnet_context)
+
+        # subnets are sent from the request, after the network's queue
+        self.assertEqual([mock.call(self.network_id)] * 2,
+                         self.driver.dispatcher.wait.call_args_list)
+        self.assertFalse(self.driver.dispatcher.dispatch.called)
+        self.assertEqual(1, self.driver.server.create_subnet.call_count)
+        self.assertEqual(1, self.driver.server.delete_subnet.call_count)
+        mock_set_status.assert_called_once_with([self.port_id], 'ACTIVE',
+                                                self.subnet_context)
 
     def test_delete_subnet_on_valid_config(self):
         self._set_subnet_config()
@@ -229,6 +342,113 @@ class PluribusDriverTestCase(base.BaseTestCase,
             network_id=self.port_info['network_id']
         )
 
+    @mock.patch('neutron.context.get_admin_context')
+    def test_create_port_async_dispatch(self, mock_admin_context):
+        self._set_port_config()
+        manager.NeutronManager.get_plugin = mock.Mock()
+        manager.NeutronManager.get_plugin.return_value = self.fake_ml2
+        self.driver.dispatcher = mock.Mock()
+        self.driver.create_port_postcommit(self.port_context)
+
+        self.assertFalse(self.driver.server.create_port.called)
+        self.fake_ml2.update_port_status.assert_called_once_with(
+            mock_admin_context.return_value, self.port_id, 'BUILD')
+        args, kwargs = self.driver.dispatcher.dispatch.call_args
+        self.assertEqual(self.network_id, args[0])
+        self.assertEqual(self.port_info, args[2])
+        self.assertEqual(self.port_id, kwargs['resource_id'])
+
+    def test_update_port_on_valid_config(self):
+        self._set_port_config()
+        self.port_context._original = dict(self.port_info,
+                                           admin_state_up=False)
+        self.driver.update_port_postcommit(self.port_context)
+        self.driver.server.update_port.assert_called_once_with(
+            id=self.port_id,
+            network_id=self.network_id,
+            admin_state_up=True)
+
+    def test_update_port_without_switch_changes(self):
+        self._set_port_config()
+        self.port_context._original = dict(self.port_info, status='DOWN')
+        self.driver.update_port_postcommit(self.port_context)
+        self.assertFalse(self.driver.server.update_port.called)
+
+    def test_update_port_coalesced(self):
+        self._set_port_config()
+        self.port_context._original = dict(self.port_info,
+                                           admin_state_up=False)
+        self.driver.port_updates = mock.Mock()
+        self.driver.update_port_postcommit(self.port_context)
+        self.assertFalse(self.driver.server.update_port.called)
+        self.driver.port_updates.submit.assert_called_once_with(
+            self.port_id, {'id': self.port_id,
+                           'network_id': self.network_id,
+                           'admin_state_up': True})
+
+    @mock.patch('neutron.context.get_admin_context')
+    def test_failed_coalesced_update_sets_error(self, mock_admin_context):
+        self._set_port_config()
+        manager.NeutronManager.get_plugin = mock.Mock()
+        manager.NeutronManager.get_plugin.return_value = self.fake_ml2
+        self.driver.server.update_port.side_effect = Exception('switch down')
+        self.driver.port_updates = dispatch.UpdateCoalescer(
+            0.01, self.driver._update_port, self.driver._port_update_failed)
+
+        self.driver.port_updates.submit(self.port_id,
+                                        {'id': self.port_id,
+                                         'network_id': self.network_id,
+                                         'admin_state_up': True})
+        eventlet.sleep(0.05)
+
+        self.fake_ml2.update_port_status.assert_called_once_with(
+            mock_admin_context.return_value, self.port_id, 'ERROR')
+
+    def test_create_port_in_batch(self):
+        self._set_port_config()
+        with self.driver.port_batch() as batch:
+            self.driver.create_port_postcommit(self.port_context)
+        self.assertFalse(self.driver.server.create_port.called)
+        self.assertEqual([self.port_info], batch.created)
+
+        self.driver.server.create_ports.return_value = {
+            self.port_id: 'no such network'}
+        failed = self.driver.create_ports(batch.created)
+        self.driver.server.create_ports.assert_called_once_with(
+            ports=[self.port_info])
+        self.assertEqual({self.port_id: 'no such network'}, failed)
+
+    def test_create_ports_request_fails(self):
+        self._set_port_config()
+        self.driver.server.create_ports.side_effect = Exception('down')
+        failed = self.driver.create_ports([self.port_info])
+        self.assertEqual({self.port_id: 'down'}, failed)
+
+    def test_create_ports_without_bulk_support(self):
+        self._set_port_config()
+        self.driver.server.supports.return_value = False
+        self.driver.server.create_port.side_effect = Exception('down')
+        failed = self.driver.create_ports([self.port_info])
+        self.assertFalse(self.driver.server.create_ports.called)
+        self.assertEqual([self.port_id], list(failed))
+
+    def test_create_ports_wait_for_network_work(self):
+        self._set_port_config()
+        self.driver.dispatcher = mock.Mock()
+        calls = mock.Mock()
+        calls.attach_mock(self.driver.dispatcher.wait, 'wait')
+        calls.attach_mock(self.driver.server.create_ports, 'create_ports')
+        self.driver.server.create_ports.return_value = {}
+        ports = [self.port_info,
+                 dict(self.port_info, id='port-2', network_id='net-2')]
+
+        self.driver.create_ports(ports)
+
+        self.assertEqual(['wait', 'wait', 'create_ports'],
+                         [name for name, args, kwargs in calls.mock_calls])
+        self.assertEqual([mock.call(self.network_id), mock.call('net-2')],
+                         self.driver.dispatcher.wait.call_args_list)
+
     def test_delete_port_on_valid_config(self):
         self._set_port_config()
         manager.NeutronManager.get_service_plugins = mock.Mock()
@@ -246,6 +466,53 @@ class PluribusDriverTestCase(base.BaseTestCase,
             network_id=self.port_info['network_id']
         )
 
+    def test_delete_network_cascade(self):
+        self._set_subnet_config()
+        self._set_port_config()
+        with self.driver.cascade(network_id=self.network_id):
+            self.driver.delete_port_postcommit(self.port_context)
+            self.driver.delete_subnet_postcommit(self.subnet_context)
+            self.driver.delete_network_postcommit(self.network_context)
+
+        self.assertEqual([mock.call.supports('delete_network_cascade'),
+                          mock.call.delete_network_cascade(
+                              id=self.network_id)],
+                         self.driver.server.method_calls)
+
+    def test_failed_cascaded_delete_is_logged(self):
+        self._set_port_config()
+        self.driver.server.delete_network_cascade.side_effect = Exception(
+            'switch down')
+        # the database delete has committed, nothing is raised
+        with self.driver.cascade(network_id=self.network_id):
+            self.driver.delete_network_postcommit(self.network_context)
+        self.assertTrue(self.driver.server.delete_network_cascade.called)
+
+    def test_tenant_cascade_waits_for_network_work(self):
+        self._set_subnet_config()
+        self.driver.dispatcher = mock.Mock()
+        with self.driver.cascade(tenant_id=self.tenant_id):
+            self.driver.delete_subnet_postcommit(self.subnet_context)
+            self.driver.delete_network_postcommit(self.network_context)
+
+        self.driver.dispatcher.wait.assert_called_once_with(self.network_id)
+        (key, call, payload), kwargs = \
+            self.driver.dispatcher.dispatch.call_args
+        self.assertEqual(self.tenant_id, key)
+
+    def test_failed_cascade_sends_held_deletes(self):
+        self._set_port_config()
+        manager.NeutronManager.get_service_plugins = mock.Mock()
+
+        def delete_network():
+            with self.driver.cascade(tenant_id=self.tenant_id):
+                self.driver.delete_port_postcommit(self.port_context)
+                raise Exception('network in use')
+
+        self.assertRaises(Exception, delete_network)
+        self.assertTrue(self.driver.server.delete_port.called)
+        self.assertFalse(self.driver.server.delete_tenant.called)
+
     def _get_network_dict(self, external):
         network = {
             "status": "ACTIVE",
@@ -285,7 +552,7 @@ class PluribusDriverTestCase(base.BaseTestCase,
         network = self._get_network_dict(external=False)
         return FakePortContext(port, network)
 
-    def _get_subnet_context(self):
+    def _get_subnet_context(self, network=None):
         subnet = {
             "name": self.subnet_name,
             "id": self.subnet_id,
@@ -297,7 +564,7 @@ class PluribusDriverTestCase(base.BaseTestCase,
             "tenant_id": self.tenant_id,
             "enable_dhcp": True,
         }
-        return FakeSubnetContext(subnet)
+        return FakeSubnetContext(subnet, network)
 
     def _get_dhcp_port_context(self):
         return _get_port_context(tenant_id, net_id, network,
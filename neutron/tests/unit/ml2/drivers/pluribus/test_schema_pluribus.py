@@ -0,0 +1,66 @@
+# COPYRIGHT 2015 Pluribus Networks Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from neutron.plugins.ml2.drivers.pluribus import schema
+from neutron.tests import base
+
+
+class SchemaTestCase(base.BaseTestCase):
+
+    """Test case for the Pluribus switch request schemas."""
+
+    def setUp(self):
+        super(SchemaTestCase, self).setUp()
+        self.addCleanup(schema._unsupported.clear)
+        self.port = {'id': 'port-1',
+                     'name': 'p1',
+                     'network_id': 'net-1',
+                     'admin_state_up': True,
+                     'fixed_ips': [],
+                     'binding:profile': {'pci_slot': '0000:01:00.1'},
+                     'extra_dhcp_opts': [],
+                     'status': 'ACTIVE'}
+
+    def test_build(self):
+        self.assertEqual({'id': 'port-1', 'name': 'p1',
+                          'network_id': 'net-1', 'admin_state_up': True,
+                          'fixed_ips': []},
+                         schema.build('create_port', self.port))
+
+    def test_build_without_schema(self):
+        fid = {'id': ['fip-1']}
+        self.assertEqual(fid, schema.build('disassociate_floatingips', fid))
+
+    def test_changes(self):
+        original = dict(self.port, name='p0', status='DOWN')
+        self.assertEqual({'id': 'port-1', 'network_id': 'net-1',
+                          'name': 'p1'},
+                         schema.changes('update_port', self.port, original))
+
+    def test_changes_outside_schema(self):
+        original = dict(self.port, status='DOWN')
+        self.assertIsNone(schema.changes('update_port', self.port, original))
+
+    def test_check_drops_fields_not_taken(self):
+        server = mock.Mock()
+        server.supports.side_effect = lambda method: method == 'create_port'
+        server.accepts.return_value = (['id', 'network_id', 'name'],
+                                       ['id', 'network_id'])
+        schema.check(server)
+        self.assertEqual({'id': 'port-1', 'network_id': 'net-1',
+                          'name': 'p1'},
+                         schema.build('create_port', self.port))
+        self.assertIn('fixed_ips', schema.build('delete_port', self.port))
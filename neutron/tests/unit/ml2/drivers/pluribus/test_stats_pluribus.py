@@ -0,0 +1,65 @@
+# COPYRIGHT 2015 Pluribus Networks Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from neutron.services.loadbalancer.drivers.pluribus import stats
+from neutron.tests import base
+
+
+class PoolStatsTestCase(base.BaseTestCase):
+
+    """Test case for the Pluribus pool statistics cache."""
+
+    def setUp(self):
+        super(PoolStatsTestCase, self).setUp()
+        self.server = mock.Mock()
+        self.server.get_pools_stats.return_value = {
+            'pool-1': self._counters(100),
+            'pool-2': self._counters(200)}
+        self.stats = stats.PoolStats(self.server, ttl=30)
+
+    def _counters(self, value):
+        return dict((key, value) for key in stats.KEYS)
+
+    def test_one_poll_serves_all_pools(self):
+        self.assertEqual(self._counters(100), self.stats.get('pool-1'))
+        self.assertEqual(self._counters(200), self.stats.get('pool-2'))
+        self.assertEqual(self._counters(100), self.stats.get('pool-1'))
+        self.assertEqual(1, self.server.get_pools_stats.call_count)
+
+    def test_expired_counters_are_polled_again(self):
+        with mock.patch.object(stats.time, 'time') as now:
+            now.return_value = 1000
+            self.stats.get('pool-1')
+            now.return_value = 1031
+            self.stats.get('pool-1')
+        self.assertEqual(2, self.server.get_pools_stats.call_count)
+
+    def test_unknown_pool(self):
+        self.assertEqual({}, self.stats.get('pool-3'))
+        self.stats.get('pool-3')
+        self.assertEqual(1, self.server.get_pools_stats.call_count)
+
+    def test_poll_failure(self):
+        self.server.get_pools_stats.side_effect = RuntimeError
+        self.assertEqual({}, self.stats.get('pool-1'))
+
+    def test_single_pool_requests(self):
+        self.server.supports.return_value = False
+        self.server.get_pool_stats.return_value = self._counters(7)
+        self.stats.get('pool-1')
+        self.assertEqual(self._counters(7), self.stats.get('pool-1'))
+        self.server.get_pool_stats.assert_called_once_with(pool_id='pool-1')
+        self.assertFalse(self.server.get_pools_stats.called)
@@ -0,0 +1,174 @@
+# COPYRIGHT 2015 Pluribus Networks Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from neutron.plugins.ml2.drivers.pluribus import sync
+from neutron.tests import base
+
+
+class SynchronizerTestCase(base.BaseTestCase):
+
+    """Test case for the Pluribus switch synchronizer."""
+
+    def setUp(self):
+        super(SynchronizerTestCase, self).setUp()
+        self.server = mock.Mock()
+        self.synchronizer = sync.Synchronizer(self.server)
+        self.summary = {'create': 0, 'update': 0, 'delete': 0, 'failed': 0}
+
+    def _port(self, port_id, name='p1', ips=None):
+        return {'id': port_id,
+                'name': name,
+                'network_id': 'net-1',
+                'fixed_ips': ips or []}
+
+    def test_diff(self):
+        ips = [{'subnet_id': 'sub-1', 'ip_address': '180.0.0.2'},
+               {'subnet_id': 'sub-2', 'ip_address': '190.0.0.2'}]
+        neutron = [self._port('port-1', ips=ips),
+                   self._port('port-2', name='p2'),
+                   self._port('port-3')]
+        switch = [self._port('port-1', ips=list(reversed(ips))),
+                  self._port('port-2'),
+                  self._port('port-4')]
+
+        creates, updates, deletes = self.synchronizer.diff('port', neutron,
+                                                           switch)
+        self.assertEqual([('create', 'port', neutron[2])], creates)
+        # the key attributes go with every update
+        self.assertEqual([('update', 'port', {'id': 'port-2',
+                                              'network_id': 'net-1',
+                                              'name': 'p2'})],
+                         updates)
+        self.assertEqual([('delete', 'port', switch[2])], deletes)
+
+    def test_ports_are_batched_in_order(self):
+        port_1, port_2 = self._port('port-1'), self._port('port-2')
+        network = {'id': 'net-1'}
+        self.server.delete_ports.return_value = {'port-2': 'busy'}
+        self.synchronizer._apply_batch([('delete', 'port', port_1),
+                                        ('delete', 'port', port_2),
+                                        ('delete', 'network', network)],
+                                       self.summary)
+
+        self.assertEqual([mock.call.supports('delete_ports'),
+                          mock.call.supports('delete_ports'),
+                          mock.call.delete_ports(ports=[port_1, port_2]),
+                          mock.call.delete_network(id='net-1')],
+                         self.server.method_calls)
+        self.assertEqual({'create': 0, 'update': 0, 'delete': 2,
+                          'failed': 1}, self.summary)
+
+    def test_failed_request_does_not_stop_sync(self):
+        self.server.create_router.side_effect = Exception('switch error')
+        self.synchronizer._apply_batch([('create', 'router', {'id': 'r-1'}),
+                                        ('create', 'vip', {'id': 'vip-1'})],
+                                       self.summary)
+        self.server.create_vip.assert_called_once_with(id='vip-1')
+        self.assertEqual(1, self.summary['create'])
+        self.assertEqual(1, self.summary['failed'])
+
+    def test_stale_router_is_deleted_by_router_id(self):
+        self.synchronizer._apply_batch([('delete', 'router', {'id': 'r-1',
+                                                              'name': 'r'})],
+                                       self.summary)
+        self.server.delete_router.assert_called_once_with(router_id='r-1')
+        self.assertEqual(1, self.summary['delete'])
+
+    def _router_port(self, router_id, subnet_id, ip, owner='interface'):
+        return {'id': 'port-%s-%s' % (router_id, subnet_id),
+                'name': '',
+                'network_id': 'net-%s' % subnet_id,
+                'device_id': router_id,
+                'device_owner': 'network:router_%s' % owner,
+                'fixed_ips': [{'subnet_id': subnet_id, 'ip_address': ip}]}
+
+    def _subnet(self, subnet_id, gateway_ip):
+        return {'id': subnet_id, 'name': 'sn-%s' % subnet_id,
+                'network_id': 'net-%s' % subnet_id,
+                'cidr': '%s/24' % gateway_ip.rsplit('.', 1)[0] + '.0',
+                'gateway_ip': gateway_ip}
+
+    def test_diff_router_state(self):
+        route = {'destination': '10.0.0.0/16', 'nexthop': '180.0.0.5'}
+        old_route = {'destination': '10.1.0.0/16', 'nexthop': '180.0.0.5'}
+        gateway = {'network_id': 'net-ext'}
+        neutron = {
+            'subnet': [self._subnet('sub-1', '180.0.0.1'),
+                       self._subnet('sub-2', '190.0.0.1'),
+                       self._subnet('ext', '200.0.0.1')],
+            'port': [self._router_port('r-1', 'sub-1', '180.0.0.1'),
+                     self._router_port('r-2', 'sub-2', '190.0.0.9'),
+                     self._router_port('r-1', 'ext', '200.0.0.5', 'gateway'),
+                     dict(self._port('port-gw', name='sn-extr-1'),
+                          network_id='net-ext')],
+            'router': [{'id': 'r-1', 'routes': [route],
+                        'external_gateway_info': gateway},
+                       {'id': 'r-2', 'routes': [route],
+                        'external_gateway_info': None}]}
+        switch_routers = [{'id': 'r-1', 'routes': [old_route],
+                           'external_gateway_info': None},
+                          {'id': 'r-3'}]
+        self.server.supports.return_value = True
+        self.server.list_router_interfaces.return_value = [
+            {'router_id': 'r-1', 'subnet_id': 'sub-3', 'network_id': 'n',
+             'cidr': '170.0.0.0/24'},
+            {'router_id': 'r-3', 'subnet_id': 'sub-1', 'network_id': 'n',
+             'cidr': '180.0.0.0/24'}]
+
+        first, last = self.synchronizer.diff_router_state(neutron,
+                                                          switch_routers)
+
+        self.assertEqual(
+            [('unplug', 'router_interface', 'r-1', 'sub-3'),
+             ('remove', 'router_routes', 'r-1', None),
+             ('unplug', 'router_interface', 'r-3', 'sub-1')],
+            [(op, res, obj['router_id'], obj.get('subnet_id'))
+             for op, res, obj in first])
+        self.assertEqual([old_route], first[1][2]['routes'])
+        self.assertEqual(
+            [('plug', 'router_interface', 'r-1'),
+             ('update', 'router', 'r-1'),
+             ('add', 'router_routes', 'r-1'),
+             ('plug', 'router_interface', 'r-2'),
+             ('add', 'router_routes', 'r-2')],
+            [(op, res, obj.get('router_id') or obj['id'])
+             for op, res, obj in last])
+        self.assertNotIn('use_specific_ip', last[0][2])
+        self.assertEqual(['port-gw'],
+                         [p['port']['id'] for p in
+                          last[1][2]['external_port']])
+        self.assertTrue(last[3][2]['use_specific_ip'])
+
+    @mock.patch.object(sync.pn_client, 'get_client')
+    @mock.patch.object(sync, 'common_config')
+    @mock.patch.object(sync, 'Synchronizer')
+    def test_main_runs_a_single_sync(self, mock_sync, mock_config,
+                                     mock_get_client):
+        def sync_once():
+            # the plugins loaded by the sync must not start another one
+            self.assertFalse(
+                sync.cfg.CONF.PLURIBUS_PLUGINS['sync_on_startup'])
+            return {'failed': 0}
+        mock_sync.return_value.sync.side_effect = sync_once
+        sync.cfg.CONF.set_override('sync_on_startup', True,
+                                   'PLURIBUS_PLUGINS')
+        try:
+            sync.main()
+        finally:
+            sync.cfg.CONF.clear_override('sync_on_startup',
+                                         'PLURIBUS_PLUGINS')
+        self.assertEqual(1, mock_sync.return_value.sync.call_count)
+
@@ -0,0 +1,79 @@
+# COPYRIGHT 2015 Pluribus Networks Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from neutron.plugins.ml2.drivers.pluribus import topology
+from neutron.tests import base
+
+
+class TopologyCacheTestCase(base.BaseTestCase):
+
+    """Test case for the Pluribus router topology cache."""
+
+    def setUp(self):
+        super(TopologyCacheTestCase, self).setUp()
+        self.cache = topology.TopologyCache(2)
+        self.load = mock.Mock(side_effect=lambda: {'id': 'port-1'})
+
+    def test_get_loads_once(self):
+        for i in range(3):
+            self.cache.get_port('port-1', self.load)
+        self.assertEqual(1, self.load.call_count)
+        self.assertEqual(2, self.cache.hits)
+
+    def test_least_recently_used_is_evicted(self):
+        self.cache.get_port('port-1', self.load)
+        self.cache.get_subnet('subnet-1', dict)
+        self.cache.get_port('port-1', self.load)
+        self.cache.get_gateway_ports('router-1', list)
+
+        # subnet-1 went, port-1 was used more recently
+        self.cache.get_port('port-1', self.load)
+        self.assertEqual(1, self.load.call_count)
+        load_subnet = mock.Mock(return_value={})
+        self.cache.get_subnet('subnet-1', load_subnet)
+        self.assertTrue(load_subnet.called)
+
+    @mock.patch('time.time')
+    def test_entries_expire(self, mock_time):
+        cache = topology.TopologyCache(2, ttl=5)
+        mock_time.return_value = 100
+        cache.get_port('port-1', self.load)
+        mock_time.return_value = 104
+        cache.get_port('port-1', self.load)
+        self.assertEqual(1, self.load.call_count)
+
+        # another worker may have changed the port since it was read
+        mock_time.return_value = 105
+        cache.get_port('port-1', self.load)
+        self.assertEqual(2, self.load.call_count)
+
+    def test_disabled(self):
+        cache = topology.TopologyCache(0)
+        cache.get_port('port-1', self.load)
+        cache.get_port('port-1', self.load)
+        self.assertEqual(2, self.load.call_count)
+
+    def test_port_event_invalidates(self):
+        self.cache.get_port('port-1', self.load)
+        self.cache.get_gateway_ports('router-1', list)
+        self.cache._on_event('port', 'after_update', None,
+                             port={'id': 'port-1', 'device_id': 'router-1'})
+
+        self.cache.get_port('port-1', self.load)
+        self.assertEqual(2, self.load.call_count)
+        load_gateway = mock.Mock(return_value=[])
+        self.cache.get_gateway_ports('router-1', load_gateway)
+        self.assertTrue(load_gateway.called)